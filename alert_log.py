@@ -0,0 +1,167 @@
+# ==============================================================================
+# alert_log.py - Per-device alert log: start-time indexes and bounded retention
+# ==============================================================================
+# Alerts are kept in creation (= seq) order - only the newest one can still
+# change - next to sorted (start time, id) indexes over all alerts and per
+# alert type, so /api/alerts filters by type and time window and pages with a
+# cursor in O(log n + k) instead of sorting the whole log on every poll.
+#
+# Retention runs on data time: closed alerts that ended more than the horizon
+# before the newest reading are evicted (the durable store's alert_events
+# table keeps every version of them) and folded into per-type totals - count,
+# excursion time, peak - so statistics still cover the whole deployment.
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+
+from history_store import to_epoch_us
+
+LOW_PEAK_TYPES = {'Low Temperature'}  # Peak = lowest reading; every other type peaks at its highest
+
+
+def iso_to_us(value):
+    """Epoch µs of an ISO 8601 timestamp with a UTC offset (as alerts store them)."""
+    return to_epoch_us(datetime.fromisoformat(value))
+
+
+def format_cursor(key):
+    return f"{key[0]}_{-key[1]}"
+
+
+def parse_cursor(value):
+    """`?cursor=` (as returned in X-Next-Cursor) -> index key; raises ValueError if malformed."""
+    start_us, alert_id = value.split('_')
+    return int(start_us), -int(alert_id)
+
+
+def _fold(totals, alert_type, excursion_s, peak):
+    if totals['count'] == 0: totals['peak_value'] = peak
+    elif alert_type in LOW_PEAK_TYPES: totals['peak_value'] = min(totals['peak_value'], peak)
+    else: totals['peak_value'] = max(totals['peak_value'], peak)
+    totals['count'] += 1
+    totals['excursion_s'] += excursion_s
+
+
+class AlertLog:
+    """A device's alerts in creation order, indexed by start time overall and per type.
+
+    Entries are the alert dicts themselves (`id`, `seq`, `start_time`,
+    `end_time`, `type`, `peak_value`), mutated in place while open. Index keys
+    are `(start_us, -id)`: ascending start, ties newest id last.
+    """
+
+    def __init__(self, alerts=()):
+        self._log = deque()  # (key, alert), creation order
+        self._index = ([], [])  # (sorted keys, alerts in key order)
+        self._by_type = {}  # type -> (sorted keys, alerts)
+        self.archived = {}  # type -> {'count', 'excursion_s', 'peak_value'} of evicted alerts
+        self.evicted = 0
+        self._evicted_seq = 0  # seq of the newest evicted alert (alerts_seq once the log is empty)
+        self._hold_until = None  # Head is closed but ended at this µs: nothing to evict before the cutoff passes it
+        for alert in alerts: self.append(alert)
+
+    def __len__(self):
+        return len(self._log)
+
+    def __iter__(self):
+        return (alert for _, alert in self._log)
+
+    def __reversed__(self):
+        return (alert for _, alert in reversed(self._log))
+
+    def append(self, alert):
+        """Adds a newly opened alert (already numbered)."""
+        key = (iso_to_us(alert['start_time']), -alert['id'])
+        self._log.append((key, alert))
+        for keys, alerts in (self._index, self._by_type.setdefault(alert['type'], ([], []))):
+            if not keys or key > keys[-1]:  # In-order start times: plain append
+                keys.append(key)
+                alerts.append(alert)
+            else:
+                i = bisect_left(keys, key)
+                keys.insert(i, key)
+                alerts.insert(i, alert)
+
+    @property
+    def seq(self):
+        """Highest alert `seq` (only the newest alert can change, so it is the last one's)."""
+        return self._log[-1][1]['seq'] if self._log else self._evicted_seq
+
+    @property
+    def open(self):
+        """The currently open alert, or None. O(1): an open alert is always the newest."""
+        if self._log and self._log[-1][1]['end_time'] is None: return self._log[-1][1]
+        return None
+
+    def since(self, seq):
+        """Alerts created or changed after reading `seq`, in log order. O(k) for k results."""
+        changed = []
+        for _, alert in reversed(self._log):
+            if alert['seq'] <= seq: break
+            changed.append(alert)
+        changed.reverse()
+        return changed
+
+    def page(self, alert_type=None, from_us=None, to_us=None, cursor=None, limit=None):
+        """Alerts starting within [from_us, to_us], newest start first, in O(log n + k).
+
+        `cursor` is a key from a previous page: only alerts after it (in that
+        order) are returned. Returns `(alerts, next_key)`; `next_key` is None
+        on the last page.
+        """
+        keys, alerts = self._index if alert_type is None else self._by_type.get(alert_type, ([], []))
+        lo = 0 if from_us is None else bisect_left(keys, (from_us, -float('inf')))
+        hi = len(keys) if to_us is None else bisect_right(keys, (to_us, float('inf')))
+        if cursor is not None: hi = min(hi, bisect_left(keys, cursor))
+        first = lo if limit is None else max(lo, hi - limit)
+        found = alerts[first:hi]
+        found.reverse()
+        return found, (keys[first] if first > lo else None)
+
+    def expire(self, cutoff_us):
+        """Evicts closed alerts that ended before `cutoff_us`, oldest first, into `archived`."""
+        if self._hold_until is not None and cutoff_us <= self._hold_until: return
+        log = self._log
+        while log and log[0][0][0] < cutoff_us:
+            key, alert = log[0]
+            if alert['end_time'] is None: break
+            end_us = iso_to_us(alert['end_time'])
+            if end_us >= cutoff_us:
+                self._hold_until = end_us
+                return
+            log.popleft()
+            for keys, alerts in (self._index, self._by_type[alert['type']]):
+                i = bisect_left(keys, key)
+                del keys[i], alerts[i]
+            totals = self.archived.setdefault(alert['type'], {'count': 0, 'excursion_s': 0.0, 'peak_value': None})
+            _fold(totals, alert['type'], max(0, end_us - key[0]) / 1e6, alert['peak_value'])
+            self.evicted += 1
+            self._evicted_seq = alert['seq']
+        self._hold_until = None
+
+    def stats(self):
+        """Per-type totals over the whole log, archived alerts included.
+
+        `{type: {'count', 'open', 'archived', 'excursion_s', 'peak_value'}}`;
+        excursion time counts closed alerts only. O(retained alerts).
+        """
+        totals = {t: dict(a, open=0, archived=a['count']) for t, a in self.archived.items()}
+        for key, alert in self._log:
+            t = totals.setdefault(alert['type'], {'count': 0, 'open': 0, 'archived': 0, 'excursion_s': 0.0, 'peak_value': None})
+            if alert['end_time'] is None:
+                _fold(t, alert['type'], 0.0, alert['peak_value'])
+                t['open'] += 1
+            else:
+                _fold(t, alert['type'], max(0, iso_to_us(alert['end_time']) - key[0]) / 1e6, alert['peak_value'])
+        for t in totals.values(): t['excursion_s'] = round(t['excursion_s'], 3)
+        return totals
+
+    def __getstate__(self):  # Snapshots: the log and totals; indexes are rebuilt on restore
+        return {'log': [alert for _, alert in self._log], 'archived': self.archived,
+                'evicted': self.evicted, 'evicted_seq': self._evicted_seq}
+
+    def __setstate__(self, snap):
+        self.__init__(snap['log'])
+        self.archived = snap['archived']
+        self.evicted = snap['evicted']
+        self._evicted_seq = snap['evicted_seq']
@@ -2,15 +2,38 @@
 # app.py - Enhanced Flask Backend for Intelligent Cold Chain Monitor
 # ==============================================================================
 # --- Imports ---
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-import joblib
-import pandas as pd
 import numpy as np
 import os
+import math
 import traceback
+import uuid
+import atexit
+import functools
+import io
+import threading
+import time
 from datetime import datetime
 import pytz  # For timezone handling
+from kpi_engine import StreamingKPIs
+from history_store import HistoryRing, to_epoch_us, from_epoch_us, format_timestamps
+from batch_ingest import (parse_device_timestamp, q10_rsl, classify_status, apply_alert_runs, forward_fill,
+                          STATUS_NORMAL)
+from device_state import DeviceState, DeviceRegistry, DEFAULT_DEVICE_ID, normalize_device_id
+from alert_log import format_cursor, parse_cursor
+from broadcaster import Broadcaster
+from persistence import DurableStore, snapshot_state, restore_state
+from state_backend import LocalBackend, SQLiteBackend
+from rollups import RollupPyramid, to_json as rollups_to_json
+from fleet_rollups import FleetRollups
+from downsample import lttb, minmax
+from model_service import LazyModel, MicroBatcher, rolling_features
+from metrics import Registry, Stopwatch, RequestTimer, SamplingProfiler, resident_memory_bytes
+from ingest_queue import IngestQueue, QueueFull
+from geo import TrackStore, GeofenceIndex, SIMPLIFIERS, load_geofences, parse_geofences, zone_transitions
+from wire_format import (FRAME_CONTENT_TYPE, MSGPACK_CONTENT_TYPES, FrameError, decode_frame, frame_columns,
+                         frame_reading, decode_msgpack, negotiate_encoding, compress, MIN_COMPRESS_BYTES)
 
 # --- Configuration Constants ---
 PRODUCT_OPTIMAL_TEMP = 8.0  # Optimal cold chain temperature (8°C)
@@ -20,223 +43,1150 @@ CRITICAL_TEMP = 12.0  # Anything above 12°C is critical for cold chain
 ALERT_TEMP_HIGH = 15.0  # High temperature alert (was 25°C)
 ALERT_TEMP_LOW = 3.0  # Low temperature alert (was 15°C, now for freezing risk)
 WINDOW_SIZE_HOURS = 6
-HISTORY_MAX_LEN = 200 # ** Increased history size for demo **
+HISTORY_MAX_LEN = int(os.environ.get('HISTORY_MAX_LEN', 200)) # Columnar store: can be raised to millions per shipment
 TIMEZONE = 'Asia/Kathmandu'  # Nepal timezone (UTC+5:45)
+LOCAL_TZ = pytz.timezone(TIMEZONE) # Resolved once at startup, not per request
+SNAPSHOT_EVERY = int(os.environ.get('COLDCHAIN_SNAPSHOT_EVERY', 10_000)) # Readings per device between durable snapshots
+REPLAY_CHUNK = 100_000 # Readings per vectorised pass when replaying the log (startup, other workers' readings)
+MAX_CHART_POINTS = 10_000 # Upper bound for /api/history?points=
+DOWNSAMPLE_OVERSCAN = 4 # Downsample from the finest source with at most points x this many rows
+ASYNC_INGEST = os.environ.get('COLDCHAIN_ASYNC_INGEST') == '1' # 202 + queue for every /api/data (else per request: Prefer: respond-async)
+INGEST_QUEUE_SIZE = int(os.environ.get('COLDCHAIN_INGEST_QUEUE_SIZE', 10_000)) # Readings; beyond this /api/data answers 429
+INGEST_QUEUE_BATCH = 1_000 # Max readings the queue worker drains per pass
+TRACK_MAX_POINTS = int(os.environ.get('COLDCHAIN_TRACK_MAX_POINTS', 100_000)) # GPS fixes kept per device (position changes only)
+TRACK_TOLERANCE_M = 10.0 # Default /api/track simplification tolerance
+GEOFENCE_LOG_MAX = int(os.environ.get('COLDCHAIN_GEOFENCE_LOG_MAX', 10_000)) # Enter/exit events kept per device (oldest dropped)
+GEOFENCES_PATH = os.environ.get('COLDCHAIN_GEOFENCES') # JSON file of zones loaded at startup (also settable via PUT /api/geofences)
+SUMMARY_RETENTION = {'1m': int(float(os.environ.get('COLDCHAIN_SUMMARY_1M_HOURS', 6)) * 3600), # Fleet rollup tables, kept independently of history
+                     '1h': int(float(os.environ.get('COLDCHAIN_SUMMARY_1H_DAYS', 30)) * 86400)}
+FLEET_TOP_K_MAX = 1_000
+ALERT_RETENTION_US = int(float(os.environ.get('COLDCHAIN_ALERT_RETENTION_DAYS', 30)) * 86400e6) # Closed alerts kept in memory (data time); 0 = all
+MAX_ALERTS_PAGE = 10_000 # Upper bound for /api/alerts?limit=
+STATE_BACKEND = os.environ.get('COLDCHAIN_STATE_BACKEND', 'local') # 'sqlite': worker processes share state through COLDCHAIN_DB_PATH
+SYNC_INTERVAL = float(os.environ.get('COLDCHAIN_SYNC_INTERVAL', 0.25)) # Seconds between pulls of other workers' readings (shared backend)
 # --- ---
 
 # --- Load Model ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
 model_filename = 'rsl_predictor_model.joblib'
 model_path = os.path.join(script_dir, model_filename)
-model = None
-try: # Simplified load
-    if os.path.exists(model_path): model = joblib.load(model_path); print("✅ ML Model loaded.")
-    else: print(f"⚠️ Error: Model file not found: {model_path}")
-except Exception as e: print(f"❌ Error loading model: {e}"); traceback.print_exc()
+# Loaded on first use (it only serves the Q10 fallback); COLDCHAIN_MODEL_MMAP=r memory-maps its arrays
+rsl_model = LazyModel(model_path, mmap_mode=os.environ.get('COLDCHAIN_MODEL_MMAP') or None)
+inference = MicroBatcher(rsl_model, max_batch=64, max_wait=0.002) # Concurrent predictions share one model.predict
+if os.environ.get('COLDCHAIN_MODEL_PRELOAD') == '1': rsl_model.preload() # Load + warm up in the background
 # --- ---
 
 app = Flask(__name__)
-CORS(app)
-
-# --- In-Memory Storage ---
-latest_data = { "status": "UNKNOWN" } # Will be populated fully on first data receipt
-# Store more history for charts/KPIs
-history = [] # Stores {'timestamp': str, 'hours': float, 'temperature': float, 'humidity': float, 'rsl': float or None}
-alert_log = [] # Stores {'start_time': str, 'end_time': str or None, 'type': str, 'peak_value': float}
-current_alert_info = None # Tracks the currently active alert
+# Delta-polling headers must be readable cross-origin; cache preflights for If-None-Match
+CORS(app, expose_headers=['ETag', 'X-Boot-Id', 'X-History-First-Seq', 'X-History-Last-Seq', 'X-Alerts-Last-Seq',
+                          'X-Downsample', 'X-Next-Cursor'], max_age=600)
+BOOT_ID = uuid.uuid4().hex[:8] # Prefixes ETags so they never survive a restart
+
+# --- In-Memory Storage (partitioned per device / shipment) ---
+def _new_device_state(device_id):
+    return DeviceState(
+        device_id,
+        HistoryRing(HISTORY_MAX_LEN, hours_dtype=np.asarray(SENSOR_INTERVAL_HOURS).dtype), # Columns: timestamp_us, hours, temperature, humidity, rsl (NaN = None)
+        StreamingKPIs(CRITICAL_TEMP, ALERT_TEMP_LOW, ALERT_TEMP_HIGH, SENSOR_INTERVAL_HOURS), # Running KPIs over its history
+        RollupPyramid(), # 1 min / 10 min / 1 h buckets for zoomed-out charts
+        TrackStore(TRACK_MAX_POINTS), # GPS route for the map
+        fleet_tables.row(device_id), # Its column in the fleet-wide 1 min / 1 h tables
+        GEOFENCE_LOG_MAX)
+
+fleet_tables = FleetRollups(SUMMARY_RETENTION) # Behind /api/fleet/summary
+devices = DeviceRegistry(_new_device_state) # device_id -> DeviceState, each with its own lock
+backend = LocalBackend() # Replaced by a shared backend under Durable Storage when COLDCHAIN_STATE_BACKEND is set
+events = Broadcaster(capacity=4096) # Live push to /api/stream subscribers
+try: geofences = GeofenceIndex(load_geofences(GEOFENCES_PATH)) # Grid index: per-reading enter/exit checks
+except (OSError, ValueError) as e:
+    print(f"❌ Error loading geofences from {GEOFENCES_PATH}: {e}")
+    geofences = GeofenceIndex()
+# --- ---
+
+# --- Metrics (/api/metrics, Prometheus text format) ---
+metrics = Registry()
+metrics.enabled = os.environ.get('COLDCHAIN_METRICS', '1') != '0'
+INGEST_STAGE_SECONDS = metrics.histogram('coldchain_ingest_stage_seconds', "Time per ingest pipeline stage",
+                                         ['path', 'stage'])
+REQUEST_SECONDS = metrics.histogram('coldchain_http_request_duration_seconds', # _count = requests per status
+                                    "Request latency per endpoint", ['endpoint', 'method', 'status'])
+app.wsgi_app = RequestTimer(app.wsgi_app, REQUEST_SECONDS)
+READINGS_INGESTED = metrics.counter('coldchain_readings_ingested_total', "Readings ingested", ['path'])
+ALERTS_OPENED = metrics.counter('coldchain_alerts_opened_total', "Alerts opened")
+PREDICTION_FALLBACKS = metrics.counter('coldchain_prediction_fallbacks_total',
+                                       "Q10 RSL failures, by what served the prediction instead", ['to'])
+INGEST_ERRORS = metrics.counter('coldchain_ingest_errors_total', "Ingest requests that failed with a 500", ['endpoint'])
+INGEST_QUEUE_WAIT = metrics.histogram('coldchain_ingest_queue_wait_seconds', "Time readings spent in the ingest queue")
+INGEST_QUEUE_REJECTED = metrics.counter('coldchain_ingest_queue_rejected_total', "Readings refused with 429 (queue full)")
+metrics.gauge('coldchain_ingest_queue_depth', "Readings waiting in the ingest queue", lambda: ingest_queue.depth())
+metrics.gauge('coldchain_ingest_queue_capacity', "Ingest queue capacity", lambda: ingest_queue.capacity)
+metrics.gauge('coldchain_devices', "Known devices", lambda: len(devices.states()))
+metrics.gauge('coldchain_history_readings', "Readings held in history, all devices",
+              lambda: sum(len(s.history) for s in devices.states()))
+metrics.gauge('coldchain_alert_log_entries', "Alert log entries, all devices",
+              lambda: sum(len(s.alert_log) for s in devices.states()))
+GEOFENCE_EVENTS = metrics.counter('coldchain_geofence_events_total', "Geofence enter/exit events", ['type'])
+metrics.gauge('coldchain_geofences', "Configured geofences", lambda: len(geofences))
+SHARED_REPLAYED = metrics.counter('coldchain_shared_readings_replayed_total', "Readings other workers logged, replayed here")
+metrics.gauge('coldchain_stream_subscribers', "Connected /api/stream clients", lambda: events.subscribers)
+metrics.gauge('coldchain_process_resident_memory_bytes', "Resident memory of this process", resident_memory_bytes)
+profiler = SamplingProfiler() # Opt-in: COLDCHAIN_PROFILER=1 enables /api/debug/profile
 # --- ---
 
+# === Ingest Pipeline (caller holds state.lock) ===
+
+def _ingest_reading(state, temp_py, hum_py, lat_py, lng_py, now_local, timer=None):
+    """Updates history, predicts, calculates KPIs and logs alerts for one reading."""
+    standalone = timer is None # Else the caller's stopwatch also times parse/persist/publish
+    if standalone: timer = Stopwatch(INGEST_STAGE_SECONDS, 'single')
+    history, kpi_engine = state.history, state.kpi_engine
+    timestamp_iso = now_local.isoformat()
+
+    # 2. --- Update History ---
+    current_hours = len(history) * SENSOR_INTERVAL_HOURS
+    # RSL will be added after prediction
+    evicted_temp = history.append(to_epoch_us(now_local), current_hours, temp_py, hum_py) # O(1), evicts oldest when full
+    seq = history.last_seq # Monotonic per-device reading number (also versions the alerts it touches)
+    kpi_engine.push(temp_py)
+    if evicted_temp is not None: kpi_engine.evict(evicted_temp)
+    timer.lap('history')
+
+    # 3. --- Predict RSL (if possible) ---
+    predicted_rsl_py = None
+    
+    # Calculate RSL based on Q10 degradation model for cold chain (5-15°C range)
+    if len(kpi_engine) > 0:
+        try:
+            # Use Q10 degradation model: For every 10°C above optimal, shelf life halves
+            temp_diff = temp_py - PRODUCT_OPTIMAL_TEMP
+            degradation_factor = PRODUCT_Q10 ** (temp_diff / 10.0)
+            
+            # Base shelf life at optimal temperature
+            base_shelf_life = 20.0  # days
+            
+            # Calculate remaining shelf life
+            predicted_rsl_py = base_shelf_life / degradation_factor
+            
+            # Adjust based on time already spent at various temperatures
+            avg_temp = float(kpi_engine.mean())
+            avg_temp_diff = avg_temp - PRODUCT_OPTIMAL_TEMP
+            avg_degradation = PRODUCT_Q10 ** (avg_temp_diff / 10.0)
+            time_elapsed_days = current_hours / 24.0
+            shelf_life_consumed = time_elapsed_days * avg_degradation
+            
+            # Final RSL = base - consumed
+            predicted_rsl_py = max(0.1, base_shelf_life - shelf_life_consumed)
+            
+            # Clamp to reasonable range (0.1 to 30 days)
+            predicted_rsl_py = float(max(0.1, min(30.0, predicted_rsl_py)))
+            
+            # Update RSL in the *last* history entry
+            history.set_last('rsl', round(predicted_rsl_py, 2))
+            
+        except Exception as pred_e: 
+            print(f"❌ Prediction Error: {pred_e}")
+            traceback.print_exc()
+            PREDICTION_FALLBACKS.inc('model')
+            # Fallback to model prediction if Q10 fails
+            if rsl_model.error is None: # Loaded on first use
+                try:
+                    # Rolling 6h window from the ring buffer tail, time above critical from the KPI counters
+                    avg_6h, max_6h, min_6h, time_above_critical = rolling_features(history, kpi_engine, WINDOW_SIZE_HOURS)
+                    features = [temp_py, hum_py, avg_6h, max_6h, min_6h, time_above_critical, float(current_hours)]
+                    predicted_rsl_np = inference.predict(features) # Shares a model.predict call with concurrent requests
+                    predicted_rsl_py = float(max(0.1, predicted_rsl_np))
+                    history.set_last('rsl', round(predicted_rsl_py, 2))
+                except Exception as model_e:
+                    print(f"❌ Model Prediction also failed: {model_e}")
+                    PREDICTION_FALLBACKS.inc('default')
+                    predicted_rsl_py = 15.0  # Safe fallback
+    timer.lap('predict')
+
+    state.rollups.add(history.last('timestamp_us'), temp_py, hum_py, history.last('rsl'))
+    if evicted_temp is not None: state.rollups.trim_before(history.column('timestamp_us')[0])
+    timer.lap('rollups')
+
+    _track_positions(state, [history.last('timestamp_us')], [timestamp_iso], [seq], [lat_py], [lng_py])
+    timer.lap('geo')
+
+    # 4. --- Determine Status & Log Alerts ---
+    current_status = "NORMAL"
+    alert_type = None
+    if temp_py > ALERT_TEMP_HIGH:
+        current_status = "ALERT"
+        alert_type = "High Temperature"
+    elif temp_py < ALERT_TEMP_LOW:
+        current_status = "ALERT"
+        alert_type = "Low Temperature"
+
+    # Update Alert Log
+    current_alert_info = state.current_alert_info
+    alerts_before = state.alerts_created
+    if current_status == "ALERT":
+        if current_alert_info is None: # New alert starts
+            current_alert_info = {'start_time': timestamp_iso, 'end_time': None, 'type': alert_type, 'peak_value': temp_py, 'seq': seq}
+            state.add_alerts([current_alert_info])
+        else: # Alert continues
+            # Update peak value if current temp is more extreme
+            if (alert_type == "High Temperature" and temp_py > current_alert_info['peak_value']) or \
+               (alert_type == "Low Temperature" and temp_py < current_alert_info['peak_value']):
+                current_alert_info['peak_value'] = temp_py
+                current_alert_info['seq'] = seq
+            # If alert type changes mid-alert (e.g., high then low), end previous, start new
+            if current_alert_info['type'] != alert_type:
+                 current_alert_info['end_time'] = timestamp_iso # End previous
+                 current_alert_info = {'start_time': timestamp_iso, 'end_time': None, 'type': alert_type, 'peak_value': temp_py, 'seq': seq}
+                 state.add_alerts([current_alert_info])
+
+    elif current_status == "NORMAL" and current_alert_info is not None: # Alert ends
+        current_alert_info['end_time'] = timestamp_iso
+        current_alert_info['seq'] = seq
+        current_alert_info = None # Reset current alert tracking
+    state.current_alert_info = current_alert_info
+    if ALERT_RETENTION_US: state.alert_log.expire(history.last('timestamp_us') - ALERT_RETENTION_US)
+    timer.lap('alerts')
+
+    # Fleet rollup tables (need the status and any alert just opened)
+    state.summary.add(history.last('timestamp_us'), temp_py, hum_py, history.last('rsl'),
+                      current_status == "ALERT", state.alerts_created - alerts_before)
+    timer.lap('fleet')
+
+    # 5. --- Calculate KPIs ---
+    kpis = kpi_engine.as_dict(current_hours, history.column('temperature')) # O(1): maintained incrementally as readings enter/leave history
+
+
+    # 6. --- Update latest_data Store ---
+    state.latest_data = {
+        "timestamp": timestamp_iso,
+        "temperature": temp_py,
+        "humidity": hum_py,
+        "lat": lat_py,
+        "lng": lng_py,
+        "predicted_rsl_days": round(predicted_rsl_py, 2) if predicted_rsl_py is not None else None,
+        "status": current_status,
+        **kpis # Merge KPIs into the latest data
+    }
+    timer.lap('kpis')
+    if standalone: timer.stop()
+    return state.latest_data
+
+
+def _ingest_batch(state, temps, hums, stamps_us, lats, lngs, local_tz, timer=None):
+    """Vectorised `_ingest_reading` over a whole batch (lats/lngs resolved per reading); returns the new alerts."""
+    standalone = timer is None
+    if standalone: timer = Stopwatch(INGEST_STAGE_SECONDS, 'batch')
+    history, kpi_engine = state.history, state.kpi_engine
+    stamps_iso = format_timestamps(stamps_us, local_tz)
+    n = len(temps)
+
+    # 2. --- Update History + KPI window (vectorised) ---
+    hours = np.minimum(len(history) + np.arange(n), HISTORY_MAX_LEN) * SENSOR_INTERVAL_HOURS
+    seqs = history.last_seq + 1 + np.arange(n)
+    evicted = history.append_many(stamps_us, hours, temps, hums)
+    window_means = kpi_engine.push_many(temps, evicted)
+    timer.lap('history')
+
+    # 3. --- Predict RSL for every reading (Q10 model) ---
+    rsl = q10_rsl(temps, window_means, hours, PRODUCT_OPTIMAL_TEMP, PRODUCT_Q10)
+    history.set_tail('rsl', np.round(rsl, 2))
+    timer.lap('predict')
+    state.rollups.add_many(stamps_us, temps, hums, np.round(rsl, 2))
+    if not np.isnan(evicted).all(): state.rollups.trim_before(history.column('timestamp_us')[0])
+    timer.lap('rollups')
+    _track_positions(state, stamps_us, stamps_iso, seqs, lats, lngs)
+    timer.lap('geo')
+
+    # 4. --- Determine Status & Log Alerts ---
+    codes = classify_status(temps, ALERT_TEMP_HIGH, ALERT_TEMP_LOW)
+    new_alerts, state.current_alert_info, opened_at = apply_alert_runs(codes, temps, stamps_iso, seqs,
+                                                                       state.current_alert_info)
+    state.add_alerts(new_alerts)
+    if ALERT_RETENTION_US: state.alert_log.expire(int(stamps_us[-1]) - ALERT_RETENTION_US)
+    timer.lap('alerts')
+
+    # Fleet rollup tables (need the statuses and the alerts just opened)
+    opened = np.zeros(n, dtype=np.int64)
+    opened[opened_at] = 1  # The reading that opened each alert (its 'seq' moves on with the peak / end)
+    state.summary.add_many(stamps_us, temps, hums, np.round(rsl, 2), codes != STATUS_NORMAL, opened)
+    timer.lap('fleet')
+
+    # 5./6. --- KPIs & latest_data reflect the last reading ---
+    kpis = kpi_engine.as_dict(hours[-1], history.column('temperature'))
+    state.latest_data = {
+        "timestamp": stamps_iso[-1],
+        "temperature": float(temps[-1]),
+        "humidity": float(hums[-1]),
+        "lat": lats[-1],
+        "lng": lngs[-1],
+        "predicted_rsl_days": round(float(rsl[-1]), 2),
+        "status": "NORMAL" if codes[-1] == STATUS_NORMAL else "ALERT",
+        **kpis
+    }
+    timer.lap('kpis')
+    if standalone: timer.stop()
+    return new_alerts
+
+
+def _track_positions(state, stamps_us, stamps_iso, seqs, lats, lngs):
+    """Adds position changes to the device's track and logs geofence enter/exit events (caller holds state.lock)."""
+    picked = state.track.append_many(stamps_us, seqs, lats, lngs)
+    if len(picked) == 0 or not (len(geofences) or state.geofences_inside): return
+    lats, lngs = np.asarray(lats, dtype=np.float64)[picked], np.asarray(lngs, dtype=np.float64)[picked]
+    _zone_events(state, lats, lngs, np.asarray(seqs)[picked], [stamps_iso[i] for i in picked.tolist()])
+
+
+def _zone_events(state, lats, lngs, seqs, stamps_iso):
+    """Logs the geofence enter/exit events of consecutive fixes (caller holds state.lock); returns them."""
+    located = geofences.locate_many(lats, lngs) # Grid cell -> candidate zones -> exact test
+    new_events = []
+    for k, kind, zone_id, name in zone_transitions(state.geofences_inside, located, geofences):
+        new_events.append({'seq': int(seqs[k]), 'timestamp': stamps_iso[k], 'type': kind, 'zone': zone_id,
+                           'name': name, 'lat': float(lats[k]), 'lng': float(lngs[k])})
+        GEOFENCE_EVENTS.inc(kind)
+    state.add_geofence_events(new_events)
+    return new_events
+
+
+def _recheck_geofences():
+    """Re-locates every device's last fix after the zones changed, so a parked device logs enter/exit now.
+
+    Events are stamped with the device's latest reading (seq and timestamp)
+    rather than waiting for it to move.
+    """
+    for state in devices.states():
+        with state.lock:
+            position = state.track.last_position()
+            if position is None: continue
+            history = state.history
+            new_events = _zone_events(state, [position[0]], [position[1]], [history.last_seq],
+                                      [state.latest_data.get('timestamp')])
+        for event in new_events:
+            events.publish('geofence', {'device_id': state.device_id, 'event': dict(event)}, state.device_id)
+
+
+def _publish_changes(state, prev_status, prev_alert_seq, batch_size=1):
+    """Pushes what an ingest changed to stream subscribers (caller holds state.lock).
+
+    One compact event per reading (or per batch - clients then fetch the
+    history delta), plus alert and status transitions. Publishing is an O(1)
+    append to the broadcaster's ring; it never waits on subscribers.
+    """
+    history, latest = state.history, state.latest_data
+    if batch_size == 1:
+        rsl = history.last('rsl')
+        reading = {'seq': history.last_seq, 'timestamp': latest['timestamp'], 'hours': history.last('hours'),
+                   'temperature': latest['temperature'], 'humidity': latest['humidity'],
+                   'rsl': None if math.isnan(rsl) else rsl}
+        events.publish('reading', {'device_id': state.device_id, 'reading': reading, 'latest': latest}, state.device_id)
+    else:
+        events.publish('batch', {'device_id': state.device_id, 'count': batch_size,
+                                 'last_seq': history.last_seq, 'latest': latest}, state.device_id)
+    for alert in state.alerts_since(prev_alert_seq):
+        events.publish('alert', {'device_id': state.device_id, 'alert': dict(alert)}, state.device_id)
+    for event in state.geofence_events_since(history.last_seq - batch_size):
+        events.publish('geofence', {'device_id': state.device_id, 'event': dict(event)}, state.device_id)
+    if latest.get('status') != prev_status:
+        events.publish('status', {'device_id': state.device_id, 'status': latest.get('status'),
+                                  'previous': prev_status}, state.device_id)
+
+
+def _request_payload(silent=False):
+    """The request body as the JSON API's object, decoded per Content-Type; returns (data, error response).
+
+    JSON and MessagePack carry the same objects; a binary frame (wire_format)
+    must hold exactly one reading here - /api/data/batch takes many.
+    """
+    mimetype = request.mimetype
+    if mimetype == FRAME_CONTENT_TYPE:
+        try: device_id, records = decode_frame(request.get_data())
+        except FrameError as e: return None, (jsonify({"error": str(e)}), 400)
+        if len(records) != 1: return None, (jsonify({"error": "Frame must hold exactly one reading (use /api/data/batch)"}), 400)
+        data = frame_reading(records)
+        if device_id is not None: data['device_id'] = device_id
+        return data, None
+    if mimetype in MSGPACK_CONTENT_TYPES:
+        try: return decode_msgpack(request.get_data()), None
+        except RuntimeError as e: return None, (jsonify({"error": str(e)}), 415)
+        except ValueError as e: return None, (jsonify({"error": str(e)}), 400)
+    return request.get_json(silent=silent), None
+
+def _device_from_request(data=None):
+    """Device id from the JSON body or `?device=` query param (default partition if absent)."""
+    value = data.get('device_id') if isinstance(data, dict) else None
+    return normalize_device_id(value if value is not None else request.args.get('device'))
+
+
+def _persist(state, stamps_us, temps, hums, lats, lngs, prev_alert_seq):
+    """Queues what an ingest changed for the durable log (caller holds state.lock).
+
+    Only enqueues: the writer thread group-commits in the background, so the
+    request never waits on disk. Every SNAPSHOT_EVERY readings the device's
+    full state is snapshotted so recovery only replays the log tail.
+    """
+    if store is None: return
+    history = state.history
+    if not backend.shared: # A shared backend already logged the readings in _claim
+        store.append_readings(state.device_id, history.last_seq - len(temps) + 1, stamps_us, temps, hums, lats, lngs)
+    store.append_alert_events(state.device_id, [dict(a) for a in state.alerts_since(prev_alert_seq)])
+    if history.last_seq - state.snapshot_seq >= store.snapshot_every:
+        store.save_snapshot(state.device_id, snapshot_state(state))
+        state.snapshot_seq = history.last_seq
+
+
+# --- Shared state (several worker processes, one reading log per device) ---
+def _replay(state, tail, local_tz):
+    """Runs logged readings through the batch pipeline, REPLAY_CHUNK at a time (caller holds state.lock)."""
+    seqs, stamps_us, temps, hums, lats, lngs = tail
+    for i in range(0, len(temps), REPLAY_CHUNK):
+        j = min(i + REPLAY_CHUNK, len(temps))
+        _ingest_batch(state, temps[i:j], hums[i:j], stamps_us[i:j], lats[i:j], lngs[i:j], local_tz)
+
+def _apply_tail(state, tail, local_tz):
+    """Applies readings other workers logged for this device and pushes them to this worker's streams."""
+    if state.history.last_seq + 1 != tail[0][0]: raise RuntimeError(f"{state.device_id}: gap before shared seq {tail[0][0]}")
+    prev_status, prev_alert_seq = state.latest_data.get('status'), state.alerts_seq
+    _replay(state, tail, local_tz)
+    n = len(tail[0])
+    state.snapshot_seq += n # Their appender snapshots them
+    _publish_changes(state, prev_status, prev_alert_seq, batch_size=n)
+    SHARED_REPLAYED.inc(amount=n)
+
+def _claim(state, stamps_us, temps, hums, lat_keys, lng_keys, local_tz):
+    """Logs readings in the state backend and returns their lat/lng (carried forward) (caller holds state.lock).
+
+    With a shared backend this claims the device's next seqs atomically;
+    readings other workers logged first are applied here before ours, so
+    every worker ingests the same order and raises the same alerts.
+    """
+    def build(tail):
+        lat, lng = (tail[4][-1], tail[5][-1]) if tail is not None else (state.latest_data.get('lat'), state.latest_data.get('lng'))
+        return stamps_us, temps, hums, _carry_forward(lat_keys, lat), _carry_forward(lng_keys, lng)
+    tail, (_, _, _, lats, lngs) = backend.append(state.device_id, state.history.last_seq, build)
+    if tail is not None: _apply_tail(state, tail, local_tz)
+    return lats, lngs
+
+def _sync(state):
+    """Catches one device up with the shared log before a read (no-op for the local backend)."""
+    if not backend.shared: return
+    with state.lock:
+        tail = backend.tail(state.device_id, state.history.last_seq)
+        if tail is not None: _apply_tail(state, tail, LOCAL_TZ)
+
+_geofences_version = 0 # Shared 'geofences' setting last loaded
+
+def _sync_all():
+    """Catches every device (including ones only other workers have seen) and the geofences up with the shared backend."""
+    global _geofences_version
+    if not backend.shared: return
+    version, value = backend.setting('geofences')
+    zones_changed = version != _geofences_version
+    if zones_changed:
+        geofences.replace(parse_geofences(app.json.loads(value)))
+        _geofences_version = version
+    local_tz = LOCAL_TZ
+    for device_id, head in backend.heads().items():
+        state = devices.get(device_id)
+        if state.history.last_seq >= head: continue
+        with state.lock:
+            tail = backend.tail(device_id, state.history.last_seq)
+            if tail is not None: _apply_tail(state, tail, local_tz)
+    if zones_changed: _recheck_geofences() # Positions caught up first, as on the worker that took the PUT
+
+def _follow_shared_log():
+    """Background loop: applies other workers' readings so this worker's SSE streams see the whole fleet."""
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try: _sync_all()
+        except Exception as e: print(f"❌ Error syncing shared state: {e}")
+
+
 # === API Endpoints ===
 
 @app.route('/api/data', methods=['POST'])
 def receive_data():
     """Receives data, updates history, predicts, calculates KPIs, logs alerts."""
-    global latest_data, history, model, alert_log, current_alert_info
+    timer = Stopwatch(INGEST_STAGE_SECONDS, 'single')
+    state = None
     try:
-        # 1. --- Get and Validate Input Data ---
-        data = request.get_json()
+        # 1. --- Get and Validate Input Data (JSON, MessagePack or a binary frame) ---
+        data, error = _request_payload()
+        if error: return error
         if not data: return jsonify({"error": "Invalid JSON"}), 400
+        try: device_id = _device_from_request(data)
+        except ValueError: return jsonify({"error": "Invalid 'device_id'"}), 400
         temp = data.get('temp')
         hum = data.get('hum')
-        lat = data.get('lat', latest_data.get('lat'))
-        lng = data.get('lng', latest_data.get('lng'))
-        # Get current time in local timezone
-        local_tz = pytz.timezone(TIMEZONE)
-        timestamp_iso = datetime.now(local_tz).isoformat() # Record arrival time in local timezone
+        # Get current time in local timezone (or the device's own timestamp, if sent)
+        local_tz = LOCAL_TZ
+        if data.get('ts') is not None:
+            try: now_local = from_epoch_us(parse_device_timestamp(data['ts'], local_tz), local_tz)
+            except ValueError: return jsonify({"error": "Invalid 'ts'"}), 400
+        else:
+            now_local = datetime.now(local_tz) # Record arrival time in local timezone
 
         if temp is None or not isinstance(temp, (int, float)): return jsonify({"error": "Invalid 'temp'"}), 400
         if hum is None or not isinstance(hum, (int, float)): return jsonify({"error": "Invalid 'hum'"}), 400
         temp_py, hum_py = float(temp), float(hum)
-        lat_py = float(lat) if lat is not None else None
-        lng_py = float(lng) if lng is not None else None
-
-        # 2. --- Update History ---
-        current_hours = len(history) * SENSOR_INTERVAL_HOURS
-        # RSL will be added after prediction
-        current_reading = {'timestamp': timestamp_iso, 'hours': current_hours, 'temperature': temp_py, 'humidity': hum_py, 'rsl': None}
-        history.append(current_reading)
-        if len(history) > HISTORY_MAX_LEN: history.pop(0)
-
-        # 3. --- Predict RSL (if possible) ---
-        predicted_rsl_py = None
-        hist_df = pd.DataFrame(history) # Create DataFrame *after* appending new reading
-        
-        # Calculate RSL based on Q10 degradation model for cold chain (5-15°C range)
-        if not hist_df.empty:
-            try:
-                # Use Q10 degradation model: For every 10°C above optimal, shelf life halves
-                temp_diff = temp_py - PRODUCT_OPTIMAL_TEMP
-                degradation_factor = PRODUCT_Q10 ** (temp_diff / 10.0)
-                
-                # Base shelf life at optimal temperature
-                base_shelf_life = 20.0  # days
-                
-                # Calculate remaining shelf life
-                predicted_rsl_py = base_shelf_life / degradation_factor
-                
-                # Adjust based on time already spent at various temperatures
-                avg_temp = float(hist_df['temperature'].mean())
-                avg_temp_diff = avg_temp - PRODUCT_OPTIMAL_TEMP
-                avg_degradation = PRODUCT_Q10 ** (avg_temp_diff / 10.0)
-                time_elapsed_days = current_hours / 24.0
-                shelf_life_consumed = time_elapsed_days * avg_degradation
-                
-                # Final RSL = base - consumed
-                predicted_rsl_py = max(0.1, base_shelf_life - shelf_life_consumed)
-                
-                # Clamp to reasonable range (0.1 to 30 days)
-                predicted_rsl_py = float(max(0.1, min(30.0, predicted_rsl_py)))
-                
-                # Update RSL in the *last* history entry
-                history[-1]['rsl'] = round(predicted_rsl_py, 2)
-                
-            except Exception as pred_e: 
-                print(f"❌ Prediction Error: {pred_e}")
-                traceback.print_exc()
-                # Fallback to model prediction if Q10 fails
-                if model is not None:
-                    try:
-                        current_features = {
-                            'temperature': temp_py, 'humidity': hum_py,
-                            'avg_temp_last_6h': float(hist_df['temperature'].rolling(WINDOW_SIZE_HOURS, min_periods=1).mean().iloc[-1]),
-                            'max_temp_last_6h': float(hist_df['temperature'].rolling(WINDOW_SIZE_HOURS, min_periods=1).max().iloc[-1]),
-                            'min_temp_last_6h': float(hist_df['temperature'].rolling(WINDOW_SIZE_HOURS, min_periods=1).min().iloc[-1]),
-                            'time_above_critical': float((hist_df['temperature'] > CRITICAL_TEMP).sum() * SENSOR_INTERVAL_HOURS),
-                            'journey_time_hours': float(current_hours)
-                        }
-                        feature_order = ['temperature', 'humidity', 'avg_temp_last_6h', 'max_temp_last_6h',
-                                         'min_temp_last_6h', 'time_above_critical', 'journey_time_hours']
-                        feature_values = pd.DataFrame([current_features], columns=feature_order)
-                        predicted_rsl_np = model.predict(feature_values)[0]
-                        predicted_rsl_py = float(max(0.1, predicted_rsl_np))
-                        history[-1]['rsl'] = round(predicted_rsl_py, 2)
-                    except Exception as model_e:
-                        print(f"❌ Model Prediction also failed: {model_e}")
-                        predicted_rsl_py = 15.0  # Safe fallback
-
-        # 4. --- Determine Status & Log Alerts ---
-        current_status = "NORMAL"
-        alert_type = None
-        if temp_py > ALERT_TEMP_HIGH:
-            current_status = "ALERT"
-            alert_type = "High Temperature"
-        elif temp_py < ALERT_TEMP_LOW:
-            current_status = "ALERT"
-            alert_type = "Low Temperature"
-
-        # Update Alert Log
-        if current_status == "ALERT":
-            if current_alert_info is None: # New alert starts
-                current_alert_info = {'start_time': timestamp_iso, 'end_time': None, 'type': alert_type, 'peak_value': temp_py}
-                alert_log.append(current_alert_info)
-            else: # Alert continues
-                # Update peak value if current temp is more extreme
-                if (alert_type == "High Temperature" and temp_py > current_alert_info['peak_value']) or \
-                   (alert_type == "Low Temperature" and temp_py < current_alert_info['peak_value']):
-                    current_alert_info['peak_value'] = temp_py
-                # If alert type changes mid-alert (e.g., high then low), end previous, start new
-                if current_alert_info['type'] != alert_type:
-                     current_alert_info['end_time'] = timestamp_iso # End previous
-                     current_alert_info = {'start_time': timestamp_iso, 'end_time': None, 'type': alert_type, 'peak_value': temp_py}
-                     alert_log.append(current_alert_info)
-
-        elif current_status == "NORMAL" and current_alert_info is not None: # Alert ends
-            current_alert_info['end_time'] = timestamp_iso
-            current_alert_info = None # Reset current alert tracking
-
-        # Keep alert log size manageable (optional)
-        # MAX_ALERTS = 50
-        # if len(alert_log) > MAX_ALERTS: alert_log = alert_log[-MAX_ALERTS:]
-
-
-        # 5. --- Calculate KPIs ---
-        kpis = {
-            "avg_temp": None, "min_temp": None, "max_temp": None,
-            "time_in_range_hrs": 0.0, "time_out_range_hrs": 0.0,
-            "journey_time_hours": float(current_hours),
-            "time_above_critical": float((hist_df['temperature'] > CRITICAL_TEMP).sum() * SENSOR_INTERVAL_HOURS) # Recalculate based on full history
-        }
-        if not hist_df.empty:
-            kpis["avg_temp"] = round(float(hist_df['temperature'].mean()), 1)
-            kpis["min_temp"] = round(float(hist_df['temperature'].min()), 1)
-            kpis["max_temp"] = round(float(hist_df['temperature'].max()), 1)
-            # Updated range for cold chain: 3°C to 15°C is acceptable
-            in_range_mask = (hist_df['temperature'] >= ALERT_TEMP_LOW) & (hist_df['temperature'] <= ALERT_TEMP_HIGH)
-            kpis["time_in_range_hrs"] = round(float(in_range_mask.sum() * SENSOR_INTERVAL_HOURS), 1)
-            kpis["time_out_range_hrs"] = round(float((~in_range_mask).sum() * SENSOR_INTERVAL_HOURS), 1)
-
-
-        # 6. --- Update latest_data Store ---
-        latest_data = {
-            "timestamp": timestamp_iso,
-            "temperature": temp_py,
-            "humidity": hum_py,
-            "lat": lat_py,
-            "lng": lng_py,
-            "predicted_rsl_days": round(predicted_rsl_py, 2) if predicted_rsl_py is not None else None,
-            "status": current_status,
-            **kpis # Merge KPIs into the latest data
-        }
-
-        print(f"✅ Data Processed: T={temp_py:.1f}, RSL={latest_data['predicted_rsl_days']}, Status={latest_data['status']}, KPIs: MaxT={kpis['max_temp']}, TimeOut={kpis['time_out_range_hrs']}h")
+
+        # Queued ingest: acknowledge now, the worker applies it. A device with readings still queued
+        # goes through the queue even when synchronous, so its readings are applied in arrival order.
+        bad_key = _invalid_position(data)
+        if bad_key: return jsonify({"error": f"Invalid '{bad_key}'"}), 400
+        queued = ASYNC_INGEST or 'respond-async' in request.headers.get('Prefer', '')
+        if queued or ingest_queue.pending(device_id):
+            item = (temp_py, hum_py, to_epoch_us(now_local), data.get('lat', _MISSING), data.get('lng', _MISSING),
+                    time.perf_counter())
+            try: ticket = ingest_queue.put(device_id, item, wait=not queued)
+            except QueueFull:
+                INGEST_QUEUE_REJECTED.inc()
+                retry_after = ingest_queue.retry_after()
+                return jsonify({"error": "Ingest queue full", "retry_after": retry_after}), 429, {'Retry-After': str(retry_after)}
+            if queued: return jsonify({"message": "Data accepted", "queue_depth": ingest_queue.depth()}), 202
+            ticket.result(timeout=30)
+            return jsonify({"message": "Data received successfully"}), 200
+        timer.lap('parse')
+
+        state = devices.get(device_id)
+        with state.lock: # Per-device lock: other devices ingest in parallel
+            timer.lap('lock_wait')
+            stamp_us = to_epoch_us(now_local)
+            (lat_py,), (lng_py,) = _claim(state, [stamp_us], [temp_py], [hum_py], [data.get('lat', _MISSING)],
+                                          [data.get('lng', _MISSING)], local_tz)
+            if backend.shared: timer.lap('claim')
+            prev_status, prev_alert_seq, prev_created = state.latest_data.get('status'), state.alerts_seq, state.alerts_created
+            latest = _ingest_reading(state, temp_py, hum_py, lat_py, lng_py, now_local, timer)
+            _persist(state, [stamp_us], [temp_py], [hum_py], [lat_py], [lng_py], prev_alert_seq)
+            timer.lap('persist')
+            _publish_changes(state, prev_status, prev_alert_seq)
+            timer.lap('publish')
+            opened = state.alerts_created - prev_created
+        timer.stop()
+        READINGS_INGESTED.inc('single')
+        if opened: ALERTS_OPENED.inc(amount=opened)
+
+        print(f"✅ Data Processed [{device_id}]: T={temp_py:.1f}, RSL={latest['predicted_rsl_days']}, Status={latest['status']}, KPIs: MaxT={latest['max_temp']}, TimeOut={latest['time_out_range_hrs']}h")
         return jsonify({"message": "Data received successfully"}), 200
 
     except Exception as e:
         print(f"❌ FATAL error in /api/data: {e}")
         traceback.print_exc()
-        latest_data["status"] = "ERROR" # Set status to error
+        INGEST_ERRORS.inc('/api/data')
+        if state is not None: state.latest_data["status"] = "ERROR" # Set status to error
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+# --- Endpoint for gateways uploading buffered readings ---
+_MISSING = object()
+
+def _apply_batch(state, temps, hums, stamps_us, lat_keys, lng_keys, local_tz, timer):
+    """Runs validated readings through the batch pipeline under the device lock; returns (new alerts, status)."""
+    with state.lock:
+        timer.lap('lock_wait')
+        lats, lngs = _claim(state, stamps_us, temps, hums, lat_keys, lng_keys, local_tz)
+        if backend.shared: timer.lap('claim')
+        prev_status, prev_alert_seq = state.latest_data.get('status'), state.alerts_seq
+        new_alerts = _ingest_batch(state, temps, hums, stamps_us, lats, lngs, local_tz, timer)
+        _persist(state, stamps_us, temps, hums, lats, lngs, prev_alert_seq)
+        timer.lap('persist')
+        status = state.latest_data['status']
+        _publish_changes(state, prev_status, prev_alert_seq, batch_size=len(temps))
+        timer.lap('publish')
+    timer.stop()
+    return new_alerts, status
+
+def _invalid_position(reading):
+    """'lat' or 'lng' if that key holds something other than a number or null (no fix), else None."""
+    for key in ('lat', 'lng'):
+        try: float(reading[key]) if reading.get(key) is not None else None
+        except (TypeError, ValueError): return key
+    return None
+
+def _parse_readings(readings, local_tz, arrival_us):
+    """Validates JSON/MessagePack reading objects into columns; returns (columns, error response)."""
+    temps, hums, stamps_us = [], [], []
+    lat_keys, lng_keys = [], [] # Per reading: explicit lat/lng or _MISSING (carried forward, as with sequential posts)
+    for i, r in enumerate(readings):
+        if not isinstance(r, dict): return None, (jsonify({"error": f"Reading {i}: not an object"}), 400)
+        temp, hum = r.get('temp'), r.get('hum')
+        if temp is None or not isinstance(temp, (int, float)): return None, (jsonify({"error": f"Reading {i}: invalid 'temp'"}), 400)
+        if hum is None or not isinstance(hum, (int, float)): return None, (jsonify({"error": f"Reading {i}: invalid 'hum'"}), 400)
+        try: stamps_us.append(parse_device_timestamp(r['ts'], local_tz) if r.get('ts') is not None else arrival_us)
+        except ValueError: return None, (jsonify({"error": f"Reading {i}: invalid 'ts'"}), 400)
+        bad_key = _invalid_position(r)
+        if bad_key: return None, (jsonify({"error": f"Reading {i}: invalid '{bad_key}'"}), 400)
+        temps.append(temp); hums.append(hum)
+        lat_keys.append(r.get('lat', _MISSING)); lng_keys.append(r.get('lng', _MISSING))
+    return (np.asarray(temps, dtype=np.float64), np.asarray(hums, dtype=np.float64),
+            np.asarray(stamps_us, dtype=np.int64), lat_keys, lng_keys), None
+
+def _carry_forward(values, current):
+    """Resolves each reading's lat/lng: its own value, else the last one seen (floats or None).
+
+    `values` is a list with _MISSING for absent keys, or a float array with NaN there (binary frames).
+    """
+    if isinstance(values, np.ndarray): return forward_fill(values, current)
+    resolved = []
+    for value in values:
+        if value is not _MISSING: current = value
+        resolved.append(float(current) if current is not None else None)
+    return resolved
+
+@app.route('/api/data/batch', methods=['POST'])
+def receive_batch():
+    """Ingests an array of buffered readings in vectorised passes.
+
+    Accepts `[{temp, hum, lat?, lng?, ts?}, ...]` (or `{"device_id": ..., "readings": [...]}`),
+    where `ts` is the device timestamp (epoch seconds or ISO 8601), as JSON or
+    MessagePack - or a binary frame of packed records, decoded straight into
+    arrays. The resulting history, alert log and latest_data are identical to
+    posting the readings one by one to /api/data.
+    """
+    timer = Stopwatch(INGEST_STAGE_SECONDS, 'batch')
+    state = None
+    try:
+        # 1. --- Get and Validate Input Data ---
+        local_tz = LOCAL_TZ
+        arrival_us = to_epoch_us(datetime.now(local_tz))
+        if request.mimetype == FRAME_CONTENT_TYPE: # Packed records -> columns in one np.frombuffer
+            try: frame_device, records = decode_frame(request.get_data())
+            except FrameError as e: return jsonify({"error": str(e)}), 400
+            if len(records) == 0: return jsonify({"error": "Expected a non-empty array of readings"}), 400
+            data = {'device_id': frame_device} if frame_device is not None else None
+            temps, hums, stamps_us, lat_keys, lng_keys = frame_columns(records, arrival_us) # lat/lng: NaN = carry forward
+        else:
+            data, error = _request_payload(silent=True)
+            if error: return error
+            readings = data.get('readings') if isinstance(data, dict) else data
+            if not isinstance(readings, list) or not readings: return jsonify({"error": "Expected a non-empty array of readings"}), 400
+            columns, error = _parse_readings(readings, local_tz, arrival_us)
+            if error: return error
+            temps, hums, stamps_us, lat_keys, lng_keys = columns
+        try: device_id = _device_from_request(data)
+        except ValueError: return jsonify({"error": "Invalid 'device_id'"}), 400
+        timer.lap('parse')
+
+        state = devices.get(device_id)
+        new_alerts, status = _apply_batch(state, temps, hums, stamps_us, lat_keys, lng_keys, local_tz, timer)
+        READINGS_INGESTED.inc('batch', amount=len(temps))
+        if new_alerts: ALERTS_OPENED.inc(amount=len(new_alerts))
+
+        print(f"✅ Batch Processed [{device_id}]: {len(temps)} readings, {len(new_alerts)} new alerts, Status={status}")
+        return jsonify({"message": "Batch received successfully", "count": len(temps)}), 200
+
+    except Exception as e:
+        print(f"❌ FATAL error in /api/data/batch: {e}")
+        traceback.print_exc()
+        INGEST_ERRORS.inc('/api/data/batch')
+        if state is not None: state.latest_data["status"] = "ERROR" # Set status to error
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+# --- Ingest queue worker (queued /api/data readings) ---
+def _apply_queued(device_id, items):
+    """Applies one device's queued readings (arrival order) as a single batch - same result as applying them one by one."""
+    timer = Stopwatch(INGEST_STAGE_SECONDS, 'queued')
+    now = time.perf_counter()
+    for item in items: INGEST_QUEUE_WAIT.observe(now - item[5])
+    temps = np.array([item[0] for item in items], dtype=np.float64)
+    hums = np.array([item[1] for item in items], dtype=np.float64)
+    stamps_us = np.array([item[2] for item in items], dtype=np.int64)
+    state = devices.get(device_id)
+    try:
+        new_alerts, status = _apply_batch(state, temps, hums, stamps_us, [item[3] for item in items],
+                                          [item[4] for item in items], LOCAL_TZ, timer)
+    except Exception:
+        INGEST_ERRORS.inc('queue')
+        state.latest_data["status"] = "ERROR"
+        raise
+    READINGS_INGESTED.inc('queued', amount=len(items))
+    if new_alerts: ALERTS_OPENED.inc(amount=len(new_alerts))
+    print(f"✅ Queued Readings Processed [{device_id}]: {len(items)} readings, {len(new_alerts)} new alerts, Status={status}")
+
+ingest_queue = IngestQueue(_apply_queued, capacity=INGEST_QUEUE_SIZE, max_batch=INGEST_QUEUE_BATCH)
+
+# --- Per-device read endpoints (the un-prefixed routes serve ?device=, default partition otherwise) ---
+def _state_or_404(device_id):
+    try: device_id = normalize_device_id(device_id)
+    except ValueError: return None, (jsonify({"error": "Invalid device id"}), 400)
+    state = devices.get(device_id, create=(device_id == DEFAULT_DEVICE_ID))
+    if state is None and backend.shared: # Maybe only other workers have seen it so far
+        _sync_all()
+        state = devices.get(device_id, create=False)
+    if state is None: return None, (jsonify({"error": f"Unknown device '{device_id}'"}), 404)
+    _sync(state)
+    return state, None
+
+@app.route('/api/devices', methods=['GET'])
+def list_devices():
+    """Lists known devices with their current status."""
+    _sync_all()
+    return jsonify([{"device_id": s.device_id, "status": s.latest_data.get("status"),
+                     "timestamp": s.latest_data.get("timestamp")} for s in devices.states()])
+
+def _since_arg():
+    """`?since=<seq>` cursor (None when absent); raises ValueError if malformed."""
+    since = request.args.get('since')
+    if since is None: return None
+    since = int(since)
+    if since < 0: raise ValueError("negative cursor")
+    return since
+
+def _conditional(etag, build_body, headers=None):
+    """Answers 304 if the client already has `etag`, otherwise builds the JSON body.
+
+    ETags carry the server's boot id, so cursors and tags from before a restart never match.
+    """
+    etag = f"{BOOT_ID}-{etag}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(build_body(), mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['X-Boot-Id'] = BOOT_ID
+    for name, value in (headers or {}).items(): response.headers[name] = str(value)
+    return response
+
+def _compressed(view):
+    """gzip/brotli-encodes a view's 200 responses per Accept-Encoding (large JSON bodies only)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough: return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None or response.content_length is None or response.content_length < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+    return wrapper
+
 # --- Endpoint for Frontend to get the latest status and KPIs ---
 @app.route('/api/status', methods=['GET'])
-def get_status():
-    """Returns the most recent data snapshot including KPIs."""
-    global latest_data
-    return jsonify(latest_data)
+@app.route('/api/devices/<device_id>/status', methods=['GET'])
+def get_status(device_id=None):
+    """Returns the most recent data snapshot including KPIs (304 if unchanged)."""
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    with state.lock:
+        latest = state.latest_data
+        etag = f"{state.device_id}-s{state.history.last_seq}-{latest.get('status')}"
+    return _conditional(etag, lambda: app.json.dumps(latest))
 
 # --- Endpoint for Frontend to get historical data ---
 @app.route('/api/history', methods=['GET'])
-def get_history():
-    """Returns the stored historical sensor readings."""
-    global history
-    # Return last N points, or filter by time if implemented
-    return jsonify(history) # Returns the entire list for now
+@app.route('/api/devices/<device_id>/history', methods=['GET'])
+@_compressed
+def get_history(device_id=None):
+    """Returns the stored historical sensor readings.
+
+    `?since=<seq>` returns only readings newer than that cursor. A cursor ahead
+    of the server (e.g. after a restart) gets the full history back.
+    X-History-First-Seq tells clients which merged readings have been evicted.
+
+    `?points=N&from=&to=` (times as epoch seconds or ISO 8601) returns a chart
+    series of at most N points instead - see `_downsampled_history`.
+    """
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    if any(k in request.args for k in ('points', 'from', 'to')): return _downsampled_history(state)
+    try: since = _since_arg()
+    except ValueError: return jsonify({"error": "Invalid 'since'"}), 400
+    with state.lock: # Columns must not move under the serializer
+        history = state.history
+        start = history.index_after(since) if since is not None and since <= history.last_seq else 0
+        etag = f"{state.device_id}-h{history.last_seq}"
+        headers = {'X-History-First-Seq': history.first_seq, 'X-History-Last-Seq': history.last_seq}
+        # Serialized straight from the ring-buffer columns (no per-reading dicts)
+        return _conditional(etag, lambda: history.to_json(LOCAL_TZ, start), headers)
+
+def _time_arg(key, tz, default):
+    """`?from=` / `?to=` as epoch µs (epoch seconds or ISO 8601); raises ValueError(key) if malformed."""
+    value = request.args.get(key)
+    if value is None: return default
+    try:
+        try: return parse_device_timestamp(float(value), tz)
+        except ValueError: return parse_device_timestamp(value, tz)
+    except ValueError: raise ValueError(key)
+
+def _downsampled_history(state):
+    """Chart series for `?points=N&from=&to=&mode=minmax|lttb` (X-Downsample names the source).
+
+    Reads from the finest source with at most N x DOWNSAMPLE_OVERSCAN rows in
+    range - raw readings, else the 1 min / 10 min / 1 h rollups - so a
+    zoomed-out view of a huge journey never scans raw history. Raw readings
+    are thinned with min/max per bucket (default: every excursion survives) or
+    LTTB; rollup buckets are merged and keep their temp_min / temp_max.
+    """
+    local_tz = LOCAL_TZ
+    try:
+        points = int(request.args.get('points', MAX_CHART_POINTS))
+        if not 3 <= points <= MAX_CHART_POINTS: raise ValueError(points)
+    except ValueError: return jsonify({"error": f"'points' must be between 3 and {MAX_CHART_POINTS}"}), 400
+    mode = request.args.get('mode', 'minmax')
+    if mode not in ('minmax', 'lttb'): return jsonify({"error": "'mode' must be 'minmax' or 'lttb'"}), 400
+    try: from_us, to_us = _time_arg('from', local_tz, -2**63), _time_arg('to', local_tz, 2**63 - 1)
+    except ValueError as e: return jsonify({"error": f"Invalid '{e.args[0]}'"}), 400
+
+    with state.lock:
+        history = state.history
+        etag = f"{state.device_id}-h{history.last_seq}-{points}-{mode}-{from_us}-{to_us}"
+        headers = {'X-History-First-Seq': history.first_seq, 'X-History-Last-Seq': history.last_seq}
+        lo, hi = history.index_range(from_us, to_us)
+        budget = points * DOWNSAMPLE_OVERSCAN
+        source = None
+        if hi - lo > budget: # Too many raw readings: use the finest rollup that fits
+            for level in state.rollups.levels:
+                source = (level,) + level.range(from_us, to_us)
+                if source[2] - source[1] <= budget: break
+
+        if source is None:
+            temps = history.column('temperature')[lo:hi]
+            if hi - lo <= points: picked, headers['X-Downsample'] = np.arange(hi - lo), 'raw'
+            elif mode == 'lttb': picked, headers['X-Downsample'] = lttb(history.column('timestamp_us')[lo:hi], temps, points), 'lttb'
+            else: picked, headers['X-Downsample'] = minmax(temps, points), 'minmax'
+            build = lambda: history.to_json(local_tz, index=lo + picked)
+        else:
+            level, first, last = source
+            merged = level.merged(first, last, points)
+            headers['X-Downsample'] = f"rollup-{level.name}"
+            build = lambda: rollups_to_json(merged, local_tz)
+        return _conditional(etag, build, headers)
 
 # --- Endpoint for Frontend to get alert log ---
 @app.route('/api/alerts', methods=['GET'])
-def get_alerts():
-    """Returns the log of alert events."""
-    global alert_log
-    # Return alerts, maybe most recent first
-    return jsonify(sorted(alert_log, key=lambda x: x['start_time'], reverse=True))
+@app.route('/api/devices/<device_id>/alerts', methods=['GET'])
+def get_alerts(device_id=None):
+    """Returns the log of alert events, most recent start first.
+
+    `?since=<seq>` returns only alerts opened or changed after that cursor
+    (alert `seq` = the reading that last changed it). Otherwise the retained
+    log is served from its start-time index: `?type=` (e.g. High Temperature),
+    `?from=`/`?to=` (start time, epoch seconds or ISO 8601) and `?open=1` (the
+    open alert only) filter it; `?limit=` pages it, the `X-Next-Cursor` header
+    being the `?cursor=` of the next page.
+    """
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    local_tz = LOCAL_TZ
+    try: since = _since_arg()
+    except ValueError: return jsonify({"error": "Invalid 'since'"}), 400
+    try: from_us, to_us = _time_arg('from', local_tz, None), _time_arg('to', local_tz, None)
+    except ValueError as e: return jsonify({"error": f"Invalid '{e.args[0]}'"}), 400
+    try: cursor = parse_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError: return jsonify({"error": "Invalid 'cursor'"}), 400
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        if limit is not None and not 1 <= limit <= MAX_ALERTS_PAGE: raise ValueError(limit)
+    except ValueError: return jsonify({"error": f"'limit' must be between 1 and {MAX_ALERTS_PAGE}"}), 400
+    alert_type, headers = request.args.get('type'), {}
+    with state.lock:
+        log = state.alert_log
+        if since is not None and since <= state.history.last_seq:  # Few alerts: sort them by start
+            alerts = sorted(state.alerts_since(since), key=lambda x: x['start_time'], reverse=True)
+        elif request.args.get('open') == '1':
+            alerts = [a for a in (log.open,) if a is not None and alert_type in (None, a['type'])]
+        else:
+            alerts, next_key = log.page(alert_type, from_us, to_us, cursor, limit)
+            if next_key is not None: headers['X-Next-Cursor'] = format_cursor(next_key)
+        alerts = [dict(a) for a in alerts]
+        headers['X-Alerts-Last-Seq'] = state.alerts_seq
+        etag = f"{state.device_id}-a{state.alerts_seq}-{state.alerts_created}-{log.evicted}"
+    return _conditional(etag, lambda: app.json.dumps(alerts), headers)
+
+@app.route('/api/alerts/stats', methods=['GET'])
+@app.route('/api/devices/<device_id>/alerts/stats', methods=['GET'])
+def get_alert_stats(device_id=None):
+    """Per-type alert totals (count, excursion time, peak) including alerts past retention, and the open alert."""
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    with state.lock:
+        log = state.alert_log
+        open_alert = log.open
+        body = {"device_id": state.device_id, "retention_days": ALERT_RETENTION_US / 86400e6 or None,
+                "retained": len(log), "archived": log.evicted, "types": log.stats(),
+                "open": dict(open_alert) if open_alert else None}
+        etag = f"{state.device_id}-as{state.alerts_seq}-{state.alerts_created}-{log.evicted}"
+    return _conditional(etag, lambda: app.json.dumps(body))
+
+# --- GPS track & geofences ---
+@app.route('/api/track', methods=['GET'])
+@app.route('/api/devices/<device_id>/track', methods=['GET'])
+@_compressed
+def get_track(device_id=None):
+    """Returns the device's GPS route, simplified for the map.
+
+    `?tolerance=<metres>` (default 10; 0 = every stored fix) with `?method=dp`
+    (Douglas-Peucker, default) or `vw` (Visvalingam-Whyatt) - a point's
+    distance from the simplified line for both; `?from=&to=` (epoch seconds
+    or ISO 8601) narrow it to a time range.
+    """
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    local_tz = LOCAL_TZ
+    try:
+        tolerance = float(request.args.get('tolerance', TRACK_TOLERANCE_M))
+        if not tolerance >= 0 or math.isinf(tolerance): raise ValueError(tolerance)
+    except ValueError: return jsonify({"error": "'tolerance' must be a non-negative number of metres"}), 400
+    method = request.args.get('method', 'dp')
+    if method not in SIMPLIFIERS: return jsonify({"error": "'method' must be 'dp' or 'vw'"}), 400
+    try: from_us, to_us = _time_arg('from', local_tz, -2**63), _time_arg('to', local_tz, 2**63 - 1)
+    except ValueError as e: return jsonify({"error": f"Invalid '{e.args[0]}'"}), 400
+
+    def build():
+        picked = track.simplified(tolerance, method, from_us, to_us)
+        seqs, lats, lngs = (track.column(name)[picked].tolist() for name in ('seq', 'lat', 'lng'))
+        stamps = format_timestamps(track.column('ts_us')[picked], local_tz)
+        lo, hi = np.searchsorted(track.column('ts_us'), from_us, 'left'), np.searchsorted(track.column('ts_us'), to_us, 'right')
+        return app.json.dumps({
+            'device_id': state.device_id, 'method': method, 'tolerance_m': tolerance, 'total_points': int(hi - lo),
+            'points': [{'seq': q, 'timestamp': t, 'lat': a, 'lng': b} for q, t, a, b in zip(seqs, stamps, lats, lngs)],
+        })
+
+    with state.lock: # Simplified routes are cached per track version, so repeat loads are cheap
+        track = state.track
+        etag = f"{state.device_id}-t{track.version}-{len(track)}-{method}-{tolerance}-{from_us}-{to_us}"
+        return _conditional(etag, build)
+
+@app.route('/api/geofences', methods=['GET', 'PUT'])
+def geofence_config():
+    """Lists the configured geofences; PUT replaces them all.
+
+    Body: `[{id, name?, lat, lng, radius_m} | {id, name?, polygon: [[lat, lng], ...]}, ...]`
+    (or `{"geofences": [...]}`). Every device's last fix is re-checked against the
+    new zones, so parked devices log their enter/exit events right away.
+    """
+    if request.method == 'PUT':
+        try: zones = parse_geofences(request.get_json(silent=True))
+        except ValueError as e: return jsonify({"error": str(e)}), 400
+        geofences.replace(zones)
+        _recheck_geofences()
+        if backend.shared: backend.put_setting('geofences', app.json.dumps([zone.to_dict() for zone in zones])) # Other workers load it on their next sync
+        print(f"🗺️ Geofences replaced: {len(zones)} zone(s)")
+        return jsonify({"message": "Geofences updated", "count": len(zones)}), 200
+    return jsonify([zone.to_dict() for zone in geofences.zones()])
+
+@app.route('/api/geofence-events', methods=['GET'])
+@app.route('/api/devices/<device_id>/geofence-events', methods=['GET'])
+def get_geofence_events(device_id=None):
+    """Returns the device's geofence enter/exit log, most recent first.
+
+    `?since=<seq>` returns only events from readings after that cursor.
+    """
+    state, error = _state_or_404(device_id or request.args.get('device'))
+    if error: return error
+    try: since = _since_arg()
+    except ValueError: return jsonify({"error": "Invalid 'since'"}), 400
+    with state.lock:
+        if since is not None and since <= state.history.last_seq: log = state.geofence_events_since(since)
+        else: log = state.geofence_log
+        log = [dict(e) for e in reversed(log)]
+        etag = f"{state.device_id}-g{state.geofence_events_created}"
+    return _conditional(etag, lambda: app.json.dumps(log))
+
+# --- Fleet overview (all devices, from the fleet rollup tables) ---
+FLEET_SORT_KEYS = { # ?sort= -> (row key, worst first when descending)
+    'rsl': ('worst_rsl_days', False), 'excursion': ('excursion_minutes', True),
+    'alerts': ('alerts_opened', True), 'temp_max': ('temp_max', True)}
+
+@app.route('/api/fleet/summary', methods=['GET'])
+def fleet_summary():
+    """Fleet totals, the top-K worst shipments and hourly excursion minutes over `?from=&to=` (default: all retained).
+
+    `?k=` (default 10) and `?sort=rsl|excursion|alerts|temp_max` pick the
+    ranking. Answered from the fleet 1 min / 1 h rollup tables - never from
+    raw readings - with whole-array reductions across all devices.
+    """
+    local_tz = LOCAL_TZ
+    try: from_us, to_us = _time_arg('from', local_tz, -2**63), _time_arg('to', local_tz, 2**63 - 1)
+    except ValueError as e: return jsonify({"error": f"Invalid '{e.args[0]}'"}), 400
+    try:
+        k = int(request.args.get('k', 10))
+        if not 0 <= k <= FLEET_TOP_K_MAX: raise ValueError(k)
+    except ValueError: return jsonify({"error": f"'k' must be between 0 and {FLEET_TOP_K_MAX}"}), 400
+    sort = request.args.get('sort', 'rsl')
+    if sort not in FLEET_SORT_KEYS: return jsonify({"error": f"'sort' must be one of {', '.join(FLEET_SORT_KEYS)}"}), 400
+
+    _sync_all()
+    totals, ids, resolution = fleet_tables.summarize(from_us, to_us)
+    count = totals['count']
+    reporting = count > 0
+    minutes_per_reading = SENSOR_INTERVAL_HOURS * 60 # Same basis as time_out_range_hrs
+    excursion = totals['out_of_range'] * minutes_per_reading
+    with np.errstate(invalid='ignore', divide='ignore'):
+        temp_mean, hum_mean = totals['temp_sum'] / count, totals['hum_sum'] / count
+    columns = {'worst_rsl_days': totals['rsl_min'], 'excursion_minutes': excursion, 'alerts_opened': totals['alerts'],
+               'temp_max': totals['temp_max']}
+
+    key, descending = FLEET_SORT_KEYS[sort]
+    values = columns[key].astype(np.float64)
+    candidates = np.flatnonzero(reporting)
+    order = np.argsort(-values[candidates] if descending else values[candidates], kind='stable') # Ties: registration order
+    finite = lambda v: v if math.isfinite(v) else None # inf: no RSL prediction in range
+    worst = []
+    for d in candidates[order[:k]].tolist():
+        state = devices.get(ids[d], create=False)
+        latest = state.latest_data if state is not None else {}
+        worst.append({
+            'device_id': ids[d], 'status': latest.get('status'), 'current_rsl_days': latest.get('predicted_rsl_days'),
+            'readings': int(count[d]), 'worst_rsl_days': finite(float(totals['rsl_min'][d])),
+            'excursion_minutes': excursion[d].item(), 'alerts_opened': int(totals['alerts'][d]),
+            'temp_min': float(totals['temp_min'][d]), 'temp_max': float(totals['temp_max'][d]),
+            'temp_mean': round(float(temp_mean[d]), 3), 'hum_min': float(totals['hum_min'][d]),
+            'hum_max': float(totals['hum_max'][d]), 'hum_mean': round(float(hum_mean[d]), 3)})
+
+    hour_starts, hour_out = fleet_tables.hourly('out_of_range', from_us, to_us)
+    hourly = [{'timestamp': ts, 'excursion_minutes': o * minutes_per_reading}
+              for ts, o in zip(format_timestamps(hour_starts, local_tz), hour_out.tolist())]
+    readings = int(count.sum())
+    fleet = {
+        'devices': len(ids), 'devices_reporting': int(reporting.sum()),
+        'devices_in_alert': sum(1 for s in devices.states() if s.latest_data.get('status') == 'ALERT'), # Current status
+        'readings': readings, 'excursion_minutes': excursion.sum().item(), 'alerts_opened': int(totals['alerts'].sum()),
+        'worst_rsl_days': finite(float(totals['rsl_min'].min(initial=math.inf))),
+        'temp_min': finite(float(totals['temp_min'].min(initial=math.inf))),
+        'temp_max': finite(float(totals['temp_max'].max(initial=-math.inf))),
+        'temp_mean': round(float(totals['temp_sum'].sum()) / readings, 3) if readings else None,
+    }
+    return jsonify({'fleet': fleet, 'worst': worst, 'sort': sort, 'resolution': resolution, 'hourly': hourly})
+
+# --- Offline journey replay / what-if RSL ---
+@app.route('/api/replay', methods=['POST'])
+def replay():
+    """Replays a recorded journey under the live (or an overridden) product profile.
+
+    Body: CSV (`text/csv`, or a multipart `journey` file) with timestamp/ts,
+    temperature/temp and optional humidity/hum and journey_id columns, or JSON
+    `{"readings": [{ts, temp, hum}, ...], "profile": {...}}`. Profile fields
+    (q10, optimal_temp, alert_high, ...) can also be given as query args.
+    `?points=N` thins each trajectory (min/max buckets); `?model=1` adds the
+    joblib model's prediction for every reading.
+    """
+    import pandas as pd # Deferred (with replay.py): only this endpoint needs pandas, so cold starts skip it
+    from replay import replay_journey, journeys_from_frame, PROFILE_KEYS
+    profile = {'optimal_temp': PRODUCT_OPTIMAL_TEMP, 'q10': PRODUCT_Q10, 'alert_high': ALERT_TEMP_HIGH,
+               'alert_low': ALERT_TEMP_LOW, 'critical_temp': CRITICAL_TEMP}
+    try:
+        if 'journey' in request.files: frame = pd.read_csv(request.files['journey'])
+        elif request.mimetype == 'text/csv': frame = pd.read_csv(io.BytesIO(request.get_data()))
+        else:
+            data = request.get_json(silent=True)
+            readings = data.get('readings') if isinstance(data, dict) else data
+            if not isinstance(readings, list) or not readings: return jsonify({"error": "Expected CSV or a non-empty array of readings"}), 400
+            frame = pd.DataFrame(readings)
+            profile.update((data.get('profile') or {}) if isinstance(data, dict) else {})
+        profile.update({k: float(request.args[k]) for k in PROFILE_KEYS if k in request.args})
+        unknown = set(profile) - set(PROFILE_KEYS)
+        if unknown: return jsonify({"error": f"Unknown profile field(s): {', '.join(sorted(unknown))}"}), 400
+        profile = {k: float(v) for k, v in profile.items()}
+        points = int(request.args['points']) if 'points' in request.args else None
+        journeys = journeys_from_frame(frame, LOCAL_TZ)
+    except (ValueError, TypeError, KeyError, pd.errors.ParserError) as e:
+        return jsonify({"error": f"Invalid journey: {e}"}), 400
+
+    model = rsl_model.get() if request.args.get('model') in ('1', 'true') else None
+    results = []
+    for journey_id, journey in journeys.items():
+        result = replay_journey(journey, profile, LOCAL_TZ, model)
+        trajectory = result['trajectory']
+        if points is not None and len(trajectory) > points:
+            trajectory = trajectory.iloc[minmax(trajectory['temperature'].to_numpy(), max(3, points))]
+        trajectory = trajectory.assign(timestamp=[t.isoformat() for t in trajectory['timestamp']])
+        results.append({'journey_id': journey_id, 'kpis': result['kpis'], 'alerts': result['alerts'],
+                        'trajectory': trajectory.astype(object).where(trajectory.notna(), None).to_dict('list')})
+    return jsonify({'profile': profile, 'journeys': results})
+
+# --- Server-Sent Events push stream (replaces the polling loop) ---
+@app.route('/api/stream', methods=['GET'])
+@app.route('/api/devices/<device_id>/stream', methods=['GET'])
+def stream(device_id=None):
+    """Streams reading/alert/status events as SSE; `?device=` narrows to one device."""
+    device_id = device_id or request.args.get('device')
+    try: device_id = normalize_device_id(device_id) if device_id is not None else None
+    except ValueError: return jsonify({"error": "Invalid device id"}), 400
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = Response(events.stream(device_id, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Don't let reverse proxies buffer the stream
+    return response
+
+# --- Instrumentation ---
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Counters, gauges and latency histograms in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/debug/profile', methods=['GET'])
+@app.route('/api/debug/profile/<action>', methods=['POST'])
+def sampling_profile(action=None):
+    """Opt-in sampling profiler (COLDCHAIN_PROFILER=1): POST .../start?interval=0.005, POST .../stop.
+
+    GET returns the folded stacks collected so far (flamegraph.pl / speedscope input).
+    """
+    if os.environ.get('COLDCHAIN_PROFILER') != '1': return jsonify({"error": "Profiler disabled"}), 404
+    if action == 'start':
+        try: interval = float(request.args.get('interval', 0.005))
+        except ValueError: return jsonify({"error": "Invalid 'interval'"}), 400
+        started = profiler.start(interval)
+        return jsonify({"running": True, "started": started, "interval": profiler.interval})
+    if action == 'stop':
+        stopped = profiler.stop()
+        return jsonify({"running": False, "stopped": stopped, "samples": profiler.samples})
+    if action is not None: return jsonify({"error": f"Unknown action '{action}'"}), 404
+    response = Response(profiler.folded(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(profiler.samples)
+    response.headers['X-Profile-Running'] = str(profiler.running).lower()
+    return response
+
+# === Durable Storage & Recovery ===
+def _recover(store):
+    """Rebuilds every device from its latest snapshot plus a replay of the log tail.
+
+    The tail goes through the same vectorised batch path as /api/data/batch,
+    which reproduces sequential ingest exactly, so recovered state matches
+    what was in memory before the restart.
+    """
+    local_tz = LOCAL_TZ
+    replayed = 0
+    for device_id, snap, tail in store.load():
+        state = devices.get(device_id)
+        with state.lock:
+            if snap is not None: restore_state(state, snap)
+            _replay(state, tail, local_tz)
+            replayed += len(tail[0])
+    return replayed
+
+STORE_PATH = os.environ.get('COLDCHAIN_DB_PATH', '') # Opt-in (e.g. coldchain.db): unset/empty = in-memory only, no disk writes
+store = None
+if STORE_PATH:
+    try:
+        store = DurableStore(STORE_PATH, snapshot_every=SNAPSHOT_EVERY)
+        replayed = _recover(store)
+        if len(devices): print(f"💾 Recovered {len(devices)} device(s) from {STORE_PATH} ({replayed} readings replayed).")
+        atexit.register(store.close) # Commit whatever is still queued
+    except Exception as e: print(f"❌ Error opening durable store: {e}"); traceback.print_exc(); store = None
+atexit.register(ingest_queue.join) # Registered after store.close, so it runs first: queued readings reach the log
+if STATE_BACKEND == 'sqlite':
+    if not STORE_PATH: print("❌ COLDCHAIN_STATE_BACKEND=sqlite needs COLDCHAIN_DB_PATH; state stays in this process.")
+    else:
+        try:
+            backend = SQLiteBackend(STORE_PATH)
+            BOOT_ID = backend.id # Same ETags on every worker
+            _sync_all() # Readings other workers logged after our snapshots
+            threading.Thread(target=_follow_shared_log, name='shared-log-follower', daemon=True).start()
+            print(f"🔗 Sharing device state with other workers through {STORE_PATH}")
+        except Exception as e: print(f"❌ Error opening shared state backend: {e}"); traceback.print_exc(); backend = LocalBackend()
+elif STATE_BACKEND != 'local': print(f"❌ Unknown COLDCHAIN_STATE_BACKEND '{STATE_BACKEND}'; state stays in this process.")
+# --- ---
 
 # === Main Execution Block ===
 if __name__ == '__main__':
     print("\n-----------------------------------------")
     print(" Starting Intelligent Cold Chain Monitor ")
     print("-----------------------------------------")
-    if model is None: print("🚨 WARNING: ML Model failed to load. RSL Predictions unavailable.")
-    else: print("👍 ML Model loaded.")
+    if not os.path.exists(model_path): print("🚨 WARNING: ML Model file missing. Model fallback for RSL unavailable.")
+    else: print("👍 ML Model found (loads on first use).")
+    if store: print(f"💾 Durable store: {STORE_PATH}")
+    else: print("💾 In-memory only: set COLDCHAIN_DB_PATH to keep readings across restarts.")
     print("\n🚀 Flask server starting...")
     print(f"   Local: http://127.0.0.1:5000")
     print(f"   Network: http://<Your-IP-Address>:5000")
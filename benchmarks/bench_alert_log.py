@@ -0,0 +1,145 @@
+"""
+Benchmark - /api/alerts from the indexed alert log vs sorting the whole list
+
+Fills one device's alert log with N closed alerts (one every ~10 min of data
+time, high and low mixed) and times what a dashboard poll costs:
+
+1. the newest 50 alerts: the old path sorted every alert by start time on
+   each request; the indexed log slices its start-time index
+2. one type within a 24 h window, and a page 1,000 alerts deep via ?cursor=
+3. GET /api/devices/<id>/alerts?limit=50 end to end (Flask test client),
+   and a cross-origin client paging the whole log through X-Next-Cursor
+
+Then ingests a month (a week with --quick) of per-minute readings with
+1-day retention and reports how many alerts stay in memory versus how many
+were raised, and the per-batch cost of expiry.
+
+Usage: python benchmarks/bench_alert_log.py [--quick]
+"""
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['COLDCHAIN_ALERT_RETENTION_DAYS'] = '1'
+QUICK = '--quick' in sys.argv
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from alert_log import AlertLog, iso_to_us
+
+SIZES = (1_000, 10_000) if QUICK else (1_000, 10_000, 100_000)
+PAGE = 50
+START_US = 1_760_000_000 * 1_000_000
+DAYS = 7 if QUICK else 30  # Retention run
+
+
+def fill(n):
+    """`n` closed alerts, start times ~10 min apart (ISO, device timezone), as plain dicts."""
+    rng = np.random.default_rng(n)
+    starts = START_US + np.cumsum(rng.integers(300, 900, n)) * 1_000_000
+    ends = starts + rng.integers(60, 290, n) * 1_000_000
+    starts_iso = backend.format_timestamps(starts, backend.LOCAL_TZ)
+    ends_iso = backend.format_timestamps(ends, backend.LOCAL_TZ)
+    high = rng.random(n) < 0.5
+    return [{'id': i + 1, 'seq': 10 * (i + 1), 'start_time': s, 'end_time': e,
+             'type': 'High Temperature' if h else 'Low Temperature', 'peak_value': 18.0 if h else 1.0}
+            for i, (s, e, h) in enumerate(zip(starts_iso, ends_iso, high.tolist()))]
+
+
+def best_us(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return min(samples) * 1e6
+
+
+def query_times(n):
+    alerts = fill(n)
+    log = AlertLog(alerts)
+    repeat = 5 if n >= 100_000 else 20
+    mid = iso_to_us(alerts[n // 2]['start_time'])
+    _, deep = log.page(limit=1_000)
+    window = dict(alert_type='High Temperature', from_us=mid, to_us=mid + 86_400_000_000)
+    return {
+        'sorted list, newest 50': best_us(lambda: sorted(alerts, key=lambda x: x['start_time'], reverse=True)[:PAGE], repeat),
+        'index, newest 50': best_us(lambda: log.page(limit=PAGE), repeat),
+        'list scan, type + 24 h': best_us(lambda: sorted(
+            (a for a in alerts if a['type'] == 'High Temperature' and mid <= iso_to_us(a['start_time']) <= mid + 86_400_000_000),
+            key=lambda x: x['start_time'], reverse=True), repeat),
+        'index, type + 24 h': best_us(lambda: log.page(**window), repeat),
+        'index, page at depth 1,000': best_us(lambda: log.page(cursor=deep, limit=PAGE), repeat),
+    }
+
+
+def endpoint_us(n):
+    backend.devices.clear()
+    state = backend.devices.get(f"alerts-{n}")
+    state.add_alerts([{k: v for k, v in a.items() if k != 'id'} for a in fill(n)])
+    client = backend.app.test_client()
+    url = f"/api/devices/{state.device_id}/alerts?limit={PAGE}"
+    assert len(client.get(url).get_json()) == PAGE
+    return statistics.median(best_us(lambda: client.get(url), 1) for _ in range(30))
+
+
+def cross_origin_pages(n):
+    """Pages `n` alerts as the dashboard does (Origin set, cursor read only if CORS exposes it)."""
+    backend.devices.clear()
+    state = backend.devices.get('paged')
+    state.add_alerts([{k: v for k, v in a.items() if k != 'id'} for a in fill(n)])
+    client = backend.app.test_client()
+    url, seen = f"/api/devices/paged/alerts?limit={PAGE}", 0
+    while True:
+        response = client.get(url, headers={'Origin': 'https://dashboard.example'})
+        seen += len(response.get_json())
+        exposed = {h.strip().lower() for h in response.headers.get('Access-Control-Expose-Headers', '').split(',')}
+        cursor = response.headers.get('X-Next-Cursor') if 'x-next-cursor' in exposed else None
+        if cursor is None: return seen
+        url = f"/api/devices/paged/alerts?limit={PAGE}&cursor={cursor}"
+
+
+def retention_run():
+    """DAYS of per-minute readings in hourly batches, 1-day retention."""
+    backend.devices.clear()
+    state = backend.devices.get('retention')
+    rng = np.random.default_rng(3)
+    per_batch = 60
+    expire_s, temp = [], 8.0
+    for b in range(DAYS * 24):
+        steps = rng.uniform(-1.0, 1.0, per_batch) + (rng.random(per_batch) < 0.05) * rng.choice([-8.0, 8.0], per_batch)
+        temps = np.round(np.clip(temp + np.cumsum(steps), -5, 25), 1)
+        temp = float(temps[-1])
+        stamps = START_US + (b * per_batch + np.arange(per_batch)) * 60_000_000
+        with state.lock:
+            backend._ingest_batch(state, temps, np.full(per_batch, 60.0), stamps,
+                                  [None] * per_batch, [None] * per_batch, backend.LOCAL_TZ)
+            t = time.perf_counter()
+            state.alert_log.expire(int(stamps[-1]) - backend.ALERT_RETENTION_US)  # Already done by ingest: timed re-run
+            expire_s.append(time.perf_counter() - t)
+    stats = state.alert_log.stats()
+    return state.alerts_created, len(state.alert_log), sum(t['count'] for t in stats.values()), statistics.median(expire_s)
+
+
+if __name__ == '__main__':
+    print(f"Query latency (best of several runs, µs), page size {PAGE}:\n")
+    results = {n: query_times(n) for n in SIZES}
+    labels = list(results[SIZES[0]])
+    print(f"{'alerts in log':<30}" + ''.join(f"{n:>12,}" for n in SIZES))
+    for label in labels: print(f"  {label:<28}" + ''.join(f"{results[n][label]:>12,.1f}" for n in SIZES))
+    print(f"  {'GET ...alerts?limit=50':<28}" + ''.join(f"{endpoint_us(n):>12,.0f}" for n in SIZES))
+    paged = cross_origin_pages(1_000)
+    print(f"\nCross-origin client paging 1,000 alerts via X-Next-Cursor: {paged:,} received {'✅' if paged == 1_000 else '❌'}")
+
+    created, retained, counted, expire = retention_run()
+    print(f"\n{DAYS} days of per-minute readings, 1-day retention:")
+    print(f"  alerts raised {created:,}, kept in memory {retained:,}, in /alerts/stats {counted:,}"
+          f" {'✅' if counted == created else '❌'}")
+    print(f"  expiry check per batch: {expire * 1e6:.1f} µs (median)")
+    if paged != 1_000 or counted != created: sys.exit(1)
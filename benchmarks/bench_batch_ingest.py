@@ -0,0 +1,81 @@
+"""
+Benchmark - /api/data/batch vs. replaying readings one POST at a time
+
+Replays the same buffered journey (with device timestamps) through both
+paths, checks that history, alert log and latest_data come out identical,
+and reports throughput in readings/sec.
+
+Usage: python benchmarks/bench_batch_ingest.py [--quick]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+
+START_TS = 1_760_000_000  # Epoch seconds of the first buffered reading
+
+
+def make_readings(n, seed=7):
+    """Random-walk journey with excursions in both directions, one reading per minute."""
+    rng = random.Random(seed)
+    temp, out = 8.0, []
+    for i in range(n):
+        temp += rng.uniform(-0.8, 0.8)
+        if rng.random() < 0.05: temp += rng.choice([-1, 1]) * rng.uniform(5, 10)
+        temp = max(-5.0, min(25.0, temp))
+        out.append({"temp": round(temp, 1), "hum": round(rng.uniform(50, 85), 1),
+                    "lat": 27.7 + i * 1e-4, "lng": 85.3, "ts": START_TS + 60 * i})
+    return out
+
+
+def reset_state():
+    backend.devices.clear()
+
+
+def snapshot(client):
+    return (client.get('/api/history').get_json(), client.get('/api/alerts').get_json(),
+            client.get('/api/status').get_json())
+
+
+def run_sequential(client, readings):
+    reset_state()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for r in readings:
+            assert client.post('/api/data', json=r).status_code == 200
+    return time.perf_counter() - start
+
+
+def run_batched(client, readings, batch_size):
+    reset_state()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(0, len(readings), batch_size):
+            assert client.post('/api/data/batch', json=readings[i:i + batch_size]).status_code == 200
+    return time.perf_counter() - start
+
+
+def main():
+    n = 2_000 if '--quick' in sys.argv else 20_000
+    readings = make_readings(n)
+    client = backend.app.test_client()
+
+    seq_s = run_sequential(client, readings)
+    expected = snapshot(client)
+    print(f"Per-reading /api/data: {n / seq_s:>10,.0f} readings/sec")
+    for batch_size in (10, 100, 1_000, 5_000):
+        batch_s = run_batched(client, readings, batch_size)
+        if snapshot(client) != expected:
+            raise AssertionError(f"Batch size {batch_size}: state differs from sequential ingestion")
+        print(f"Batch of {batch_size:>5}:        {n / batch_s:>10,.0f} readings/sec  ({seq_s / batch_s:.1f}x, identical ✅)")
+
+
+if __name__ == '__main__':
+    main()
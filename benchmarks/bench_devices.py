@@ -0,0 +1,111 @@
+"""
+Stress test - 1,000 devices posting concurrently to a threaded server
+
+Starts the app on a threaded Werkzeug server, then has T client threads (each
+with its own keep-alive connection) post readings for 1,000 simulated devices
+at the same time. Reports throughput per thread count and checks that no
+reading was lost or attributed to the wrong device.
+
+Run once with per-device locks (the default) and once with every partition
+sharing a single lock, to show what the partitioning buys. On CPython the
+GIL still serialises the pure-Python parts of ingest, so the lock mainly
+matters for correctness and for time spent outside the GIL (socket I/O,
+NumPy); throughput should hold steady rather than collapse as threads grow.
+
+Usage: python benchmarks/bench_devices.py [--quick]
+"""
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+
+N_DEVICES = 1_000
+THREAD_COUNTS = [1, 4, 16, 32]
+
+
+def start_server():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No per-request access log
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def client_worker(port, device_ids, readings_per_device, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'}
+    for i in range(readings_per_device):
+        for device_id in device_ids:
+            body = json.dumps({"device_id": device_id, "temp": 8.0 + (i % 10) * 0.9, "hum": 60.0})
+            conn.request('POST', '/api/data', body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200: errors.append(resp.status)
+    conn.close()
+
+
+def run(port, n_threads, readings_per_device):
+    backend.devices.clear()
+    device_ids = [f"truck-{i:04d}" for i in range(N_DEVICES)]
+    shards = [device_ids[t::n_threads] for t in range(n_threads)]
+    errors = []
+    threads = [threading.Thread(target=client_worker, args=(port, shard, readings_per_device, errors))
+               for shard in shards]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+
+    total = N_DEVICES * readings_per_device
+    lengths = {s.device_id: len(s.history) for s in backend.devices.states()}
+    consistent = (not errors and len(lengths) == N_DEVICES
+                  and all(v == min(readings_per_device, backend.HISTORY_MAX_LEN) for v in lengths.values()))
+    return total / elapsed, consistent
+
+
+@contextlib.contextmanager
+def shared_lock():
+    """Makes every new partition use one global lock (the pre-partitioning behaviour)."""
+    lock = threading.Lock()
+    original = backend.devices._factory
+    def factory(device_id):
+        state = original(device_id)
+        state.lock = lock
+        return state
+    backend.devices._factory = factory
+    try: yield
+    finally: backend.devices._factory = original
+
+
+def main():
+    readings_per_device = 2 if '--quick' in sys.argv else 5
+    server = start_server()
+    port = server.server_port
+    print(f"{N_DEVICES} devices x {readings_per_device} readings\n")
+    print(f"{'Threads':>8} {'per-device locks':>18} {'single global lock':>20}")
+    print("-" * 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = []
+        for n_threads in THREAD_COUNTS:
+            partitioned = run(port, n_threads, readings_per_device)
+            with shared_lock():
+                global_lock = run(port, n_threads, readings_per_device)
+            results.append((n_threads, partitioned, global_lock))
+    for n_threads, (p_rate, p_ok), (g_rate, g_ok) in results:
+        print(f"{n_threads:>8} {p_rate:>12,.0f} req/s {'✅' if p_ok else '❌'} {g_rate:>14,.0f} req/s {'✅' if g_ok else '❌'}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
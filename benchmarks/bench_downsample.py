@@ -0,0 +1,85 @@
+"""
+Benchmark - /api/history?points=N on a 1M-reading journey
+
+Loads one device with a million readings (1 Hz, ~11.6 days) and a handful of
+short temperature excursions, then times chart queries at several zoom
+levels against shipping the raw history. Checks that every excursion peak
+is still visible in each downsampled series (LTTB keeps the shape but does
+not guarantee it; min/max buckets and rollups do).
+
+Usage: python benchmarks/bench_downsample.py [--quick]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+QUICK = '--quick' in sys.argv
+N = 200_000 if QUICK else 1_000_000
+os.environ['HISTORY_MAX_LEN'] = str(N)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+
+START_TS = 1_760_000_000
+SPIKES = 8  # Single-reading excursions to 25-30 °C
+
+
+def load_journey():
+    rng = np.random.default_rng(5)
+    temps = np.round(np.clip(6 + np.cumsum(rng.normal(0, 0.02, N)), 2.5, 11.5), 2)
+    spike_at = np.r_[rng.choice(np.arange(1000, N - 4000), SPIKES - 1, replace=False), N - 1800]  # One in the last hour
+    temps[spike_at] = np.round(rng.uniform(25, 30, SPIKES), 2)
+    hums = np.round(rng.uniform(50, 85, N), 1)
+    stamps = (START_TS + np.arange(N)) * 1_000_000
+    state = backend.devices.get('long-haul')
+    tz = backend.pytz.timezone(backend.TIMEZONE)
+    start = time.perf_counter()
+    with state.lock:
+        for k in range(0, N, 100_000):
+            n = len(temps[k:k + 100_000])
+            backend._ingest_batch(state, temps[k:k + 100_000], hums[k:k + 100_000], stamps[k:k + 100_000],
+                                  [27.7] * n, [85.3] * n, tz)
+    return START_TS + np.sort(spike_at), time.perf_counter() - start
+
+
+def timed_get(client, url, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        best = min(best, time.perf_counter() - start)
+    return response, best
+
+
+if __name__ == '__main__':
+    spike_ts, load_s = load_journey()
+    client = backend.app.test_client()
+    print(f"Loaded {N:,} readings in {load_s:.2f} s (ingest incl. rollups: {N / load_s:,.0f} readings/sec)\n")
+    end = START_TS + N
+    queries = [  # (label, query string, window start, repeats)
+        ("Raw history (no points)", "", START_TS, 1),
+        ("Whole journey, 1000 pts", "&points=1000", START_TS, 5),
+        ("Whole journey, 200 pts", "&points=200", START_TS, 5),
+        ("Last 24 h, 1000 pts", f"&points=1000&from={end - 86_400}", end - 86_400, 5),
+        ("Last 1 h, 1000 pts (minmax)", f"&points=1000&from={end - 3_600}", end - 3_600, 5),
+        ("Last 1 h, 1000 pts (lttb)", f"&points=1000&from={end - 3_600}&mode=lttb", end - 3_600, 5),
+    ]
+    print(f"{'Query':<30}{'source':>12}{'points':>10}{'bytes':>12}{'time':>11}  excursions")
+    for label, query, window_start, repeat in queries:
+        response, seconds = timed_get(client, "/api/history?device=long-haul" + query, repeat)
+        rows = json.loads(response.data)
+        # Every excursion in the window must stay visible: the point (or bucket) covering it reads >= 25 °C
+        starts = np.array([datetime.fromisoformat(r['timestamp']).timestamp() for r in rows])
+        tops = np.array([r.get('temp_max', r['temperature']) for r in rows])
+        expected = spike_ts[spike_ts >= window_start]
+        covering = np.searchsorted(starts, expected, side='right') - 1
+        note = f"{int((tops[covering] >= 25).sum())}/{len(expected)} visible"
+        print(f"{label:<30}{response.headers.get('X-Downsample', 'raw'):>12}{len(rows):>10,}"
+              f"{len(response.data):>12,}{seconds * 1000:>9.1f}ms  {note}")
@@ -0,0 +1,119 @@
+"""
+Benchmark - /api/fleet/summary from rollups vs rescanning every history
+
+Loads a fleet of devices with a day of per-minute readings each, then times
+the fleet overview (totals, top-10 worst shipments, hourly excursion
+minutes) for 1 h, 6 h and 24 h windows plus a ragged 2 h 23 min one: answered from the fleet-wide
+1 min / 1 h rollup tables, and - as the baseline - by filtering every
+device's raw history for the window and aggregating it.
+
+Finally checks that batch uploads book exactly the fleet cells that posting
+the same readings one by one does (alert openings included).
+
+Usage: python benchmarks/bench_fleet_summary.py [--quick]
+"""
+import contextlib
+import heapq
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['HISTORY_MAX_LEN'] = '1440'
+QUICK = '--quick' in sys.argv
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from alert_log import iso_to_us
+
+DEVICES = 200 if QUICK else 2_000
+READINGS = 1_440  # One day at one reading per minute
+START = 1_760_000_000 - 1_760_000_000 % 3600
+
+
+def load_fleet(client):
+    rng = np.random.default_rng(11)
+    stamps = START + np.arange(READINGS) * 60
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for d in range(DEVICES):
+            temps = np.round(7 + np.cumsum(rng.normal(0, 0.4, READINGS)).clip(-10, 12), 2)
+            hums = np.round(rng.uniform(50, 85, READINGS), 1)
+            readings = [{'temp': float(a), 'hum': float(b), 'ts': int(s)} for a, b, s in zip(temps, hums, stamps)]
+            client.post('/api/data/batch', json={'device_id': f'truck-{d:04d}', 'readings': readings})
+    return time.perf_counter() - t
+
+
+def rescan(from_us, to_us, k=10):
+    """Baseline: the same overview computed from raw history columns."""
+    rows, hourly = [], {}
+    for state in backend.devices.states():
+        with state.lock:
+            history = state.history
+            lo, hi = history.index_range(from_us, to_us)
+            if hi <= lo: continue
+            stamps = history.column('timestamp_us')[lo:hi]
+            temps = history.column('temperature')[lo:hi]
+            rsl = history.column('rsl')[lo:hi]
+            out = (temps > backend.ALERT_TEMP_HIGH) | (temps < backend.ALERT_TEMP_LOW)
+            alerts = sum(1 for a in state.alert_log if from_us <= iso_to_us(a['start_time']) <= to_us)
+            rows.append({'device_id': state.device_id, 'worst_rsl_days': float(np.nanmin(rsl)),
+                         'excursion_minutes': int(out.sum()) * 60, 'alerts_opened': alerts,
+                         'temp_max': float(temps.max()), 'temp_min': float(temps.min())})
+            hours = stamps - stamps % 3_600_000_000
+            for h, o in zip(*np.unique(hours[out], return_counts=True)): hourly[h] = hourly.get(h, 0) + int(o) * 60
+    return heapq.nsmallest(k, rows, key=lambda r: r['worst_rsl_days']), hourly
+
+
+def batch_matches_sequential(client):
+    """Checks that a batch upload books the same fleet cells as posting its readings one by one."""
+    rng = np.random.default_rng(12)
+    series = [[8, 16, 18, 20, 8, 8]] + [np.round(7 + np.cumsum(rng.normal(0, 2.5, 240)), 2).tolist() for _ in range(4)]
+    base = START + READINGS * 60 - 5 * 3600  # Within the 1 min ring's reach
+    mismatched = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, temps in enumerate(series):
+            readings = [{'temp': float(t), 'hum': 60.0, 'ts': base + j * 60} for j, t in enumerate(temps)]
+            for reading in readings: client.post('/api/data', json=dict(reading, device_id=f'seq-{i}'))
+            client.post('/api/data/batch', json={'device_id': f'batch-{i}', 'readings': readings})
+            one, batch = (backend.devices.get(f'{kind}-{i}').summary.export() for kind in ('seq', 'batch'))
+            for level, cells in one.items():
+                for field, values in cells.items():
+                    if not np.allclose(values, batch[level][field], rtol=1e-12, equal_nan=True):
+                        mismatched.append((i, level, field))
+    return mismatched
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples)
+
+
+if __name__ == '__main__':
+    client = backend.app.test_client()
+    load_s = load_fleet(client)
+    print(f"{DEVICES:,} devices x {READINGS:,} readings loaded in {load_s:.1f} s "
+          f"({DEVICES * READINGS / load_s:,.0f} readings/s incl. rollup upkeep)\n")
+    print(f"{'window':<8}{'rollups':>12}{'rescan':>12}{'speed-up':>10}")
+    last = START + READINGS * 60
+    for label, start, end in (('1 h', last - 3600, last), ('6 h', last - 6 * 3600, last),
+                              ('24 h', last - 24 * 3600, last), ('2h23m', last - 3 * 3600 + 420, last - 1_020)):
+        url = f"/api/fleet/summary?from={start}&to={end - 1}&k=10"
+        body = client.get(url).get_json()
+        worst, _ = rescan(start * 1_000_000, (end - 1) * 1_000_000)
+        assert [r['device_id'] for r in body['worst']] == [r['device_id'] for r in worst]
+        rollup_s = timed(lambda: client.get(url), 5)
+        rescan_s = timed(lambda: rescan(start * 1_000_000, (end - 1) * 1_000_000), 3)
+        print(f"{label:<8}{rollup_s * 1000:>10.1f}ms{rescan_s * 1000:>10.1f}ms{rescan_s / rollup_s:>9.1f}x")
+
+    mismatched = batch_matches_sequential(client)
+    print(f"\nBatch vs one-by-one ingest, fleet cells: {'✅ identical' if not mismatched else f'❌ differ {mismatched[:5]}'}")
+    if mismatched: sys.exit(1)
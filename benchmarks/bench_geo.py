@@ -0,0 +1,142 @@
+"""
+Benchmark - geofence lookups and GPS route simplification
+
+1. Per-reading geofence checks: grid index vs testing every zone, for
+   fleets of 100 to 10,000 zones (single fixes and 10k-fix batches).
+2. Simplifying a multi-day route (one fix every 10 s, ~3 m GPS jitter)
+   with Douglas-Peucker and Visvalingam-Whyatt at several tolerances.
+3. GET /api/track for that route: raw vs simplified, first load vs cached
+   vs 304 revalidation.
+4. A zone PUT around a parked device logs its enter (and removing the zone
+   its exit) right away, without the device moving.
+
+Usage: python benchmarks/bench_geo.py [--quick]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+QUICK = '--quick' in sys.argv
+DAYS = 1 if QUICK else 3
+os.environ['COLDCHAIN_TRACK_MAX_POINTS'] = str(DAYS * 8640)
+os.environ['HISTORY_MAX_LEN'] = str(DAYS * 8640)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from geo import Geofence, GeofenceIndex, douglas_peucker, project, visvalingam
+
+ZONE_COUNTS = (100, 1_000) if QUICK else (100, 1_000, 10_000)
+BOX = (26.3, 80.0, 30.4, 88.2)  # Roughly Nepal: lat_min, lng_min, lat_max, lng_max
+
+
+def random_zones(n, rng):
+    zones = []
+    for i in range(n):
+        lat, lng = rng.uniform(BOX[0], BOX[2]), rng.uniform(BOX[1], BOX[3])
+        if i % 2: zones.append(Geofence(f"zone-{i}", lat=lat, lng=lng, radius_m=rng.uniform(200, 5_000)))
+        else:
+            r = rng.uniform(0.005, 0.05)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 6))
+            zones.append(Geofence(f"zone-{i}", polygon=np.c_[lat + r * np.sin(angles), lng + r * np.cos(angles)]))
+    return zones
+
+
+def linear_locate(zones, lats, lngs):
+    """Baseline: every zone tested against every point (vectorised over points)."""
+    hits = [[] for _ in range(len(lats))]
+    for zone in zones:
+        for p in np.flatnonzero(zone.contains(lats, lngs)).tolist(): hits[p].append(zone.id)
+    return [tuple(sorted(h)) for h in hits]
+
+
+def best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def road_route(n, rng):
+    """A vehicle route: smooth heading changes at ~40 km/h, fixes every 10 s with GPS jitter."""
+    heading = np.cumsum(rng.normal(0, 0.08, n))
+    step_m = rng.uniform(80, 140, n)
+    north, east = np.cumsum(step_m * np.cos(heading)), np.cumsum(step_m * np.sin(heading))
+    lats = 27.7 + north / 111_195 + rng.normal(0, 3 / 111_195, n)
+    lngs = 85.3 + east / (111_195 * np.cos(np.radians(27.7))) + rng.normal(0, 3 / 98_500, n)
+    return lats, lngs
+
+
+def parked_device_events(client):
+    """PUTs a zone around a stationary device, then an empty zone set; returns the event types logged."""
+    parked = [{'temp': 6.0, 'hum': 60.0, 'ts': 1_760_000_000 + 60 * i, 'lat': 27.7, 'lng': 85.3} for i in range(3)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.post('/api/data/batch', json={'device_id': 'parked', 'readings': parked})
+        client.put('/api/geofences', json=[{'id': 'depot', 'lat': 27.7, 'lng': 85.3, 'radius_m': 500}])
+        entered = [e['type'] for e in client.get('/api/geofence-events?device=parked').get_json()]
+        client.put('/api/geofences', json=[])
+        log = client.get('/api/geofence-events?device=parked').get_json()
+    return entered, [e['type'] for e in reversed(log)]
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(7)
+
+    print("Geofence checks (circles + hexagons over ~150,000 km²):")
+    print(f"{'zones':>8}{'grid 1 fix':>14}{'scan 1 fix':>14}{'grid 10k':>12}{'scan 10k':>12}  (10k = scattered fixes, worst case for the grid)")
+    lats, lngs = rng.uniform(BOX[0], BOX[2], 10_000), rng.uniform(BOX[1], BOX[3], 10_000)
+    for n in ZONE_COUNTS:
+        zones = random_zones(n, rng)
+        index = GeofenceIndex(zones)
+        assert index.locate_many(lats[:500], lngs[:500]) == linear_locate(zones, lats[:500], lngs[:500])
+        single = 200
+        grid_one = best_of(lambda: [index.locate(lats[i], lngs[i]) for i in range(single)]) / single
+        scan_one = best_of(lambda: [linear_locate(zones, lats[i:i + 1], lngs[i:i + 1]) for i in range(20)], 1) / 20
+        grid_batch = best_of(lambda: index.locate_many(lats, lngs))
+        scan_batch = best_of(lambda: linear_locate(zones, lats, lngs), 1)
+        print(f"{n:>8,}{grid_one * 1e6:>12.1f}µs{scan_one * 1e6:>12.1f}µs{grid_batch * 1000:>10.1f}ms"
+              f"{scan_batch * 1000:>10.1f}ms")
+
+    n = DAYS * 8640
+    route_lats, route_lngs = road_route(n, rng)
+    x, y = project(route_lats, route_lngs)
+    print(f"\nRoute simplification ({DAYS} day(s), {n:,} fixes):")
+    print(f"{'tolerance':>10}{'DP points':>12}{'DP time':>11}{'VW points':>12}{'VW time':>11}")
+    for tolerance in (5, 10, 50):
+        dp = douglas_peucker(x, y, tolerance)
+        vw = visvalingam(x, y, tolerance)
+        t_dp = best_of(lambda: douglas_peucker(x, y, tolerance))
+        t_vw = best_of(lambda: visvalingam(x, y, tolerance), 1)
+        print(f"{tolerance:>8} m{len(dp):>12,}{t_dp * 1000:>9.1f}ms{len(vw):>12,}{t_vw * 1000:>9.1f}ms")
+
+    client = backend.app.test_client()
+    stamps = 1_760_000_000 + np.arange(n) * 10
+    readings = [{'temp': 6.0, 'hum': 60.0, 'ts': int(t), 'lat': float(a), 'lng': float(b)}
+                for t, a, b in zip(stamps, route_lats, route_lngs)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.post('/api/data/batch', json={'device_id': 'truck', 'readings': readings})
+
+    print(f"\nGET /api/track?device=truck ({n:,} stored fixes):")
+    for label, query in (("raw (tolerance=0)", "tolerance=0"), ("simplified, first load", "tolerance=10"),
+                         ("simplified, cached", "tolerance=10")):
+        t = time.perf_counter()
+        response = client.get(f"/api/track?device=truck&{query}")
+        elapsed = time.perf_counter() - t
+        print(f"  {label:<26}{len(response.get_json()['points']):>8,} points {len(response.data):>11,} bytes"
+              f"{elapsed * 1000:>9.1f} ms")
+    etag = response.headers['ETag']
+    t = time.perf_counter()
+    response = client.get("/api/track?device=truck&tolerance=10", headers={'If-None-Match': etag})
+    print(f"  {'revalidated':<26}{'(' + str(response.status_code) + ')':>8} {'':>18}"
+          f"{(time.perf_counter() - t) * 1000:>9.1f} ms")
+
+    entered, both = parked_device_events(client)
+    ok = entered == ['enter'] and both == ['enter', 'exit']
+    print(f"\nZone added around a parked device: {entered} after the PUT, {both} after removing it {'✅' if ok else '❌'}")
+    if not ok: sys.exit(1)
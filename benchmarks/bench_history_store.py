@@ -0,0 +1,98 @@
+"""
+Micro-benchmark - Columnar ring buffer vs. list-of-dicts history
+
+Times steady-state append+evict and `/api/history` serialisation at several
+retention sizes, and reports bytes per retained reading for both layouts.
+
+Usage: python benchmarks/bench_history_store.py [--quick]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+
+from history_store import HistoryRing, to_epoch_us
+
+TZ = pytz.timezone('Asia/Kathmandu')
+SIZES = [200, 10_000, 100_000, 1_000_000]
+LIST_MAX_SIZE = 100_000  # pop(0) on a million-item list is too slow to bother
+OPS = 2_000
+
+
+def fill_ring(size):
+    ring = HistoryRing(size, hours_dtype=int)
+    base = to_epoch_us(datetime.now(TZ))
+    for i in range(size):
+        ring.append(base + i * 1_000_000, i, 8.0 + (i % 7) * 0.1, 60.0, 19.5)
+    return ring, base
+
+
+def fill_list(size):
+    now = datetime.now(TZ).isoformat()
+    return [{'timestamp': now, 'hours': i, 'temperature': 8.0 + (i % 7) * 0.1, 'humidity': 60.0, 'rsl': 19.5}
+            for i in range(size)]
+
+
+def bytes_per_reading(fill, size):
+    tracemalloc.start()
+    obj = fill(size)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return used / size
+
+
+def bench_append(size):
+    ring, base = fill_ring(size)
+    start = time.perf_counter()
+    for i in range(OPS):
+        ring.append(base + (size + i) * 1_000_000, size, 9.0, 61.0)
+        ring.set_last('rsl', 19.0)
+    ring_us = (time.perf_counter() - start) / OPS * 1e6
+
+    list_us = None
+    if size <= LIST_MAX_SIZE:
+        history = fill_list(size)
+        now = datetime.now(TZ).isoformat()
+        start = time.perf_counter()
+        for _ in range(OPS):
+            history.append({'timestamp': now, 'hours': size, 'temperature': 9.0, 'humidity': 61.0, 'rsl': None})
+            if len(history) > size: history.pop(0)
+            history[-1]['rsl'] = 19.0
+        list_us = (time.perf_counter() - start) / OPS * 1e6
+    return ring_us, list_us
+
+
+def bench_serialise(size):
+    ring, _ = fill_ring(size)
+    start = time.perf_counter()
+    ring.to_json(TZ)
+    ring_ms = (time.perf_counter() - start) * 1e3
+    history = fill_list(size)
+    start = time.perf_counter()
+    json.dumps(history, sort_keys=True)
+    list_ms = (time.perf_counter() - start) * 1e3
+    return ring_ms, list_ms
+
+
+def main():
+    sizes = SIZES[:3] if '--quick' in sys.argv else SIZES
+    print(f"Memory per reading: ring {bytes_per_reading(lambda n: fill_ring(n)[0], 100_000):.0f} B, "
+          f"list-of-dicts {bytes_per_reading(fill_list, 100_000):.0f} B\n")
+    print(f"{'Retained':>10} {'ring append µs':>15} {'list append µs':>15} {'ring JSON ms':>13} {'list JSON ms':>13}")
+    print("-" * 70)
+    for size in sizes:
+        ring_us, list_us = bench_append(size)
+        ring_ms, list_ms = bench_serialise(size)
+        list_col = f"{list_us:>15.2f}" if list_us is not None else f"{'(skipped)':>15}"
+        print(f"{size:>10,} {ring_us:>15.2f} {list_col} {ring_ms:>13.1f} {list_ms:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
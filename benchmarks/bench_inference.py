@@ -0,0 +1,145 @@
+"""
+Benchmark - RSL model loading and inference
+
+Uses rsl_predictor_model.joblib when present, otherwise fits a
+RandomForestRegressor on synthetic features (same feature order) and dumps it
+to a temp dir. Reports:
+  - cold start: eager joblib.load at import vs LazyModel (mmap on/off)
+  - feature extraction: pandas rolling over the history vs rolling_features()
+  - inference under N concurrent callers: one-row model.predict per request
+    vs the MicroBatcher, as latency p50/p99 and throughput
+
+Usage: python benchmarks/bench_inference.py [--quick]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+QUICK = '--quick' in sys.argv
+
+from model_service import FEATURE_ORDER, LazyModel, MicroBatcher, feature_frame, rolling_features
+from history_store import HistoryRing
+from kpi_engine import StreamingKPIs
+
+THREADS = 16
+REQUESTS_PER_THREAD = 20 if QUICK else 100
+HISTORY_LEN = 20_000
+
+
+def model_path():
+    path = os.path.join(ROOT, 'rsl_predictor_model.joblib')
+    if os.path.exists(path): return path, "rsl_predictor_model.joblib"
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    rng = np.random.default_rng(1)
+    X = pd.DataFrame(rng.uniform(0, 30, (5_000, len(FEATURE_ORDER))), columns=FEATURE_ORDER)
+    y = 15 - 0.3 * X['avg_temp_last_6h'] - 0.05 * X['journey_time_hours'] + rng.normal(0, 0.2, len(X))
+    model = RandomForestRegressor(n_estimators=50 if QUICK else 100, max_depth=12, random_state=0).fit(X, y)
+    path = os.path.join(tempfile.mkdtemp(), 'rsl_model.joblib')
+    joblib.dump(model, path)
+    return path, f"synthetic RandomForestRegressor ({model.n_estimators} trees)"
+
+
+def cold_start(path):
+    """Fresh interpreter: import + load (+ first prediction), as a worker would on boot."""
+    snippet = {
+        'eager joblib.load': "import joblib; m = joblib.load(P)",
+        'LazyModel (no mmap)': "from model_service import LazyModel; m = LazyModel(P).get()",
+        "LazyModel (mmap 'r')": "from model_service import LazyModel; m = LazyModel(P, mmap_mode='r').get()",
+        'LazyModel, never used': "from model_service import LazyModel; m = LazyModel(P)",
+    }
+    print("Cold start (fresh process, best of 3):")
+    for label, code in snippet.items():
+        script = f"import time, sys; t = time.perf_counter(); sys.path.insert(0, {ROOT!r}); P = {path!r}\n" \
+                 f"import contextlib, io\nwith contextlib.redirect_stdout(io.StringIO()): {code}\n" \
+                 f"print(time.perf_counter() - t)"
+        best = min(float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                        check=True).stdout.split()[-1]) for _ in range(3))
+        print(f"  {label:<26}{best * 1000:>9.0f} ms")
+
+
+def feature_extraction():
+    import pandas as pd
+    rng = np.random.default_rng(2)
+    history, kpis = HistoryRing(HISTORY_LEN), StreamingKPIs(8.0, 2.0, 8.0, 1.0)
+    temps = rng.uniform(2, 14, HISTORY_LEN)
+    history.append_many(np.arange(HISTORY_LEN) * 3_600_000_000, np.arange(HISTORY_LEN, dtype=float),
+                        temps, np.full(HISTORY_LEN, 60.0))
+    for t in temps.tolist(): kpis.push(t)
+    start = time.perf_counter()
+    for _ in range(50):
+        frame = pd.DataFrame({'temperature': history.column('temperature')})
+        old = (frame['temperature'].rolling(6, min_periods=1).mean().iloc[-1],
+               frame['temperature'].rolling(6, min_periods=1).max().iloc[-1],
+               frame['temperature'].rolling(6, min_periods=1).min().iloc[-1],
+               float((frame['temperature'] > 8.0).sum() * 1.0))
+    old_s = (time.perf_counter() - start) / 50
+    start = time.perf_counter()
+    for _ in range(50): new = rolling_features(history, kpis, 6)
+    new_s = (time.perf_counter() - start) / 50
+    assert np.allclose(old, new), (old, new)
+    print(f"\nFeature extraction ({HISTORY_LEN:,}-reading history):")
+    print(f"  pandas rolling (old)   {old_s * 1e6:>10.0f} µs")
+    print(f"  rolling_features       {new_s * 1e6:>10.1f} µs   ({old_s / new_s:.0f}x)")
+
+
+def concurrent(predict):
+    """Runs THREADS callers, each making REQUESTS_PER_THREAD predictions; returns (latencies, seconds)."""
+    rng = np.random.default_rng(3)
+    rows = rng.uniform(0, 30, (THREADS, REQUESTS_PER_THREAD, len(FEATURE_ORDER)))
+    latencies = [[] for _ in range(THREADS)]
+    barrier = threading.Barrier(THREADS + 1)
+
+    def caller(k):
+        barrier.wait()
+        for row in rows[k]:
+            start = time.perf_counter()
+            predict(row)
+            latencies[k].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=caller, args=(k,)) for k in range(THREADS)]
+    for t in threads: t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads: t.join()
+    return np.concatenate(latencies), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    path, source = model_path()
+    print(f"Model: {source}\n")
+    cold_start(path)
+    feature_extraction()
+
+    lazy = LazyModel(path)
+    model = lazy.get()
+    lock = threading.Lock()  # sklearn estimators are not documented as thread-safe for concurrent predict
+
+    def per_request(row):
+        with lock: return float(model.predict(feature_frame(model, row[None, :]))[0])
+
+    batcher = MicroBatcher(lazy, max_batch=64, max_wait=0.002)
+    check = np.random.default_rng(4).uniform(0, 30, len(FEATURE_ORDER))
+    assert abs(per_request(check) - batcher.predict(check)) < 1e-9
+
+    total = THREADS * REQUESTS_PER_THREAD
+    print(f"\nInference, {THREADS} concurrent callers x {REQUESTS_PER_THREAD} predictions:")
+    print(f"  {'':<22}{'p50':>10}{'p99':>10}{'preds/s':>12}")
+    results = {}
+    for label, fn in (("per-request predict", per_request), ("MicroBatcher", batcher.predict)):
+        latencies, seconds = concurrent(fn)
+        results[label] = total / seconds
+        print(f"  {label:<22}{np.percentile(latencies, 50) * 1000:>8.1f}ms{np.percentile(latencies, 99) * 1000:>8.1f}ms"
+              f"{total / seconds:>12,.0f}")
+    stats = batcher.stats
+    print(f"  batches: {stats['batches']:,} (mean {stats['requests'] / stats['batches']:.1f} rows, "
+          f"max {stats['max_batch_seen']}); throughput "
+          f"{results['MicroBatcher'] / results['per-request predict']:.1f}x")
@@ -0,0 +1,136 @@
+"""
+Benchmark - sensor-side /api/data latency during processing spikes, sync vs 202-queued
+
+A threaded server ingests steady per-device sensor traffic while a gateway
+repeatedly uploads large /api/data/batch backlogs for the same devices
+(each holds the device lock for a long vectorised pass). Synchronous posts
+queue behind those passes; `Prefer: respond-async` posts are validated,
+queued and acknowledged with 202, so sensor latency should stay flat.
+
+A final burst phase stalls one device (its lock held, as by a long batch)
+while posts pour in, to show 429 + Retry-After once the small queue is
+full, and checks that every accepted reading was applied afterwards.
+
+Usage: python benchmarks/bench_ingest_queue.py [--quick]
+"""
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['HISTORY_MAX_LEN'] = '500000'
+os.environ['COLDCHAIN_INGEST_QUEUE_SIZE'] = '2000'
+QUICK = '--quick' in sys.argv
+
+from werkzeug.serving import make_server
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+
+DEVICES = 4
+RATE_PER_DEVICE = 20  # Sensor posts per second per device
+DURATION = 4 if QUICK else 10
+SPIKE_READINGS = 20_000 if QUICK else 50_000
+
+
+def start_server():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sensor(port, device_id, prefer_async, stop, latencies):
+    """Posts at RATE_PER_DEVICE over a keep-alive connection, recording latency from the scheduled time."""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'}
+    if prefer_async: headers['Prefer'] = 'respond-async'
+    rng = np.random.default_rng(hash(device_id) % 2**32)
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        delay = scheduled - time.perf_counter()
+        if delay > 0: time.sleep(delay)
+        body = json.dumps({'device_id': device_id, 'temp': round(float(rng.uniform(4, 10)), 1), 'hum': 60.0})
+        conn.request('POST', '/api/data', body, headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - scheduled)
+        assert response.status in (200, 202), response.status
+        scheduled += 1 / RATE_PER_DEVICE
+
+
+def gateway(port, stop):
+    """Uploads SPIKE_READINGS-reading backlogs for each device in turn."""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    readings = [{'temp': round(6 + (i % 50) / 10, 1), 'hum': 60.0} for i in range(SPIKE_READINGS)]
+    k = 0
+    while not stop.is_set():
+        body = json.dumps({'device_id': f'sensor-{k % DEVICES}', 'readings': readings})
+        conn.request('POST', '/api/data/batch', body, {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+        k += 1
+
+
+def run(port, prefer_async):
+    stop = threading.Event()
+    latencies = [[] for _ in range(DEVICES)]
+    threads = [threading.Thread(target=sensor, args=(port, f'sensor-{d}', prefer_async, stop, latencies[d]))
+               for d in range(DEVICES)] + [threading.Thread(target=gateway, args=(port, stop))]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads: t.start()
+        time.sleep(DURATION)
+        stop.set()
+        for t in threads: t.join()
+        backend.ingest_queue.join()
+    return np.concatenate(latencies) * 1000
+
+
+def burst(port, n=6000, senders=6):
+    """Fires async posts at a stalled device as fast as possible; counts 202s and 429s."""
+    codes, retry_after = {}, set()
+    lock = threading.Lock()
+
+    def send(count):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        for _ in range(count):
+            conn.request('POST', '/api/data', json.dumps({'device_id': 'burst', 'temp': 7.0, 'hum': 60.0}),
+                         {'Content-Type': 'application/json', 'Prefer': 'respond-async'})
+            response = conn.getresponse()
+            response.read()
+            with lock:
+                codes[response.status] = codes.get(response.status, 0) + 1
+                if response.status == 429: retry_after.add(response.getheader('Retry-After'))
+
+    state = backend.devices.get('burst')
+    with contextlib.redirect_stdout(io.StringIO()):
+        with state.lock:  # The worker blocks on this device while the posts pile up
+            threads = [threading.Thread(target=send, args=(n // senders,)) for _ in range(senders)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        backend.ingest_queue.join()
+    return codes, retry_after, state.history.last_seq
+
+
+if __name__ == '__main__':
+    server = start_server()
+    print(f"{DEVICES} sensors x {RATE_PER_DEVICE}/s for {DURATION}s, gateway uploading "
+          f"{SPIKE_READINGS:,}-reading backlogs to the same devices\n")
+    print(f"{'mode':<24}{'posts':>8}{'p50':>10}{'p99':>10}{'max':>10}")
+    for label, prefer_async in (("synchronous (200)", False), ("queued (202)", True)):
+        lat = run(server.server_port, prefer_async)
+        print(f"{label:<24}{len(lat):>8,}{np.percentile(lat, 50):>8.1f}ms{np.percentile(lat, 99):>8.1f}ms"
+              f"{lat.max():>8.1f}ms")
+    codes, retry_after, applied = burst(server.server_port)
+    print(f"\nBurst into a {backend.ingest_queue.capacity:,}-reading queue: {codes.get(202, 0):,} x 202, "
+          f"{codes.get(429, 0):,} x 429 (Retry-After: {', '.join(sorted(retry_after)) or '-'}); "
+          f"applied {applied:,} of {codes.get(202, 0):,} accepted")
+    assert applied == codes.get(202, 0)
+    server.shutdown()
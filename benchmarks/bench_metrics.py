@@ -0,0 +1,83 @@
+"""
+Benchmark - instrumentation overhead on the ingest path
+
+Posts the same readings through the Flask test client with metrics on and
+off in many short back-to-back pairs (alternating which goes first) and
+reports the geometric mean of the paired ratios: drift between rounds on a
+shared machine is larger than the effect, so on a noisy host this is only
+good to a couple of percent. The budget verdict therefore comes from timing
+the instrumentation primitives themselves (Stopwatch laps + flush,
+Counter.inc) and pricing one request's worth of them. The budget is < 2%.
+
+Usage: python benchmarks/bench_metrics.py [--quick]
+"""
+import contextlib
+import io
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from metrics import Registry, Stopwatch
+
+QUICK = '--quick' in sys.argv
+ROUNDS = 20 if QUICK else 300
+PER_ROUND = 200
+BUDGET = 0.02
+STAGES = ('parse', 'lock_wait', 'history', 'predict', 'rollups', 'geo', 'alerts', 'fleet', 'kpis', 'persist', 'publish')
+
+
+def post_round(client, enabled, start):
+    backend.metrics.enabled = enabled
+    payloads = [{'device_id': 'bench', 'temp': 4 + (i % 17), 'hum': 60.0} for i in range(start, start + PER_ROUND)]
+    with contextlib.redirect_stdout(io.StringIO()):  # receive_data prints every reading
+        t = time.perf_counter()
+        for payload in payloads: client.post('/api/data', json=payload)
+        return (time.perf_counter() - t) / PER_ROUND
+
+
+def primitive_costs(n=200_000):
+    registry = Registry()
+    hist = registry.histogram('h', 'h', ['path', 'stage'])
+    counter = registry.counter('c', 'c', ['path'])
+    t = time.perf_counter()
+    for _ in range(n // 9):  # One request's worth of laps per stopwatch
+        watch = Stopwatch(hist, 'single')
+        for stage in STAGES: watch.lap(stage)
+        watch.stop()
+    lap = (time.perf_counter() - t) / (n // 9 * 9)
+    t = time.perf_counter()
+    for _ in range(n): counter.inc('single')
+    inc = (time.perf_counter() - t) / n
+    return lap, inc
+
+
+if __name__ == '__main__':
+    client = backend.app.test_client()
+    post_round(client, True, 0)  # Warm-up: device creation, history fill
+    on, off = [], []
+    for r in range(ROUNDS):  # Alternate which goes first so drift doesn't favour either
+        for enabled in ((False, True) if r % 2 == 0 else (True, False)):
+            (on if enabled else off).append(post_round(client, enabled, r * PER_ROUND))  # Same readings
+    backend.metrics.enabled = True
+    t_on, t_off = statistics.median(on), statistics.median(off)
+    ratio = math.exp(statistics.fmean(math.log(a / b) for a, b in zip(on, off)))
+    print(f"POST /api/data, {ROUNDS} paired rounds x {PER_ROUND:,} readings (median per request):")
+    print(f"  metrics off   {t_off * 1e6:8.1f} µs")
+    print(f"  metrics on    {t_on * 1e6:8.1f} µs   (paired geometric mean {ratio - 1:+.2%})")
+
+    lap, inc = primitive_costs()
+    # Per single-reading request: 9 stage laps (incl. their flush), the request histogram, ~1 counter
+    per_request = (len(STAGES) + 1) * lap + inc
+    share = per_request / t_off
+    print(f"\nPrimitives: Stopwatch.lap + flush {lap * 1e9:.0f} ns, Counter.inc {inc * 1e9:.0f} ns")
+    print(f"  instrumentation per request ≈ {per_request * 1e6:.2f} µs = {share:.2%} of a request "
+          f"({'within' if share < BUDGET else 'OVER'} the {BUDGET:.0%} budget)")
+    scrape = time.perf_counter()
+    body = backend.metrics.render()
+    print(f"  /api/metrics render: {(time.perf_counter() - scrape) * 1000:.2f} ms, {len(body):,} bytes")
@@ -0,0 +1,160 @@
+"""
+Benchmark - Durable storage: ingest overhead and restart recovery time
+
+1. Sustained ingest throughput through /api/data and /api/data/batch with
+   the SQLite WAL store enabled vs. in-memory only. Writes are group-committed
+   by a background thread, so the request path only pays for enqueueing.
+2. Recovery time for a large log (10M readings over 100 devices, 1M over
+   10 with --quick): restoring the latest snapshots + replaying the tail vs.
+   replaying the full log. Both recovered states are checked against the
+   state that was in memory when the log was written.
+
+Usage: python benchmarks/bench_persistence.py [--quick]
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['COLDCHAIN_DB_PATH'] = ''  # Each phase opens its own store explicitly
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from persistence import DurableStore
+
+START_TS = 1_760_000_000
+
+
+def state_digest():
+    """Hash of every device's history, alert log and latest_data."""
+    digest = hashlib.sha256()
+    tz = backend.pytz.timezone(backend.TIMEZONE)
+    for state in sorted(backend.devices.states(), key=lambda s: s.device_id):
+        digest.update(state.device_id.encode())
+        digest.update(state.history.to_json(tz).encode())
+        digest.update(json.dumps(list(state.alert_log), sort_keys=True).encode())
+        digest.update(json.dumps(state.latest_data, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+# --- 1. Ingest throughput ---
+def post_readings(client, n, batch):
+    rng = np.random.default_rng(3)
+    temps = np.round(8 + np.cumsum(rng.uniform(-0.8, 0.8, n)).clip(-13, 17), 1).tolist()
+    start = time.perf_counter()
+    if batch == 1:
+        for i, t in enumerate(temps):
+            client.post('/api/data', json={"device_id": "bench", "temp": t, "hum": 60.0, "ts": START_TS + 60 * i})
+    else:
+        for k in range(0, n, batch):
+            readings = [{"temp": t, "hum": 60.0, "lat": 27.7, "lng": 85.3, "ts": START_TS + 60 * (k + i)}
+                        for i, t in enumerate(temps[k:k + batch])]
+            client.post('/api/data/batch', json={"device_id": "bench", "readings": readings})
+    return time.perf_counter() - start
+
+
+def bench_throughput(workdir, quick):
+    client = backend.app.test_client()
+    print(f"{'Endpoint':<24}{'in-memory':>14}{'durable':>14}{'overhead':>10}{'rows/commit':>13}")
+    for label, n, batch in (("/api/data", 2_000 if quick else 10_000, 1),
+                            ("/api/data/batch (100)", 50_000 if quick else 500_000, 100)):
+        rates = []
+        for durable in (False, True):
+            backend.devices.clear()
+            store = DurableStore(os.path.join(workdir, f'tp-{batch}.db')) if durable else None
+            backend.store = store
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = post_readings(client, n, batch)
+            rates.append(n / elapsed)
+            if store:
+                store.close()
+                per_commit = store.stats['readings'] / max(1, store.stats['commits'])
+        backend.store = None
+        print(f"{label:<24}{rates[0]:>10,.0f} r/s{rates[1]:>10,.0f} r/s{(rates[0] / rates[1] - 1):>9.1%}{per_commit:>13,.0f}")
+
+
+# --- 2. Recovery ---
+def write_log(path, total, n_devices):
+    """Ingests `total` readings across `n_devices` straight through the batch path, logging them."""
+    backend.devices.clear()
+    backend.store = DurableStore(path, snapshot_every=backend.SNAPSHOT_EVERY)
+    tz = backend.pytz.timezone(backend.TIMEZONE)
+    per_device, chunk = total // n_devices, 3_000  # Snapshots land mid-log, leaving a tail to replay
+    rng = np.random.default_rng(11)
+    start = time.perf_counter()
+    for d in range(n_devices):
+        state = backend.devices.get(f"truck-{d:03d}")
+        temp = 8.0
+        for k in range(0, per_device, chunk):
+            n = min(chunk, per_device - k)
+            steps = rng.uniform(-0.8, 0.8, n) + (rng.random(n) < 0.05) * rng.choice([-7.0, 7.0], n)
+            temps = np.round(np.clip(temp + np.cumsum(steps), -5, 25), 1) + 0.0  # No -0.0: SQLite stores it as 0.0
+            temp = float(temps[-1])
+            hums = np.round(rng.uniform(50, 85, n), 1)
+            stamps = (START_TS + 60 * np.arange(k, k + n)) * 1_000_000
+            lats = (27.7 + np.arange(k, k + n) * 1e-5).tolist()
+            lngs = [85.3] * n
+            with state.lock:
+                prev_alert_seq = state.alerts_seq
+                backend._ingest_batch(state, temps, hums, stamps, lats, lngs, tz)
+                backend._persist(state, stamps, temps, hums, lats, lngs, prev_alert_seq)
+    backend.store.close()
+    elapsed = time.perf_counter() - start
+    backend.store = None
+    return elapsed
+
+
+def recover_child(path):
+    """Runs in a fresh process: recovers from `path`, prints timing and the state digest."""
+    start = time.perf_counter()
+    replayed = backend._recover(DurableStore(path))
+    print(json.dumps({'seconds': time.perf_counter() - start, 'replayed': replayed, 'digest': state_digest()}))
+
+
+def run_recovery(path):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--recover', path],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def bench_recovery(workdir, quick):
+    total, n_devices = (1_000_000, 10) if quick else (10_000_000, 100)
+    path = os.path.join(workdir, 'recovery.db')
+    elapsed = write_log(path, total, n_devices)
+    expected = state_digest()
+    size = sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+    print(f"\nLogged {total:,} readings for {n_devices} devices in {elapsed:.1f} s "
+          f"({total / elapsed:,.0f} readings/sec, {size / 2**20:,.0f} MiB on disk)")
+
+    full = os.path.join(workdir, 'full-replay.db')
+    shutil.copy(path, full)
+    with sqlite3.connect(full) as conn: conn.execute("DELETE FROM snapshots")
+
+    for label, db in (("snapshot + tail", path), ("full log replay", full)):
+        result = run_recovery(db)
+        ok = "identical ✅" if result['digest'] == expected else "MISMATCH ❌"
+        print(f"Recovery, {label:<16} {result['seconds']:>7.2f} s  ({result['replayed']:>10,} readings replayed, {ok})")
+
+
+if __name__ == '__main__':
+    if '--recover' in sys.argv:
+        recover_child(sys.argv[sys.argv.index('--recover') + 1])
+        sys.exit(0)
+    quick = '--quick' in sys.argv
+    workdir = tempfile.mkdtemp(prefix='coldchain-bench-')
+    try:
+        bench_throughput(workdir, quick)
+        bench_recovery(workdir, quick)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,149 @@
+"""
+Benchmark - cold start: import time and time to the first /api/data
+
+Each sample runs in a fresh interpreter, as after the host spins the
+service back up:
+
+1. `import app` (timed inside the child, plus the whole child's wall time)
+2. spawn the server and POST /api/data until the first 200: the delay the
+   first sensor sees after a wake-up
+3. which heavy optional modules (pandas, joblib, scikit-learn, scipy) a
+   process has loaded after import and one ingest - the hot path must not
+   need them
+4. `import app` with the opt-in durable store (COLDCHAIN_DB_PATH) pointing
+   at an empty database and at one holding a log to recover
+
+Medians are checked against benchmarks/startup_budget.json. The budget is
+for the default in-memory mode; with the store, the empty database is held
+to the same import budget, while recovery of a populated one grows with the
+log tail behind the snapshots and is reported only. The run exits with
+status 1 if any budget is exceeded or a heavy module was loaded.
+
+Usage: python benchmarks/bench_startup.py [--quick]
+"""
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+QUICK = '--quick' in sys.argv
+RUNS = 3 if QUICK else 7
+HEAVY_MODULES = ('pandas', 'joblib', 'sklearn', 'scipy')
+ENV = dict(os.environ, COLDCHAIN_DB_PATH='', COLDCHAIN_MODEL_PRELOAD='0')
+STORED = (5, 2_000) if QUICK else (20, 5_000)  # Devices, readings each in the populated store
+
+IMPORT_CODE = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+
+HOT_PATH_CODE = """
+import contextlib, io, json, sys
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    client = app.app.test_client()
+    client.post('/api/data', json={'temp': 7.5, 'hum': 60})
+    client.get('/api/status')
+print(json.dumps(sorted(m for m in %r if m in sys.modules)))
+""" % (HEAVY_MODULES,)
+
+POPULATE_CODE = """
+import contextlib, io
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    client = app.app.test_client()
+    for d in range(%d):
+        readings = [{'temp': 4 + (i %% 97) / 10, 'hum': 60, 'ts': 1_760_000_000 + 60 * i} for i in range(%d)]
+        client.post('/api/data/batch', json={'device_id': f'dev-{d}', 'readings': readings})
+""" % STORED
+
+SERVE_CODE = ("import werkzeug.serving as s; s.WSGIRequestHandler.protocol_version = 'HTTP/1.1'\n"
+              "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)")
+
+
+def python(code, env=ENV):
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(env=ENV):
+    """(seconds inside `import app`, seconds for the whole interpreter run)."""
+    start = time.perf_counter()
+    inner = float(python(IMPORT_CODE, env).stdout.strip().splitlines()[-1])
+    return inner, time.perf_counter() - start
+
+
+def store_import_seconds(tmp):
+    """Median `import app` with an empty durable store, then with a populated one."""
+    empty = dict(ENV, COLDCHAIN_DB_PATH=os.path.join(tmp, 'empty.db'))
+    populated = dict(ENV, COLDCHAIN_DB_PATH=os.path.join(tmp, 'populated.db'))
+    python(POPULATE_CODE, populated)
+    return (statistics.median(import_times(empty)[0] for _ in range(RUNS)),  # The first run creates the schema
+            statistics.median(import_times(populated)[0] for _ in range(RUNS)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def first_data_seconds():
+    """Spawn the server and POST /api/data until the first 200."""
+    port = free_port()
+    body = json.dumps({'temp': 7.5, 'hum': 60})
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', SERVE_CODE.format(port=port)], cwd=ROOT, env=ENV,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 60:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                conn.request('POST', '/api/data', body=body, headers={'Content-Type': 'application/json'})
+                if conn.getresponse().status == 200: return time.perf_counter() - start
+            except OSError: time.sleep(0.005)
+        sys.exit("❌ Server never answered /api/data")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    with open(BUDGET_PATH) as f: budget = json.load(f)
+    samples = [import_times() for _ in range(RUNS)]
+    results = {
+        'import_s': statistics.median(s[0] for s in samples),
+        'interpreter_s': statistics.median(s[1] for s in samples),
+        'first_data_s': statistics.median(first_data_seconds() for _ in range(RUNS)),
+    }
+    heavy = json.loads(python(HOT_PATH_CODE).stdout.strip().splitlines()[-1])
+    with tempfile.TemporaryDirectory() as tmp: empty_s, populated_s = store_import_seconds(tmp)
+
+    print(f"Cold start (in-memory, the default), median of {RUNS} fresh processes:")
+    print(f"{'':<36}{'measured':>10}{'budget':>10}")
+    labels = {'import_s': "import app", 'interpreter_s': "python -c 'import app' (wall)",
+              'first_data_s': "spawn -> first /api/data 200"}
+    over = []
+    for key, label in labels.items():
+        limit = budget.get(key)
+        if limit is not None and results[key] > limit: over.append(key)
+        print(f"  {label:<34}{results[key] * 1000:>8.0f}ms{limit * 1000 if limit else 0:>8.0f}ms"
+              f"{'  ❌ over budget' if key in over else ''}")
+    print(f"  heavy modules after import + one ingest: {', '.join(heavy) if heavy else 'none ✅'}")
+
+    limit = budget.get('import_s')
+    if limit is not None and empty_s > limit: over.append('store')
+    print(f"\nWith the durable store (COLDCHAIN_DB_PATH set):")
+    print(f"  {'import app, empty database':<34}{empty_s * 1000:>8.0f}ms{limit * 1000 if limit else 0:>8.0f}ms"
+          f"{'  ❌ over budget' if 'store' in over else ''}")
+    recovering = f"import app, {STORED[0] * STORED[1]:,} readings"
+    print(f"  {recovering:<34}{populated_s * 1000:>8.0f}ms{'n/a':>10}")
+    if over or heavy: sys.exit(1)
@@ -0,0 +1,133 @@
+"""
+Load test - /api/stream fan-out vs. ingest latency
+
+Measures POST /api/data latency on a threaded server with no subscribers,
+then again with hundreds of live SSE subscribers plus a set of stalled ones
+that never read their socket. Publishing is an O(1) append, so ingest
+latency should stay essentially unchanged, and every live subscriber should
+receive every reading event. (Tail latency still shows the ticks where
+hundreds of subscriber threads wake together and queue for the GIL.)
+
+Usage: python benchmarks/bench_stream.py [--quick]
+"""
+import contextlib
+import http.client
+import io
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+
+
+def start_server():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Subscriber(threading.Thread):
+    """Raw-socket SSE client counting `reading` events (or never reading, if stalled)."""
+
+    def __init__(self, port, stalled=False):
+        super().__init__(daemon=True)
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.sendall(b"GET /api/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+        self.stalled = stalled
+        self.readings = 0
+        self.ready = threading.Event()
+
+    def run(self):
+        if self.stalled:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            self.ready.set()
+            return  # Never reads: the server's send buffer for this client fills up
+        buffer = b""
+        while True:
+            try: chunk = self.sock.recv(65536)
+            except OSError: return
+            if not chunk: return
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n\n")  # Keep the partial trailing event
+            for event in complete:
+                if b"event: hello" in event: self.ready.set()
+                elif b"event: reading" in event: self.readings += 1
+
+    def close(self):
+        with contextlib.suppress(OSError): self.sock.close()
+
+
+def measure_ingest(port, n):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    latencies = []
+    for i in range(n):
+        body = json.dumps({"temp": 8.0 + (i % 20), "hum": 60.0})
+        start = time.perf_counter()
+        conn.request('POST', '/api/data', body=body, headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse(); resp.read()
+        latencies.append(time.perf_counter() - start)
+        assert resp.status == 200
+    conn.close()
+    latencies.sort()
+    return [latencies[int(q * (n - 1))] * 1e3 for q in (0.5, 0.95, 0.99)]
+
+
+def run_subscribers(port, n_live, n_stalled, n_expected, conn):
+    """Child process: holds the subscriber sockets, reports how many got every event."""
+    subs = [Subscriber(port) for _ in range(n_live)] + [Subscriber(port, stalled=True) for _ in range(n_stalled)]
+    for s in subs: s.start()
+    for s in subs: s.ready.wait(10)
+    conn.send('ready')
+    conn.recv()  # Parent finished posting
+    deadline = time.time() + 10
+    while time.time() < deadline and any(s.readings < n_expected for s in subs if not s.stalled):
+        time.sleep(0.1)
+    conn.send([s.readings for s in subs if not s.stalled])
+    for s in subs: s.close()
+
+
+def main():
+    quick = '--quick' in sys.argv
+    n_live, n_stalled, n_posts = (100, 20, 200) if quick else (400, 50, 1_000)
+    server = start_server()
+    port = server.server_port
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = measure_ingest(port, n_posts)
+
+        # Subscribers live in another process so their client threads don't share our GIL
+        parent_conn, child_conn = multiprocessing.Pipe()
+        child = multiprocessing.Process(target=run_subscribers,
+                                        args=(port, n_live, n_stalled, n_posts, child_conn), daemon=True)
+        child.start()
+        parent_conn.recv()
+        while backend.events.subscribers < n_live + n_stalled: time.sleep(0.05)
+
+        load = measure_ingest(port, n_posts)
+        parent_conn.send('done')
+        received = parent_conn.recv()
+        child.join(5)
+
+    print(f"({os.cpu_count()} CPU core(s); subscriber clients run on this machine too)")
+    fmt = lambda q: f"p50 {q[0]:6.2f} ms   p95 {q[1]:6.2f} ms   p99 {q[2]:6.2f} ms"
+    print(f"Ingest latency, no subscribers:          {fmt(base)}")
+    print(f"Ingest latency, {n_live} live + {n_stalled} stalled: {fmt(load)}")
+    complete = sum(r == n_posts for r in received)
+    print(f"Live subscribers with all {n_posts} reading events: {complete}/{n_live} "
+          f"{'✅' if complete == n_live else '❌'}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark - sensor payload formats and compressed history responses
+
+Encodes the same readings as JSON, MessagePack and a binary frame and
+reports bytes on the wire per reading plus server-side cost per reading
+(decode + full ingest through the Flask test client), for single-reading
+/api/data posts and one large /api/data/batch upload. Then sizes and times
+a full /api/history response plain, gzip and brotli.
+
+Usage: python benchmarks/bench_wire_format.py [--quick]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['HISTORY_MAX_LEN'] = '200000'
+QUICK = '--quick' in sys.argv
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as backend
+from wire_format import FRAME_CONTENT_TYPE, brotli, decode_frame, decode_msgpack, encode_frame, msgpack
+
+SINGLE = 500 if QUICK else 3_000
+BATCH = 10_000 if QUICK else 100_000
+
+
+def make_readings(n, seed=3):
+    rng = np.random.default_rng(seed)
+    temps = np.round(6 + np.cumsum(rng.normal(0, 0.3, n)).clip(-8, 14), 2)
+    hums = np.round(rng.uniform(50, 85, n), 2)
+    ts = 1_760_000_000 + np.arange(n) * 60
+    readings = []
+    for i in range(n):
+        r = {'temp': float(temps[i]), 'hum': float(hums[i]), 'ts': int(ts[i])}
+        if i % 10 == 0: r['lat'], r['lng'] = round(27.7 + i * 1e-5, 5), round(85.3 + i * 1e-5, 5)
+        readings.append(r)
+    return readings
+
+
+def frame(device_id, readings):
+    nan = float('nan')
+    return encode_frame(device_id, [r['temp'] for r in readings], [r['hum'] for r in readings],
+                        [r['ts'] for r in readings], [r.get('lat', nan) for r in readings],
+                        [r.get('lng', nan) for r in readings])
+
+
+def encoders():
+    formats = [('JSON', 'application/json', lambda obj, dev, rr: json.dumps(obj).encode())]
+    if msgpack is not None: formats.append(('MessagePack', 'application/msgpack', lambda obj, dev, rr: msgpack.packb(obj)))
+    formats.append(('binary frame', FRAME_CONTENT_TYPE, lambda obj, dev, rr: frame(dev, rr)))
+    return formats
+
+
+def decode_cost(label, body):
+    """Seconds to turn a body into Python values, without ingesting."""
+    n = 20
+    t = time.perf_counter()
+    for _ in range(n):
+        if label == 'JSON': json.loads(body)
+        elif label == 'MessagePack': decode_msgpack(body)
+        else: decode_frame(body)
+    return (time.perf_counter() - t) / n
+
+
+def post_all(client, url, bodies, content_type):
+    with contextlib.redirect_stdout(io.StringIO()):  # receive_data prints every reading
+        t = time.perf_counter()
+        for body in bodies:
+            response = client.post(url, data=body, content_type=content_type)
+            assert response.status_code == 200, response.get_json()
+        return time.perf_counter() - t
+
+
+if __name__ == '__main__':
+    client = backend.app.test_client()
+    single, batch = make_readings(SINGLE), make_readings(BATCH, seed=4)
+
+    print(f"Single-reading POST /api/data ({SINGLE:,} posts per format):")
+    print(f"{'format':<16}{'bytes/reading':>15}{'decode':>12}{'ingest':>12}")
+    for label, content_type, encode in encoders():
+        device = f"single-{label.split()[0].lower()}"
+        bodies = [encode(dict(r, device_id=device), device, [r]) for r in single]
+        decode = sum(decode_cost(label, b) for b in bodies[:50]) / 50
+        elapsed = post_all(client, '/api/data', bodies, content_type)
+        print(f"{label:<16}{np.mean([len(b) for b in bodies]):>15.1f}{decode * 1e6:>10.1f}µs"
+              f"{elapsed / SINGLE * 1e6:>10.1f}µs")
+
+    print(f"\nPOST /api/data/batch ({BATCH:,} readings in one upload):")
+    print(f"{'format':<16}{'bytes/reading':>15}{'decode':>12}{'ingest':>12}")
+    for label, content_type, encode in encoders():
+        device = f"batch-{label.split()[0].lower()}"
+        body = encode({'device_id': device, 'readings': batch}, device, batch)
+        decode = decode_cost(label, body)
+        elapsed = post_all(client, '/api/data/batch', [body], content_type)
+        print(f"{label:<16}{len(body) / BATCH:>15.1f}{decode / BATCH * 1e9:>10.1f}ns"
+              f"{elapsed / BATCH * 1e9:>10.0f}ns")
+
+    url = "/api/history?device=batch-json"
+    print(f"\nGET {url} ({BATCH:,} readings):")
+    codings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    plain = None
+    for coding in codings:
+        n = 3 if QUICK else 10
+        t = time.perf_counter()
+        for _ in range(n): response = client.get(url, headers={'Accept-Encoding': coding})
+        elapsed = (time.perf_counter() - t) / n
+        size = len(response.data)
+        plain = plain or size
+        print(f"  {coding:<10}{size:>12,} bytes ({size / plain:6.1%}){elapsed * 1000:>10.1f} ms")
@@ -0,0 +1,166 @@
+"""
+Benchmark - several worker processes sharing device state
+
+Starts W copies of app.py (threaded Werkzeug servers, as `gunicorn -w W`
+would) on one shared SQLite log (COLDCHAIN_STATE_BACKEND=sqlite, on
+/dev/shm when it exists) and has client threads post readings - single
+/api/data posts and small /api/data/batch uploads - to workers round-robin,
+so every device's readings reach every worker, concurrently. Reports ingest
+throughput per worker count next to one process with the local backend.
+
+Then checks consistency: every worker must answer status, history and
+alerts identically for every device, and match one process ingesting the
+shared log in its seq order - i.e. the alert transitions are the ones
+sequential ingest would raise.
+
+Usage: python benchmarks/bench_workers.py [--quick]
+"""
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUICK = '--quick' in sys.argv
+WORKER_COUNTS = (1, 2) if QUICK else (1, 2, 4, 8)
+DEVICES = 20 if QUICK else 100
+READINGS = 60 if QUICK else 300  # Per device
+BATCH = 10  # Readings per /api/data/batch upload; every 4th request is one
+CLIENTS = 8
+T0 = 1_760_000_000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn_worker(port, env):
+    code = ("import werkzeug.serving as s; s.WSGIRequestHandler.protocol_version = 'HTTP/1.1'\n"
+            f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)")
+    return subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=dict(os.environ, **env),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally: conn.close()
+
+
+def wait_ready(ports):
+    for port in ports:
+        for _ in range(300):
+            try:
+                get(port, '/api/devices')
+                break
+            except OSError: time.sleep(0.1)
+        else: sys.exit(f"❌ Worker on port {port} did not come up")
+
+
+def requests_for(rng):
+    """(device, path, body) for every upload, shuffled so devices' readings interleave across clients."""
+    work = []
+    for d in range(DEVICES):
+        device, temp, i = f"truck-{d:03d}", 8.0, 0
+        while i < READINGS:
+            n = BATCH if len(work) % 4 == 3 else 1
+            readings = []
+            for _ in range(min(n, READINGS - i)):
+                temp = min(20.0, max(-2.0, temp + rng.uniform(-1.5, 1.5)))
+                readings.append({'temp': round(temp, 2), 'hum': round(rng.uniform(50, 80), 1), 'ts': T0 + i * 60})
+                i += 1
+            if n == 1: work.append(('/api/data', dict(readings[0], device_id=device)))
+            else: work.append(('/api/data/batch', {'device_id': device, 'readings': readings}))
+    rng.shuffle(work)
+    return work
+
+
+def client(ports, work, offset, errors):
+    conns = [http.client.HTTPConnection('127.0.0.1', port, timeout=60) for port in ports]
+    headers = {'Content-Type': 'application/json'}
+    for k, (path, body) in enumerate(work):
+        conn = conns[(k + offset) % len(conns)]  # Round-robin, like a load balancer
+        conn.request('POST', path, body=json.dumps(body), headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200: errors.append(response.status)
+    for conn in conns: conn.close()
+
+
+def run(n_workers, shared, directory):
+    db = os.path.join(directory, f"shared-{n_workers}-{shared}.db")
+    env = {'COLDCHAIN_DB_PATH': db if shared else '', 'COLDCHAIN_STATE_BACKEND': 'sqlite' if shared else 'local',
+           'HISTORY_MAX_LEN': str(READINGS), 'COLDCHAIN_METRICS': '0'}
+    ports = [free_port() for _ in range(n_workers)]
+    workers = [spawn_worker(port, env) for port in ports]
+    try:
+        wait_ready(ports)
+        work, errors = requests_for(random.Random(5)), []
+        shards = [work[c::CLIENTS] for c in range(CLIENTS)]
+        threads = [threading.Thread(target=client, args=(ports, shard, c, errors)) for c, shard in enumerate(shards)]
+        start = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - start
+        views = [{d: tuple(get(port, f"/api/devices/truck-{d:03d}/{what}")[1] for what in ('status', 'history', 'alerts'))
+                  for d in range(DEVICES)} for port in ports]
+        return DEVICES * READINGS / elapsed, errors, views, db
+    finally:
+        for worker in workers: worker.terminate()
+        for worker in workers: worker.wait()
+
+
+def reference_views(db):
+    """What one process ingesting the shared log in seq order answers."""
+    os.environ.update(COLDCHAIN_DB_PATH='', HISTORY_MAX_LEN=str(READINGS))
+    sys.path.insert(0, ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend
+    backend.devices.clear()
+    client = backend.app.test_client()
+    conn = sqlite3.connect(db)
+    views = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for d in range(DEVICES):
+            device = f"truck-{d:03d}"
+            rows = conn.execute("SELECT ts_us, temperature, humidity FROM readings WHERE device_id = ? ORDER BY seq",
+                                (device,)).fetchall()
+            for ts_us, temp, hum in rows:  # One by one: the reference is plain sequential ingest
+                client.post('/api/data', json={'device_id': device, 'temp': temp, 'hum': hum, 'ts': ts_us / 1e6})
+            views[d] = tuple(client.get(f"/api/devices/{device}/{what}").data for what in ('status', 'history', 'alerts'))
+    conn.close()
+    return views
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    try:
+        print(f"{DEVICES} devices x {READINGS} readings, {CLIENTS} client threads, {os.cpu_count()} CPU core(s)\n")
+        print(f"{'workers':<22}{'readings/s':>12}  consistent")
+        rate, errors, _, _ = run(1, False, directory)
+        print(f"{'1 (local backend)':<22}{rate:>12,.0f}  {'-' if not errors else f'❌ {len(errors)} errors'}")
+        checked_db, checked_views = None, None
+        for n in WORKER_COUNTS:
+            rate, errors, views, db = run(n, True, directory)
+            agree = all(view == views[0] for view in views[1:])
+            print(f"{f'{n} (shared sqlite)':<22}{rate:>12,.0f}  {'✅' if agree and not errors else '❌'}"
+                  f"{f' {len(errors)} errors' if errors else ''}")
+            checked_db, checked_views = db, views[0]
+        matches = reference_views(checked_db) == checked_views
+        print(f"\nLargest run vs sequential ingest of its log: {'✅ identical' if matches else '❌ differs'}")
+    finally: shutil.rmtree(directory, ignore_errors=True)
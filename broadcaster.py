@@ -0,0 +1,96 @@
+# ==============================================================================
+# broadcaster.py - Fan-out of live events to Server-Sent Events subscribers
+# ==============================================================================
+# Ingest appends each event once to a bounded in-memory ring (O(1), never
+# blocks, wakes nobody); a ticker thread wakes subscribers at most every
+# COALESCE_SECONDS and each streams from its own cursor into the ring on its
+# own thread. A slow or disconnected client can only fall behind - it is told
+# to resync over REST - it can never stall `receive_data`.
+import json
+import threading
+import time
+from collections import deque
+
+HEARTBEAT_SECONDS = 15.0  # Comment line keeps proxies from closing idle streams
+COALESCE_SECONDS = 0.1  # Subscribers wake at most 10x/s and send everything new in one write
+
+
+class Broadcaster:
+    """Bounded, append-only event ring with blocking cursor reads for subscribers."""
+
+    def __init__(self, capacity=1024, coalesce=COALESCE_SECONDS):
+        self._events = deque(maxlen=capacity)  # (event_id, device_id, sse_text)
+        self._last_id = 0
+        self._notified_id = 0  # Last id subscribers were woken for
+        self._lock = threading.Lock()  # Guards the ring (publish / read)
+        self._cond = threading.Condition()  # Wake-ups only: ingest never touches it
+        self._coalesce = coalesce
+        self._ticker = None
+        self.subscribers = 0
+
+    def _tick(self):
+        """Ticker thread: wakes subscribers when something new was published."""
+        while True:
+            time.sleep(self._coalesce)
+            last_id = self._last_id
+            if last_id != self._notified_id:
+                self._notified_id = last_id
+                with self._cond: self._cond.notify_all()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data, device_id=None):
+        """Records one event and wakes waiting subscribers. Never blocks on clients."""
+        payload = json.dumps(data, separators=(',', ':'))
+        with self._lock:
+            self._last_id += 1
+            # Formatted once here rather than once per subscriber
+            self._events.append((self._last_id, device_id, f"id: {self._last_id}\nevent: {event_type}\ndata: {payload}\n\n"))
+        return self._last_id
+
+    def _wait_after(self, cursor, timeout):
+        """Blocks until an event newer than `cursor` exists; False on timeout."""
+        with self._cond:
+            if self._last_id <= cursor: self._cond.wait(timeout)
+            return self._last_id > cursor
+
+    def _read_after(self, cursor):
+        """Events with id > cursor and the new cursor; (None, last_id) if it fell out of the ring."""
+        with self._lock:
+            last_id = self._last_id
+            if not self._events or last_id <= cursor: return [], cursor
+            if last_id - cursor > len(self._events): return None, last_id  # Lagged past the ring
+            # Newest events sit at the right end, where deque indexing is cheap
+            return [self._events[-k] for k in range(last_id - cursor, 0, -1)], last_id
+
+    def stream(self, device_id=None, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """Generator of SSE-formatted text for one subscriber (optionally one device).
+
+        Starts after `last_event_id` when the browser resumes a dropped stream,
+        otherwise with new events only. Wake-ups are batched by the ticker so
+        hundreds of subscriber threads don't compete with ingest for the GIL
+        on every single reading.
+        """
+        cursor = self._last_id if last_event_id is None else min(last_event_id, self._last_id)
+        with self._cond:
+            self.subscribers += 1
+            if self._ticker is None:  # Started lazily, so importing the app spawns no threads
+                self._ticker = threading.Thread(target=self._tick, name='sse-ticker', daemon=True)
+                self._ticker.start()
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'last_id': cursor})}\n\n"
+            while True:
+                if not self._wait_after(cursor, heartbeat):
+                    yield ": keep-alive\n\n"
+                    continue
+                events, cursor = self._read_after(cursor)
+                if events is None:
+                    yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+                    continue
+                chunk = [text for _, dev, text in events
+                         if device_id is None or dev is None or dev == device_id]
+                if chunk: yield ''.join(chunk)
+        finally:
+            with self._cond: self.subscribers -= 1
@@ -0,0 +1,116 @@
+# ==============================================================================
+# device_state.py - Per-device / per-shipment state partitions
+# ==============================================================================
+# Each sensor (or shipment) gets its own history, KPI window, alert log and
+# latest snapshot, guarded by its own lock, so ingest for different devices
+# never contends on a global lock.
+import re
+import threading
+from collections import deque
+
+from alert_log import AlertLog
+
+DEFAULT_DEVICE_ID = 'default'  # Readings without a device_id (legacy single-sensor setup)
+DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.:\-]{1,64}$')
+
+
+def normalize_device_id(value):
+    """Validates a device/shipment id from a payload or URL; None -> DEFAULT_DEVICE_ID.
+
+    Raises ValueError for ids that are not 1-64 chars of [A-Za-z0-9_.:-].
+    """
+    if value is None: return DEFAULT_DEVICE_ID
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"Invalid device id: {value!r}")
+    value = str(value)
+    if not DEVICE_ID_PATTERN.match(value): raise ValueError(f"Invalid device id: {value!r}")
+    return value
+
+
+class DeviceState:
+    """Everything the monitor tracks for one device. Hold `lock` while mutating."""
+
+    def __init__(self, device_id, history, kpi_engine, rollups, track, summary, geofence_log_max=None):
+        self.device_id = device_id
+        self.lock = threading.Lock()
+        self.latest_data = {"status": "UNKNOWN"}  # Populated fully on first data receipt
+        self.history = history  # HistoryRing
+        self.kpi_engine = kpi_engine  # StreamingKPIs over `history`
+        self.rollups = rollups  # RollupPyramid (1 min / 10 min / 1 h) over `history`
+        self.alert_log = AlertLog()  # {'id', 'seq', 'start_time', 'end_time' (None while open), 'type', 'peak_value'}
+        self.current_alert_info = None  # Tracks the currently active alert
+        self.alerts_created = 0  # Source of alert 'id's
+        self.snapshot_seq = 0  # Last reading seq covered by a durable snapshot
+        self.track = track  # TrackStore: GPS fixes where the position changed
+        self.geofences_inside = {}  # Zone id -> name for the zones the device is currently in
+        self.geofence_log = deque(maxlen=geofence_log_max)  # {'id', 'seq', 'timestamp', 'type' ('enter' / 'exit'), 'zone', 'name', 'lat', 'lng'}; oldest dropped
+        self.geofence_events_created = 0
+        self.summary = summary  # FleetRow: this device's column in the fleet 1 min / 1 h rollup tables
+
+    def add_alerts(self, alerts):
+        """Appends newly opened alerts to the log, numbering them."""
+        for alert in alerts:
+            self.alerts_created += 1
+            alert['id'] = self.alerts_created
+            self.alert_log.append(alert)
+
+    @property
+    def alerts_seq(self):
+        """Highest alert `seq` (the log is ordered by it: only the newest alert can change)."""
+        return self.alert_log.seq
+
+    def alerts_since(self, seq):
+        """Alerts created or changed after reading `seq`, in log order. O(k) for k results."""
+        return self.alert_log.since(seq)
+
+    def add_geofence_events(self, events):
+        """Appends enter/exit events (never modified afterwards, so the log is ordered by `seq`)."""
+        for event in events:
+            self.geofence_events_created += 1
+            event['id'] = self.geofence_events_created
+            self.geofence_log.append(event)
+
+    def geofence_events_since(self, seq):
+        """Geofence events for readings after `seq`, in log order."""
+        events = []
+        for event in reversed(self.geofence_log):
+            if event['seq'] <= seq: break
+            events.append(event)
+        events.reverse()
+        return events
+
+
+class DeviceRegistry:
+    """Thread-safe map of device id -> DeviceState, created on first use.
+
+    The registry lock is only taken to create a partition; lookups of existing
+    devices are lock-free dict reads.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory  # device_id -> DeviceState
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def get(self, device_id, create=True):
+        state = self._devices.get(device_id)
+        if state is not None or not create: return state
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._factory(device_id)
+                self._devices[device_id] = state
+            return state
+
+    def ids(self):
+        return list(self._devices)
+
+    def states(self):
+        return list(self._devices.values())
+
+    def __len__(self):
+        return len(self._devices)
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
@@ -0,0 +1,57 @@
+# ==============================================================================
+# downsample.py - Shape-preserving downsampling for history charts
+# ==============================================================================
+# A chart a few hundred pixels wide can't show a multi-week journey point by
+# point. Both selectors return *indices* into the input, so callers can emit
+# the original readings (seq, rsl, ...) rather than synthetic points:
+#   - lttb():   Largest-Triangle-Three-Buckets, keeps the visual shape
+#   - minmax(): min and max of each bucket, never drops a temperature excursion
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """Indices of the `n_out` points LTTB keeps (first and last always kept).
+
+    `x` must be increasing. One NumPy pass per output bucket, so the cost is
+    O(len(y)) array work plus O(n_out) Python steps.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n <= 2: return np.arange(n)
+    if n_out < 3: return np.array([0, n - 1])[:max(n_out, 0)]
+    x = x - x[0]  # Epoch-µs would lose precision in the triangle areas
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets over points 1..n-2
+    counts = np.diff(edges)
+    # Sum over points 1..n-2 only: reduceat's last bucket would otherwise run on into the final point
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # The next bucket's average (or the last point) is the triangle's third corner
+        nx, ny = (avg_x[i + 1], avg_y[i + 1]) if i + 1 < n_out - 2 else (x[-1], y[-1])
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def minmax(y, n_out):
+    """Sorted indices of each bucket's min and max (at most `n_out` points)."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n: return np.arange(n)
+    buckets = max(1, n_out // 2)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picked = []
+    for lo, hi in zip(edges[:-1].tolist(), edges[1:].tolist()):
+        if hi <= lo: continue
+        segment = y[lo:hi]
+        picked.append(lo + int(np.argmin(segment)))
+        picked.append(lo + int(np.argmax(segment)))
+    return np.unique(picked)
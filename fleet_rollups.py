@@ -0,0 +1,260 @@
+# ==============================================================================
+# fleet_rollups.py - Fleet-wide 1 min / 1 h rollup tables for the overview
+# ==============================================================================
+# One table per resolution: a ring of time buckets (rows) x devices (columns)
+# per aggregate. Every reading is folded into its device's column as it is
+# ingested, so a fleet query over any range is a few 2-D NumPy reductions
+# across all devices at once - it never loops over devices or raw readings.
+# A row is recycled once the newest bucket is `retention` ahead of it.
+#
+# The device columns are split into stripes of `STRIPE_DEVICES`, each with
+# its own tables and lock: ingest only locks its device's stripe, and a new
+# stripe is allocated for new devices instead of copying the existing tables.
+# Queries reduce one stripe at a time and concatenate the results.
+import math
+import threading
+
+import numpy as np
+
+FLEET_LEVELS = (('1m', 60), ('1h', 3600))  # (name, bucket width in seconds), finest first
+EMPTY_BUCKET = np.iinfo(np.int64).min  # Ring row not holding any bucket yet
+STRIPE_DEVICES = 64  # Device columns per stripe (one lock, one set of tables)
+
+# Aggregate -> (dtype, value of an empty cell, how two cells combine)
+FIELDS = {
+    'count': (np.int64, 0, np.add), 'out_of_range': (np.int64, 0, np.add), 'alerts': (np.int64, 0, np.add),
+    'temp_sum': (np.float64, 0.0, np.add), 'temp_min': (np.float64, math.inf, np.fmin),
+    'temp_max': (np.float64, -math.inf, np.fmax), 'hum_sum': (np.float64, 0.0, np.add),
+    'hum_min': (np.float64, math.inf, np.fmin), 'hum_max': (np.float64, -math.inf, np.fmax),
+    'rsl_min': (np.float64, math.inf, np.fmin),  # fmin/fmax skip NaN (no RSL prediction)
+}
+
+
+class FleetLevel:
+    """One resolution: `slots` consecutive buckets x device columns. Callers hold the stripe's lock."""
+
+    def __init__(self, name, width_s, retention_s, devices=STRIPE_DEVICES):
+        self.name = name
+        self.width_us = int(width_s) * 1_000_000
+        self.slots = max(1, math.ceil(retention_s / width_s))
+        self.bucket = np.full(self.slots, EMPTY_BUCKET, dtype=np.int64)  # Bucket number (ts // width) per row
+        self.newest = EMPTY_BUCKET
+        self.cols = {f: np.full((self.slots, devices), fill, dtype=t) for f, (t, fill, _) in FIELDS.items()}
+
+    def reset_device(self, d):
+        for f, (_, fill, _) in FIELDS.items(): self.cols[f][:, d] = fill
+
+    @property
+    def oldest(self):
+        """First bucket number the ring still holds completely."""
+        return self.newest - self.slots + 1
+
+    def _claim(self, buckets):
+        """Ring rows for sorted, distinct bucket numbers; recycles rows of expired buckets.
+
+        Returns (rows, keep, n) for the last `n` buckets: `keep` drops those the ring has already passed.
+        """
+        buckets = buckets[buckets > buckets[-1] - self.slots]  # A batch spanning more than the ring keeps its tail
+        rows = buckets % self.slots
+        held = self.bucket[rows]
+        stale = held < buckets
+        if stale.any():
+            recycled = rows[stale]
+            for f, (_, fill, _) in FIELDS.items(): self.cols[f][recycled] = fill
+            self.bucket[recycled] = buckets[stale]
+            self.newest = max(self.newest, int(buckets[-1]))
+        keep = held <= buckets
+        return rows[keep], keep, len(keep)
+
+    def merge(self, d, buckets, values):
+        """Folds per-bucket aggregates (`values[field]` aligned with sorted `buckets`) into device column `d`."""
+        rows, keep, n = self._claim(buckets)
+        for f, (_, _, op) in FIELDS.items():
+            col = self.cols[f]
+            col[rows, d] = op(col[rows, d], values[f][-n:][keep])
+
+    def add(self, d, ts_us, temp, hum, rsl, out_of_range, alerts):
+        """Scalar fast path for per-reading ingest."""
+        bucket = ts_us // self.width_us
+        row = bucket % self.slots
+        held = self.bucket[row]
+        if held > bucket: return  # Older than anything the ring keeps
+        if held < bucket:
+            for f, (_, fill, _) in FIELDS.items(): self.cols[f][row] = fill
+            self.bucket[row] = bucket
+            if bucket > self.newest: self.newest = bucket
+        cols = self.cols
+        cols['count'][row, d] += 1
+        cols['out_of_range'][row, d] += out_of_range
+        cols['alerts'][row, d] += alerts
+        cols['temp_sum'][row, d] += temp
+        cols['hum_sum'][row, d] += hum
+        if temp < cols['temp_min'][row, d]: cols['temp_min'][row, d] = temp
+        if temp > cols['temp_max'][row, d]: cols['temp_max'][row, d] = temp
+        if hum < cols['hum_min'][row, d]: cols['hum_min'][row, d] = hum
+        if hum > cols['hum_max'][row, d]: cols['hum_max'][row, d] = hum
+        if rsl < cols['rsl_min'][row, d]: cols['rsl_min'][row, d] = rsl  # False for NaN
+
+    def rows(self, b0, b1):
+        """Ring rows holding buckets b0..b1 (inclusive), oldest first."""
+        rows = np.flatnonzero((self.bucket >= b0) & (self.bucket <= b1))
+        return rows[np.argsort(self.bucket[rows])]
+
+    def reduce(self, b0, b1):
+        """Per-device totals over buckets b0..b1."""
+        rows = self.rows(b0, b1)
+        return {f: op.reduce(self.cols[f][rows], axis=0, initial=fill) for f, (_, fill, op) in FIELDS.items()}
+
+    def export(self, d):
+        rows = np.flatnonzero(self.cols['count'][:, d] > 0)
+        rows = rows[np.argsort(self.bucket[rows])]
+        return {'bucket': self.bucket[rows].copy(), **{f: self.cols[f][rows, d].copy() for f in FIELDS}}
+
+
+def _bucket_values(buckets, temps, hums, rsls, out_of_range, alerts):
+    """Per-bucket aggregates of a batch: (sorted distinct bucket numbers, {field: values})."""
+    order = np.argsort(buckets, kind='stable')
+    buckets = buckets[order]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    temps, hums, rsls = temps[order], hums[order], rsls[order]
+    return buckets[starts], {
+        'count': np.diff(np.r_[starts, len(buckets)]),
+        'out_of_range': np.add.reduceat(out_of_range[order], starts),
+        'alerts': np.add.reduceat(alerts[order], starts),
+        'temp_sum': np.add.reduceat(temps, starts), 'temp_min': np.minimum.reduceat(temps, starts),
+        'temp_max': np.maximum.reduceat(temps, starts), 'hum_sum': np.add.reduceat(hums, starts),
+        'hum_min': np.minimum.reduceat(hums, starts), 'hum_max': np.maximum.reduceat(hums, starts),
+        'rsl_min': np.fmin.reduceat(rsls, starts),
+    }
+
+
+class FleetStripe:
+    """`devices` columns of every level behind one lock."""
+
+    def __init__(self, retention, levels, devices):
+        self.lock = threading.Lock()
+        self.levels = [FleetLevel(name, width, retention[name], devices) for name, width in levels]
+
+
+class FleetRollups:
+    """The fleet's rollup tables (in stripes of device columns) plus the device id -> column mapping.
+
+    Ingest takes only its stripe's lock, briefly per reading or batch, after
+    the device's own lock. `lock` guards the mapping and the stripe list.
+    """
+
+    def __init__(self, retention, levels=FLEET_LEVELS, stripe_devices=STRIPE_DEVICES):
+        self.lock = threading.Lock()
+        self.retention = retention
+        self.level_specs = levels
+        self.stripe_devices = stripe_devices
+        self.stripes = []
+        self.device_ids = []
+        self._columns = {}
+
+    def row(self, device_id):
+        """A fresh (emptied) column for `device_id`, as a FleetRow handle."""
+        with self.lock:
+            d = self._columns.get(device_id)
+            if d is None:
+                d = self._columns[device_id] = len(self.device_ids)
+                self.device_ids.append(device_id)
+                if d // self.stripe_devices == len(self.stripes):  # Previous stripes stay where they are
+                    self.stripes.append(FleetStripe(self.retention, self.level_specs, self.stripe_devices))
+                stripe = self.stripes[d // self.stripe_devices]
+            else:
+                stripe = self.stripes[d // self.stripe_devices]
+                with stripe.lock:
+                    for level in stripe.levels: level.reset_device(d % self.stripe_devices)
+        return FleetRow(stripe, d % self.stripe_devices)
+
+    def _snapshot(self):
+        with self.lock: return list(self.device_ids), list(self.stripes)
+
+    def summarize(self, from_us, to_us):
+        """Per-device totals over [from_us, to_us]: ({field: array per device}, device ids, resolution).
+
+        Whole 1 h buckets cover the middle of the range and 1 min buckets its
+        ragged edges, so results are exact to the minute wherever the minute
+        ring still reaches; an edge beyond it widens to its whole hour.
+        """
+        ids, stripes = self._snapshot()
+        (fine_name, fine_s), (coarse_name, coarse_s) = self.level_specs[0], self.level_specs[-1]
+        fine, coarse = 0, len(self.level_specs) - 1
+        ratio = coarse_s // fine_s
+        f0, f1 = from_us // (fine_s * 1_000_000), to_us // (fine_s * 1_000_000)
+        newest = max((stripe.levels[fine].newest for stripe in stripes), default=EMPTY_BUCKET)  # Int reads: no lock needed
+        oldest = newest - max(1, math.ceil(self.retention[fine_name] / fine_s)) + 1  # Of the whole fleet's minute ring
+        exact = f0 >= oldest
+        c0 = -(-f0 // ratio) if exact else f0 // ratio  # First hour used whole
+        c1 = (f1 + 1) // ratio - 1  # Last hour used whole
+        if c0 > c1:  # Within one hour, or straddling just one boundary
+            plan = [(fine, f0, f1) if exact else (coarse, f0 // ratio, f1 // ratio)]
+        else:
+            if (c1 + 1) * ratio <= f1 and (c1 + 1) * ratio < oldest: c1 += 1  # Tail past the minute ring
+            plan = [(coarse, c0, c1)]
+            if exact and f0 < c0 * ratio: plan.append((fine, f0, c0 * ratio - 1))
+            if (c1 + 1) * ratio <= f1: plan.append((fine, (c1 + 1) * ratio, f1))
+
+        per_stripe = []
+        for stripe in stripes:  # One stripe locked at a time: ingest elsewhere carries on
+            with stripe.lock: parts = [stripe.levels[i].reduce(b0, b1) for i, b0, b1 in plan]
+            totals = parts[0]
+            for part in parts[1:]:
+                totals = {f: op(totals[f], part[f]) for f, (_, _, op) in FIELDS.items()}
+            per_stripe.append(totals)
+        n = len(ids)
+        totals = {f: np.concatenate([part[f] for part in per_stripe])[:n] if per_stripe else np.empty(0, dtype=dtype)
+                  for f, (dtype, _, _) in FIELDS.items()}
+        return totals, ids, fine_name if exact else coarse_name
+
+    def hourly(self, field, from_us, to_us):
+        """(bucket start us, fleet total of `field`) for each coarse bucket overlapping [from_us, to_us]."""
+        _, stripes = self._snapshot()
+        width_us = self.level_specs[-1][1] * 1_000_000
+        buckets, totals = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=FIELDS[field][0])]
+        for stripe in stripes:
+            coarse = stripe.levels[-1]
+            with stripe.lock:
+                rows = coarse.rows(from_us // width_us, to_us // width_us)
+                buckets.append(coarse.bucket[rows])
+                totals.append(coarse.cols[field][rows].sum(axis=1))
+        buckets, inverse = np.unique(np.concatenate(buckets), return_inverse=True)
+        fleet = np.zeros(len(buckets), dtype=FIELDS[field][0])
+        np.add.at(fleet, inverse, np.concatenate(totals))
+        return buckets * width_us, fleet
+
+
+class FleetRow:
+    """One device's column in its stripe of the fleet tables (what DeviceState.summary holds)."""
+
+    def __init__(self, stripe, column):
+        self.stripe = stripe
+        self.column = column
+
+    def add(self, ts_us, temp, hum, rsl, out_of_range, alerts):
+        rsl = math.nan if rsl is None else float(rsl)
+        with self.stripe.lock:
+            for level in self.stripe.levels:
+                level.add(self.column, int(ts_us), float(temp), float(hum), rsl, int(out_of_range), int(alerts))
+
+    def add_many(self, ts_us, temps, hums, rsls, out_of_range, alerts):
+        if len(ts_us) == 0: return
+        ts_us = np.asarray(ts_us, dtype=np.int64)
+        arrays = [np.asarray(a, dtype=np.float64) for a in (temps, hums, rsls)]
+        flags = [np.asarray(a, dtype=np.int64) for a in (out_of_range, alerts)]
+        per_level = [_bucket_values(ts_us // level.width_us, *arrays, *flags) for level in self.stripe.levels]
+        with self.stripe.lock:
+            for level, (buckets, values) in zip(self.stripe.levels, per_level):
+                level.merge(self.column, buckets, values)
+
+    def export(self):
+        """The device's non-empty buckets per level, for snapshots."""
+        with self.stripe.lock:
+            return {level.name: level.export(self.column) for level in self.stripe.levels}
+
+    def restore(self, exported):
+        with self.stripe.lock:
+            for level in self.stripe.levels:
+                data = exported.get(level.name)
+                if data is not None and len(data['bucket']): level.merge(self.column, data['bucket'], data)
@@ -0,0 +1,393 @@
+# ==============================================================================
+# geo.py - GPS tracks, route simplification and geofences
+# ==============================================================================
+# Each device keeps its route as columns (ts, seq, lat, lng), appending a
+# point only when the position actually changes - carried-forward positions
+# cost nothing. A multi-day route is served simplified (Douglas-Peucker or
+# Visvalingam-Whyatt, tolerance in metres) so the map draws a few hundred
+# vertices instead of every fix.
+#
+# Geofences (depots, customs zones, ...) are circles or polygons registered
+# in a uniform lat/lng grid: a position is only tested against the zones
+# whose bounding box overlaps its cell, so a lookup costs the same with ten
+# zones or ten thousand.
+import heapq
+import json
+import math
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+GRID_CELL_DEG = 0.1  # ~11 km cells
+MAX_CELLS_PER_ZONE = 4096  # Larger zones are checked on every lookup instead
+SCALAR_LOOKUPS = 16  # Up to this many fixes, locate point by point (cheaper than NumPy setup)
+
+
+# --- Local projection ---
+def project(lats, lngs):
+    """Equirectangular projection to metres around the track's mean latitude (fine at route scale)."""
+    lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+    if len(lats) == 0: return lats, lngs
+    scale = math.radians(1) * EARTH_RADIUS_M
+    x = (lngs - lngs[0]) * scale * math.cos(math.radians(float(lats.mean())))
+    y = (lats - lats[0]) * scale
+    return x, y
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (NumPy broadcasting)."""
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# --- Polyline simplification (both return sorted indices; first and last always kept) ---
+def douglas_peucker(x, y, tolerance):
+    """Indices Douglas-Peucker keeps: no dropped point is more than `tolerance` from the simplified line.
+
+    Splits every open segment of a level in one vectorised pass (same result
+    as the recursive form), so a noisy track costs O(depth) NumPy passes, not
+    one per kept point.
+    """
+    n = len(x)
+    if n <= 2 or tolerance <= 0: return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    pending = np.ones(n, dtype=bool)  # Interior points of segments not yet within tolerance
+    pending[0] = pending[-1] = False
+    while pending.any():
+        pts = np.flatnonzero(pending)
+        anchors = np.flatnonzero(keep)
+        seg = np.searchsorted(anchors, pts) - 1  # anchors[seg] < pt < anchors[seg + 1]
+        lo, hi = anchors[seg], anchors[seg + 1]
+        dx, dy = x[hi] - x[lo], y[hi] - y[lo]
+        px, py = x[pts] - x[lo], y[pts] - y[lo]
+        length2 = dx * dx + dy * dy
+        # Distance to the segment, not the infinite line (closed loop: distance from the endpoint)
+        t = np.clip(np.divide(px * dx + py * dy, length2, out=np.zeros(len(pts)), where=length2 > 0), 0.0, 1.0)
+        dist = np.hypot(px - t * dx, py - t * dy)
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(pts)]))
+        worst = np.maximum.reduceat(dist, starts)
+        at_max = np.flatnonzero(dist == worst[group])
+        first = at_max[np.r_[True, group[at_max][1:] != group[at_max][:-1]]]  # First farthest point per segment
+        split = worst > tolerance
+        pending[pts[~split[group]]] = False  # Segments within tolerance are done
+        chosen = pts[first[split]]
+        keep[chosen] = True
+        pending[chosen] = False
+    return np.flatnonzero(keep)
+
+
+def visvalingam(x, y, tolerance):
+    """Indices Visvalingam-Whyatt keeps: drops points, least significant first, until each is `tolerance` (m) off its neighbours.
+
+    Significance is the triangle's height (2 * area / base, measured to the
+    base segment) rather than its area, so `tolerance` means the same
+    distance as for Douglas-Peucker.
+    """
+    n = len(x)
+    if n <= 2 or tolerance <= 0: return np.arange(n)
+    prev, nxt = list(range(-1, n - 1)), list(range(1, n + 1))
+    x, y = x.tolist(), y.tolist()
+
+    def height(i):
+        a, c = prev[i], nxt[i]
+        dx, dy, px, py = x[c] - x[a], y[c] - y[a], x[i] - x[a], y[i] - y[a]
+        length2 = dx * dx + dy * dy
+        t = min(1.0, max(0.0, (px * dx + py * dy) / length2)) if length2 > 0 else 0.0
+        return math.hypot(px - t * dx, py - t * dy)
+
+    current = [math.inf] * n
+    heap = []
+    for i in range(1, n - 1):
+        current[i] = height(i)
+        heap.append((current[i], i))
+    heapq.heapify(heap)
+    removed = [False] * n
+    floor = 0.0  # Effective size never decreases below the last removed point's
+    while heap:
+        value, i = heapq.heappop(heap)
+        if removed[i] or value != current[i]: continue  # Stale entry
+        if value >= tolerance: break
+        floor = max(floor, value)
+        removed[i] = True
+        a, c = prev[i], nxt[i]
+        nxt[a], prev[c] = c, a
+        for j in (a, c):
+            if 0 < j < n - 1:
+                current[j] = max(height(j), floor)
+                heapq.heappush(heap, (current[j], j))
+    return np.flatnonzero(~np.asarray(removed))
+
+
+SIMPLIFIERS = {'dp': douglas_peucker, 'vw': visvalingam}
+
+
+# --- Per-device GPS track ---
+class TrackStore:
+    """A device's GPS fixes in growable columns, oldest first, capped at `capacity` points.
+
+    Only position changes are stored; `version` counts points ever appended
+    (it versions simplified results and ETags).
+    """
+
+    COLUMNS = {'ts_us': np.int64, 'seq': np.int64, 'lat': np.float64, 'lng': np.float64}
+
+    def __init__(self, capacity, initial=64):
+        self.capacity = int(capacity)
+        self._cols = {k: np.empty(min(initial, self.capacity), dtype=t) for k, t in self.COLUMNS.items()}
+        self._start = 0
+        self._end = 0
+        self.version = 0
+        self._cache = {}  # (version, method, tolerance, from, to) -> indices, for repeated map loads
+
+    def __len__(self):
+        return self._end - self._start
+
+    def column(self, name):
+        return self._cols[name][self._start:self._end]
+
+    def last_position(self):
+        if self._end == self._start: return None
+        return float(self._cols['lat'][self._end - 1]), float(self._cols['lng'][self._end - 1])
+
+    def _reserve(self, extra):
+        size = len(self._cols['seq'])
+        n = len(self)
+        if self._end + extra <= size: return
+        if n + extra > size // 2: size = max(2 * size, n + extra)  # Grow, else just compact
+        for name, col in self._cols.items():
+            new = np.empty(size, dtype=col.dtype)
+            new[:n] = col[self._start:self._end]
+            self._cols[name] = new
+        self._start, self._end = 0, n
+
+    def append_many(self, ts_us, seqs, lats, lngs):
+        """Adds the readings whose position differs from the one before; returns the positions kept.
+
+        `lats`/`lngs` are per-reading floats (None or NaN = no fix yet).
+        Returns the indices into the inputs that became track points.
+        """
+        last = self.last_position() or (np.nan, np.nan)
+        if len(lats) == 1 and (lats[0], lngs[0]) == last: return np.empty(0, dtype=np.int64)  # Per-reading fast path
+        lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)  # None -> NaN
+        prev_lat, prev_lng = np.r_[last[0], lats[:-1]], np.r_[last[1], lngs[:-1]]
+        moved = (lats != prev_lat) | (lngs != prev_lng)  # NaN != NaN: a first fix always counts
+        picked = np.flatnonzero(moved & ~np.isnan(lats) & ~np.isnan(lngs))
+        k = len(picked)
+        if k == 0: return picked
+        self._reserve(k)
+        for name, values in (('ts_us', ts_us), ('seq', seqs), ('lat', lats), ('lng', lngs)):
+            self._cols[name][self._end:self._end + k] = np.asarray(values)[picked]
+        self._end += k
+        if len(self) > self.capacity: self._start = self._end - self.capacity  # Evict the oldest fixes
+        self.version += k
+        self._cache.clear()
+        return picked
+
+    def clear(self):
+        self._start = self._end = 0
+        self._cache.clear()
+
+    def simplified(self, tolerance, method='dp', from_us=-2**63, to_us=2**63 - 1):
+        """Positions (into the retained track) of the simplified route within [from_us, to_us]."""
+        key = (self.version, len(self), method, tolerance, from_us, to_us)
+        picked = self._cache.get(key)
+        if picked is None:
+            stamps = self.column('ts_us')
+            lo, hi = int(np.searchsorted(stamps, from_us, side='left')), int(np.searchsorted(stamps, to_us, side='right'))
+            x, y = project(self.column('lat')[lo:hi], self.column('lng')[lo:hi])
+            picked = lo + SIMPLIFIERS[method](x, y, tolerance)
+            if len(self._cache) >= 8: self._cache.clear()
+            self._cache[key] = picked
+        return picked
+
+    def __getstate__(self):  # Snapshots: retained points only, no cache
+        return {'capacity': self.capacity, 'version': self.version,
+                **{name: self.column(name).copy() for name in self.COLUMNS}}
+
+    def __setstate__(self, snap):
+        self.__init__(snap['capacity'])
+        n = len(snap['seq'])
+        self._reserve(n)
+        for name in self.COLUMNS: self._cols[name][:n] = snap[name]
+        self._end = n
+        self.version = snap['version']
+
+
+# --- Geofences ---
+class Geofence:
+    """A circle (`radius_m` around lat/lng) or polygon (`polygon`: [[lat, lng], ...]) zone."""
+
+    def __init__(self, zone_id, name=None, lat=None, lng=None, radius_m=None, polygon=None):
+        self.id = zone_id
+        self.name = name or zone_id
+        if polygon is not None:
+            vertices = np.asarray(polygon, dtype=np.float64)
+            if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) < 3:
+                raise ValueError(f"Geofence '{zone_id}': polygon needs at least 3 [lat, lng] vertices")
+            self.kind, self.lat, self.lng, self.radius_m = 'polygon', None, None, None
+            self.vertices = vertices
+            self._ring = [tuple(v) for v in vertices.tolist()]
+            self.bbox = tuple((*vertices.min(axis=0).tolist(), *vertices.max(axis=0).tolist()))  # lat_min, lng_min, lat_max, lng_max
+        else:
+            if lat is None or lng is None or radius_m is None or radius_m <= 0:
+                raise ValueError(f"Geofence '{zone_id}': needs lat, lng and a positive radius_m (or a polygon)")
+            self.kind, self.lat, self.lng, self.radius_m = 'circle', float(lat), float(lng), float(radius_m)
+            self.vertices = None
+            dlat = math.degrees(self.radius_m / EARTH_RADIUS_M)
+            dlng = dlat / max(math.cos(math.radians(self.lat)), 1e-6)
+            self.bbox = (self.lat - dlat, self.lng - dlng, self.lat + dlat, self.lng + dlng)
+        if not (-90 <= self.bbox[0] and self.bbox[2] <= 90 and -180 <= self.bbox[1] and self.bbox[3] <= 180):
+            raise ValueError(f"Geofence '{zone_id}': outside valid lat/lng range")
+
+    def contains_point(self, lat, lng):
+        """Scalar `contains` (no NumPy overhead for one fix)."""
+        if self.kind == 'circle':
+            p1, p2 = math.radians(self.lat), math.radians(lat)
+            a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng - self.lng) / 2) ** 2
+            return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0))) <= self.radius_m
+        if not (self.bbox[0] <= lat <= self.bbox[2] and self.bbox[1] <= lng <= self.bbox[3]): return False
+        inside = False
+        y1, x1 = self._ring[-1]
+        for y2, x2 in self._ring:
+            if (y1 > lat) != (y2 > lat) and lng < (x2 - x1) * (lat - y1) / (y2 - y1) + x1: inside = not inside
+            y1, x1 = y2, x2
+        return inside
+
+    def contains(self, lats, lngs):
+        """Boolean mask of which points lie inside (arrays)."""
+        if self.kind == 'circle': return haversine_m(self.lat, self.lng, lats, lngs) <= self.radius_m
+        inside = np.zeros(len(lats), dtype=bool)  # Ray casting, one pass per edge
+        vy, vx = self.vertices[:, 0], self.vertices[:, 1]
+        for j in range(len(vy)):
+            y1, x1, y2, x2 = vy[j - 1], vx[j - 1], vy[j], vx[j]
+            if y1 == y2: continue
+            crosses = ((y1 > lats) != (y2 > lats)) & (lngs < (x2 - x1) * (lats - y1) / (y2 - y1) + x1)
+            inside ^= crosses
+        return inside
+
+    def to_dict(self):
+        if self.kind == 'circle':
+            return {'id': self.id, 'name': self.name, 'lat': self.lat, 'lng': self.lng, 'radius_m': self.radius_m}
+        return {'id': self.id, 'name': self.name, 'polygon': self.vertices.tolist()}
+
+
+def parse_geofences(items):
+    """Geofence objects from JSON dicts ({id, name?, lat, lng, radius_m} or {id, name?, polygon}).
+
+    Raises ValueError on malformed or duplicate zones.
+    """
+    if isinstance(items, dict): items = items.get('geofences')
+    if not isinstance(items, list): raise ValueError("Expected a list of geofences")
+    zones, seen = [], set()
+    for i, item in enumerate(items):
+        if not isinstance(item, dict): raise ValueError(f"Geofence {i}: not an object")
+        zone_id = item.get('id')
+        if not isinstance(zone_id, (str, int)) or isinstance(zone_id, bool) or str(zone_id) == '':
+            raise ValueError(f"Geofence {i}: missing 'id'")
+        zone_id = str(zone_id)
+        if zone_id in seen: raise ValueError(f"Duplicate geofence id '{zone_id}'")
+        seen.add(zone_id)
+        try:
+            zones.append(Geofence(zone_id, item.get('name'), item.get('lat'), item.get('lng'),
+                                  item.get('radius_m'), item.get('polygon')))
+        except TypeError: raise ValueError(f"Geofence '{zone_id}': coordinates must be numbers") from None
+    return zones
+
+
+def load_geofences(path):
+    """Zones from a JSON file (missing path -> none)."""
+    if not path: return []
+    with open(path, encoding='utf-8') as f: return parse_geofences(json.load(f))
+
+
+class GeofenceIndex:
+    """Uniform-grid spatial index over geofences; `replace()` swaps the whole set atomically."""
+
+    def __init__(self, zones=(), cell_deg=GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()  # Serialises writers; readers use one consistent snapshot
+        self._index = self._build(list(zones))
+
+    def _build(self, zones):
+        grid, large = {}, []
+        for zone in zones:
+            lat0, lng0, lat1, lng1 = (math.floor(v / self.cell_deg) for v in zone.bbox)
+            if (lat1 - lat0 + 1) * (lng1 - lng0 + 1) > MAX_CELLS_PER_ZONE:
+                large.append(zone)
+                continue
+            for i in range(lat0, lat1 + 1):
+                for j in range(lng0, lng1 + 1): grid.setdefault((i, j), []).append(zone)
+        return {zone.id: zone for zone in zones}, grid, large
+
+    def replace(self, zones):
+        index = self._build(list(zones))
+        with self._lock: self._index = index
+
+    def __len__(self):
+        return len(self._index[0])
+
+    def zones(self):
+        return list(self._index[0].values())
+
+    def get(self, zone_id):
+        return self._index[0].get(zone_id)
+
+    def locate_many(self, lats, lngs):
+        """For each point, the sorted ids of the zones containing it (tuples).
+
+        A few points are checked one by one; larger batches are grouped by grid
+        cell and each candidate zone is tested against its cell's points in
+        one vectorised pass.
+        """
+        zones, grid, large = self._index
+        if not zones: return [()] * len(lats)
+        if len(lats) <= SCALAR_LOOKUPS: return [self._locate_point(zones, grid, large, lat, lng) for lat, lng in zip(lats, lngs)]
+        lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+        hits = [[] for _ in range(len(lats))]
+        if grid:
+            rows, cols = np.floor(lats / self.cell_deg).astype(np.int64), np.floor(lngs / self.cell_deg).astype(np.int64)
+            keys = (rows << 32) + (cols & 0xFFFFFFFF)  # One int per cell, so grouping is a 1-D sort
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            for lo, hi in zip(starts.tolist(), np.r_[starts[1:], len(keys)].tolist()):
+                p = int(order[lo])
+                candidates = grid.get((int(rows[p]), int(cols[p])))
+                if not candidates: continue
+                members = order[lo:hi]
+                for zone in candidates:
+                    for q in members[zone.contains(lats[members], lngs[members])].tolist(): hits[q].append(zone.id)
+        for zone in large:
+            for q in np.flatnonzero(zone.contains(lats, lngs)).tolist(): hits[q].append(zone.id)
+        return [tuple(sorted(h)) for h in hits]
+
+    def _locate_point(self, zones, grid, large, lat, lng):
+        candidates = grid.get((math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)), ())
+        hit = [zone.id for zone in candidates if zone.contains_point(lat, lng)]
+        hit += [zone.id for zone in large if zone.contains_point(lat, lng)]
+        return tuple(sorted(hit))
+
+    def locate(self, lat, lng):
+        return self.locate_many([lat], [lng])[0]
+
+
+def zone_transitions(inside, located, index):
+    """Walks a device's successive zone memberships, updating `inside` (zone id -> name).
+
+    `located` is `locate_many()` output for consecutive fixes. Yields
+    (position, 'enter' | 'exit', zone id, zone name); exits come first, and a
+    zone that was removed from the index counts as exited at the next fix.
+    """
+    for k, zone_ids in enumerate(located):
+        if len(zone_ids) == len(inside) and all(z in inside for z in zone_ids): continue
+        for zone_id in [z for z in inside if z not in zone_ids]:
+            yield k, 'exit', zone_id, inside.pop(zone_id)
+        for zone_id in zone_ids:
+            if zone_id in inside: continue
+            zone = index.get(zone_id)
+            inside[zone_id] = zone.name if zone is not None else zone_id
+            yield k, 'enter', zone_id, inside[zone_id]
@@ -0,0 +1,232 @@
+# ==============================================================================
+# history_store.py - Columnar ring-buffer history for the Cold Chain Monitor
+# ==============================================================================
+# Replaces the list-of-dicts `history` (trimmed with `pop(0)`) with one NumPy
+# column per field. Appends and evictions are O(1), every column is exposed as
+# a zero-copy view, and a reading costs ~80 bytes instead of a ~400 byte dict.
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_us(dt):
+    """Converts an aware datetime to integer microseconds since the epoch (exact)."""
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+
+def from_epoch_us(ts_us, tz):
+    """Converts epoch microseconds back to an aware datetime in `tz`."""
+    return (EPOCH + timedelta(microseconds=int(ts_us))).astimezone(tz)
+
+
+def format_timestamps(ts_us, tz):
+    """Renders epoch-µs values as the ISO strings `datetime.isoformat()` would produce.
+
+    Uses a vectorised datetime64 path when the UTC offset is constant over the
+    range (always true for Asia/Kathmandu), otherwise falls back per value.
+    """
+    ts_us = np.asarray(ts_us, dtype=np.int64)
+    if ts_us.size == 0: return []
+    first, last = from_epoch_us(ts_us.min(), tz), from_epoch_us(ts_us.max(), tz)
+    offset = first.utcoffset()
+    if offset != last.utcoffset() or offset % timedelta(minutes=1):
+        return [from_epoch_us(v, tz).isoformat() for v in ts_us]
+
+    local = (ts_us + offset // ONE_MICROSECOND).astype('datetime64[us]')
+    with_us = np.datetime_as_string(local, unit='us')
+    whole_s = np.datetime_as_string(local, unit='s')
+    text = np.where(ts_us % 1_000_000 == 0, whole_s, with_us)  # isoformat() drops ".000000"
+
+    minutes = offset // timedelta(minutes=1)
+    sign = '-' if minutes < 0 else '+'
+    suffix = f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+    return [s + suffix for s in text.tolist()]
+
+
+def _json_number(value):
+    """JSON text for a float/int column value (NaN -> null), matching `json.dumps`."""
+    if isinstance(value, float):
+        return 'null' if math.isnan(value) else repr(value)
+    return str(value)
+
+
+class HistoryRing:
+    """Fixed-capacity columnar ring buffer of sensor readings.
+
+    Each slot is written twice (at `i` and `i + capacity`) so the retained
+    window is always one contiguous slice - `column()` never has to copy, even
+    after the buffer wraps.
+    """
+
+    COLUMNS = ('timestamp_us', 'hours', 'temperature', 'humidity', 'rsl')
+
+    def __init__(self, capacity, hours_dtype=np.float64):
+        if capacity < 1: raise ValueError("capacity must be >= 1")
+        self.capacity = int(capacity)
+        size = 2 * self.capacity
+        self._cols = {
+            'timestamp_us': np.empty(size, dtype=np.int64),
+            'hours': np.empty(size, dtype=hours_dtype),
+            'temperature': np.empty(size, dtype=np.float64),
+            'humidity': np.empty(size, dtype=np.float64),
+            'rsl': np.empty(size, dtype=np.float64),  # NaN = no prediction
+        }
+        self._head = 0  # Slot of the oldest reading, always < capacity
+        self._len = 0
+        self._total = 0  # Readings ever appended; reading k (1-based) has seq k
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest reading (0 when nothing was ever appended)."""
+        return self._total
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest retained reading."""
+        return self._total - self._len + 1
+
+    def index_after(self, seq):
+        """Position of the first retained reading with a sequence number > `seq`."""
+        return min(self._len, max(0, seq - self.first_seq + 1))
+
+    def clear(self):
+        self._head = 0
+        self._len = 0
+        self._total = 0
+
+    def snapshot(self):
+        """Compact copy of the retained window (for durable snapshots)."""
+        return {'total': self._total, **{name: self.column(name).copy() for name in self.COLUMNS}}
+
+    def restore(self, snap):
+        """Loads a `snapshot()`; keeps only the newest `capacity` readings if it is larger."""
+        n = min(len(snap['temperature']), self.capacity)
+        for name in self.COLUMNS:
+            values = np.asarray(snap[name])[len(snap[name]) - n:]
+            self._cols[name][:n] = values
+            self._cols[name][self.capacity:self.capacity + n] = values
+        self._head = 0
+        self._len = n
+        self._total = int(snap['total'])
+
+    def _write(self, slot, values):
+        mirror = slot + self.capacity if slot < self.capacity else slot - self.capacity
+        for name, value in values.items():
+            col = self._cols[name]
+            col[slot] = value
+            col[mirror] = value
+
+    def append(self, timestamp_us, hours, temperature, humidity, rsl=None):
+        """Adds a reading; returns the evicted reading's temperature (or None)."""
+        evicted = None
+        if self._len == self.capacity:
+            evicted = float(self._cols['temperature'][self._head])
+            self._head = (self._head + 1) % self.capacity
+            self._len -= 1
+        slot = (self._head + self._len) % self.capacity
+        self._write(slot, {
+            'timestamp_us': timestamp_us, 'hours': hours, 'temperature': temperature,
+            'humidity': humidity, 'rsl': np.nan if rsl is None else rsl,
+        })
+        self._len += 1
+        self._total += 1
+        return evicted
+
+    def append_many(self, timestamp_us, hours, temperature, humidity, rsl=None):
+        """Vectorised `append` for a batch of readings.
+
+        Returns an array with, for each appended reading, the temperature of
+        the reading it evicted (NaN where nothing was evicted) - exactly what
+        calling `append` in a loop would have returned.
+        """
+        cols = {
+            'timestamp_us': np.asarray(timestamp_us, dtype=np.int64),
+            'hours': np.asarray(hours),
+            'temperature': np.asarray(temperature, dtype=np.float64),
+            'humidity': np.asarray(humidity, dtype=np.float64),
+        }
+        n = len(cols['temperature'])
+        cols['rsl'] = np.full(n, np.nan) if rsl is None else np.asarray(rsl, dtype=np.float64)
+
+        # Reading i evicts logical position (len + i - capacity) of old+new data
+        positions = self._len + np.arange(n) - self.capacity
+        evicted = np.full(n, np.nan)
+        mask = positions >= 0
+        if mask.any():
+            combined = np.concatenate([self.column('temperature'), cols['temperature']])
+            evicted[mask] = combined[positions[mask]]
+
+        keep = min(n, self.capacity)  # Only the last `capacity` readings can survive
+        slots = (self._head + self._len + np.arange(n - keep, n)) % self.capacity
+        for name, values in cols.items():
+            col = self._cols[name]
+            col[slots] = values[n - keep:]
+            col[slots + self.capacity] = values[n - keep:]
+        total = self._len + n
+        if total > self.capacity:
+            self._head = (self._head + total - self.capacity) % self.capacity
+        self._len = min(total, self.capacity)
+        self._total += n
+        return evicted
+
+    def set_last(self, name, value):
+        """Overwrites one field of the newest reading (e.g. its RSL once predicted)."""
+        if self._len == 0: raise IndexError("history is empty")
+        slot = (self._head + self._len - 1) % self.capacity
+        self._write(slot, {name: np.nan if value is None else value})
+
+    def set_tail(self, name, values):
+        """Overwrites one field of the newest `len(values)` readings (oldest first)."""
+        values = np.asarray(values)
+        k = min(len(values), self._len)
+        slots = (self._head + self._len - k + np.arange(k)) % self.capacity
+        col = self._cols[name]
+        col[slots] = values[len(values) - k:]
+        col[slots + self.capacity] = values[len(values) - k:]
+
+    def column(self, name):
+        """Zero-copy, read-only view of one column, oldest reading first."""
+        view = self._cols[name][self._head:self._head + self._len]
+        view.flags.writeable = False
+        return view
+
+    def last(self, name):
+        if self._len == 0: return None
+        return self._cols[name][self._head + self._len - 1].item()
+
+    def index_range(self, from_us, to_us):
+        """(lo, hi) positions of the readings timestamped within [from_us, to_us].
+
+        Binary search, so it assumes readings were appended in timestamp order.
+        """
+        stamps = self.column('timestamp_us')
+        return int(np.searchsorted(stamps, from_us, side='left')), int(np.searchsorted(stamps, to_us, side='right'))
+
+    def to_json(self, tz, start=0, index=None):
+        """Serialises readings [start:] (or the positions in `index`) straight from the columns.
+
+        Produces the same JSON array `jsonify(history)` did for the old
+        list-of-dicts (keys sorted, rsl null when missing), plus each
+        reading's `seq` for delta polling.
+        """
+        pick = slice(start, None) if index is None else np.asarray(index, dtype=np.int64)
+        seqs = self.first_seq + np.arange(self._len)[pick]
+        stamps = format_timestamps(self.column('timestamp_us')[pick], tz)
+        hours = self.column('hours')[pick].tolist()
+        temps = self.column('temperature')[pick].tolist()
+        hums = self.column('humidity')[pick].tolist()
+        rsls = self.column('rsl')[pick].tolist()
+        rows = [
+            f'{{"hours":{_json_number(h)},"humidity":{_json_number(hu)},"rsl":{_json_number(r)},'
+            f'"seq":{seq},"temperature":{_json_number(t)},"timestamp":"{ts}"}}'
+            for seq, ts, h, t, hu, r in zip(seqs.tolist(), stamps, hours, temps, hums, rsls)
+        ]
+        return '[' + ','.join(rows) + ']'
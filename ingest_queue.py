@@ -0,0 +1,100 @@
+# ==============================================================================
+# ingest_queue.py - Bounded asynchronous ingest queue with backpressure
+# ==============================================================================
+# /api/data can acknowledge a validated reading with 202 and leave the
+# pipeline (history, RSL, alerts, KPIs, persistence, push) to a background
+# worker. One worker drains the FIFO in batches and hands each device's
+# readings, still in arrival order, to `apply(device_id, items)` - so
+# per-device ordering holds and a burst becomes one vectorised batch per
+# device instead of hundreds of lock round-trips. When the queue is full,
+# `put` raises QueueFull and callers answer 429 with `retry_after()`.
+import math
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+
+class QueueFull(Exception):
+    """The ingest queue is at capacity (backpressure: retry later)."""
+
+
+class IngestQueue:
+    """FIFO of readings drained by one worker thread in per-device batches."""
+
+    def __init__(self, apply, capacity=10_000, max_batch=1_000):
+        self.apply = apply  # apply(device_id, [item, ...]) - called on the worker thread, in arrival order
+        self.capacity = capacity
+        self.max_batch = max_batch
+        self.processed = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=capacity)
+        self._pending = {}  # device_id -> readings queued but not yet applied
+        self._lock = threading.Lock()
+        self._worker = None
+        self._drain_rate = None  # Readings/s, EWMA over recent batches (for Retry-After)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def pending(self, device_id):
+        """Readings for `device_id` accepted but not yet applied."""
+        return self._pending.get(device_id, 0)
+
+    def retry_after(self):
+        """Whole seconds until the backlog should have drained (at least 1)."""
+        rate = self._drain_rate
+        if not rate: return 1
+        return max(1, math.ceil(self.depth() / rate))
+
+    def put(self, device_id, item, wait=False):
+        """Queues `item` for `device_id`; raises QueueFull when at capacity.
+
+        With `wait=True` returns a Future resolved once the item was applied
+        (used to keep a synchronous request behind queued ones for its device).
+        """
+        future = Future() if wait else None
+        with self._lock:
+            try: self._queue.put_nowait((device_id, item, future))
+            except queue.Full: raise QueueFull() from None
+            self._pending[device_id] = self._pending.get(device_id, 0) + 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='ingest-queue', daemon=True)
+                self._worker.start()
+        return future
+
+    def join(self):
+        """Blocks until everything queued so far has been applied."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try: batch.append(self._queue.get_nowait())
+                except queue.Empty: break
+            start = time.perf_counter()
+            by_device = {}  # Insertion-ordered: devices in order of first appearance, readings in arrival order
+            for device_id, item, future in batch: by_device.setdefault(device_id, []).append((item, future))
+            for device_id, entries in by_device.items():
+                try:
+                    self.apply(device_id, [item for item, _ in entries])
+                    error = None
+                except Exception as e:
+                    print(f"❌ Queued ingest failed [{device_id}]: {e}"); traceback.print_exc()
+                    error = e
+                with self._lock:
+                    left = self._pending[device_id] - len(entries)
+                    if left: self._pending[device_id] = left
+                    else: del self._pending[device_id]
+                for _, future in entries:
+                    if future is None: continue
+                    if error is None: future.set_result(None)
+                    else: future.set_exception(error)
+            elapsed = max(time.perf_counter() - start, 1e-6)
+            rate = len(batch) / elapsed
+            self._drain_rate = rate if self._drain_rate is None else 0.8 * self._drain_rate + 0.2 * rate
+            self.processed += len(batch)
+            self.batches += 1
+            for _ in batch: self._queue.task_done()
@@ -0,0 +1,167 @@
+# ==============================================================================
+# kpi_engine.py - Streaming KPI aggregator for the Cold Chain Monitor
+# ==============================================================================
+# Keeps running sums/counts and monotonic min/max deques over the retained
+# history window so every reading costs O(1) (amortised) instead of a full
+# DataFrame rebuild + rescan of the history.
+#
+# The one value that can't be reproduced incrementally is pandas' pairwise
+# float sum: when the window mean sits on a 0.05 rounding tie, the running sum
+# and pandas may land a few ulps apart on different sides of it. Those (rare)
+# steps recompute the mean over the window the way pandas does, so `avg_temp`
+# stays identical to the original implementation.
+from collections import deque
+
+import numpy as np
+
+TIE_EPS = 1e-6  # |10 * mean - k.5| below this: too close to call with a running sum
+
+
+class StreamingKPIs:
+    """Incrementally maintained temperature KPIs over a FIFO retention window.
+
+    Readings are added with `push()` and retracted (oldest first) with
+    `evict()` when they fall out of the history window. `as_dict()` returns
+    the same `kpis` dict the original pandas implementation produced.
+    """
+
+    def __init__(self, critical_temp, alert_low, alert_high, interval_hours):
+        self.critical_temp = critical_temp
+        self.alert_low = alert_low
+        self.alert_high = alert_high
+        self.interval_hours = interval_hours
+        self.reset()
+
+    def reset(self):
+        """Drops all readings."""
+        self._sum = 0.0
+        self._comp = 0.0  # Neumaier compensation term for the running sum
+        self._count = 0
+        self._above_critical = 0
+        self._in_range = 0
+        self._min_dq = deque()  # (index, temp), temps increasing
+        self._max_dq = deque()  # (index, temp), temps decreasing
+        self._head = 0  # Index of the oldest retained reading
+        self._tail = 0  # Index the next pushed reading will get
+
+    def __len__(self):
+        return self._count
+
+    # --- Window updates ---
+    def _add(self, value):
+        total = self._sum + value
+        if abs(self._sum) >= abs(value):
+            self._comp += (self._sum - total) + value
+        else:
+            self._comp += (value - total) + self._sum
+        self._sum = total
+
+    def push(self, temp):
+        """Adds the newest reading to the window."""
+        temp = float(temp)
+        self._add(temp)
+        self._count += 1
+        if temp > self.critical_temp: self._above_critical += 1
+        if self.alert_low <= temp <= self.alert_high: self._in_range += 1
+
+        idx = self._tail
+        self._tail += 1
+        while self._min_dq and self._min_dq[-1][1] >= temp: self._min_dq.pop()
+        self._min_dq.append((idx, temp))
+        while self._max_dq and self._max_dq[-1][1] <= temp: self._max_dq.pop()
+        self._max_dq.append((idx, temp))
+
+    def evict(self, temp):
+        """Retracts the oldest reading (`temp` must be its temperature)."""
+        if self._count == 0:
+            raise IndexError("evict from empty window")
+        temp = float(temp)
+        self._add(-temp)
+        self._count -= 1
+        if temp > self.critical_temp: self._above_critical -= 1
+        if self.alert_low <= temp <= self.alert_high: self._in_range -= 1
+
+        if self._min_dq and self._min_dq[0][0] == self._head: self._min_dq.popleft()
+        if self._max_dq and self._max_dq[0][0] == self._head: self._max_dq.popleft()
+        self._head += 1
+        if self._count == 0: self.reset()  # Clears any residual rounding error
+
+    def push_many(self, temps, evicted):
+        """Batch form of `push(temps[i])` + `evict(evicted[i])` (NaN = nothing evicted).
+
+        Counters and the min/max deques are updated with whole-array NumPy
+        passes. The running sum is the one sequential dependency: it is scanned
+        in the same order as the per-reading path so the window means match it
+        bit for bit. Returns the window mean after each step.
+        """
+        temps = np.asarray(temps, dtype=np.float64)
+        evicted = np.asarray(evicted, dtype=np.float64)
+        n = len(temps)
+        if n == 0: return np.empty(0)
+        has_ev = ~np.isnan(evicted)
+        gone = evicted[has_ev]
+
+        counts = self._count + np.arange(1, n + 1) - np.cumsum(has_ev)
+        if counts.min() < 1: raise IndexError("evict from empty window")
+        means = []
+        for t, e in zip(temps.tolist(), evicted.tolist()):
+            self._add(t)
+            if e == e: self._add(-e)
+            means.append(self._sum + self._comp)
+        means = np.asarray(means) / counts
+
+        self._count = int(counts[-1])
+        self._above_critical += int((temps > self.critical_temp).sum() - (gone > self.critical_temp).sum())
+        in_range = lambda a: int(((a >= self.alert_low) & (a <= self.alert_high)).sum())
+        self._in_range += in_range(temps) - in_range(gone)
+
+        # Monotonic deques: a batch element survives iff it is strictly below
+        # (min) / above (max) everything pushed after it; older entries survive
+        # iff they beat the whole batch. Then drop whatever was evicted.
+        idx = np.arange(self._tail, self._tail + n)
+        suffix_min = np.append(np.minimum.accumulate(temps[::-1])[::-1][1:], np.inf)
+        suffix_max = np.append(np.maximum.accumulate(temps[::-1])[::-1][1:], -np.inf)
+        self._tail += n
+        self._head += int(has_ev.sum())
+        for dq, keep_new, beats in ((self._min_dq, temps < suffix_min, lambda v: v < temps.min()),
+                                    (self._max_dq, temps > suffix_max, lambda v: v > temps.max())):
+            while dq and not beats(dq[-1][1]): dq.pop()
+            dq.extend(zip(idx[keep_new].tolist(), temps[keep_new].tolist()))
+            while dq and dq[0][0] < self._head: dq.popleft()
+        return means
+
+    # --- Aggregates ---
+    def mean(self):
+        return (self._sum + self._comp) / self._count if self._count else None
+
+    def min(self):
+        return self._min_dq[0][1] if self._min_dq else None
+
+    def max(self):
+        return self._max_dq[0][1] if self._max_dq else None
+
+    def time_above_critical(self):
+        return float(self._above_critical * self.interval_hours)
+
+    def as_dict(self, journey_time_hours, temps=None):
+        """Builds the KPI dict merged into `latest_data`.
+
+        `temps` (the retained temperatures, oldest first) settles `avg_temp`
+        near a rounding tie: the mean is then np.mean over them, as pandas.
+        """
+        kpis = {
+            "avg_temp": None, "min_temp": None, "max_temp": None,
+            "time_in_range_hrs": 0.0, "time_out_range_hrs": 0.0,
+            "journey_time_hours": float(journey_time_hours),
+            "time_above_critical": self.time_above_critical()
+        }
+        if self._count:
+            mean = float(self.mean())
+            scaled = mean * 10
+            if temps is not None and abs(scaled - np.floor(scaled) - 0.5) < TIE_EPS: mean = float(np.mean(temps))
+            kpis["avg_temp"] = round(mean, 1)
+            kpis["min_temp"] = round(float(self.min()), 1)
+            kpis["max_temp"] = round(float(self.max()), 1)
+            kpis["time_in_range_hrs"] = round(float(self._in_range * self.interval_hours), 1)
+            kpis["time_out_range_hrs"] = round(float((self._count - self._in_range) * self.interval_hours), 1)
+        return kpis
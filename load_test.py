@@ -0,0 +1,279 @@
+"""
+Load Test - simulated device fleet + dashboard readers against the backend
+
+Replaces the one-device `send_test_data.py` loop for performance work:
+N simulated devices (the same random walk with excursions and recoveries)
+post readings at a fixed aggregate rate while dashboard-style readers poll
+/api/status, /api/history?since= and /api/alerts?since=, all over pooled
+keep-alive connections (httpx).
+
+The load is open-loop: every request has a scheduled send time, and latency
+is measured from that time, so a stalled server shows up as latency instead
+of quietly lowering the request rate (no coordinated omission).
+
+Reports p50/p95/p99/max latency and error rate per endpoint, writes the
+results as JSON (--out) and compares them against a stored baseline
+(--baseline), exiting with status 1 on a regression.
+
+Usage:
+    python load_test.py --devices 50 --rate 200 --read-rate 50 --duration 30
+    python load_test.py --spawn --out results.json --save-baseline baseline.json
+    python load_test.py --spawn --baseline baseline.json   # CI regression check
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:  # Only the load generator needs it
+    httpx = None
+
+ENDPOINTS = ('/api/data', '/api/status', '/api/history', '/api/alerts')
+PERCENTILES = (50, 95, 99)
+
+
+# --- Simulated device (same walk as send_test_data.py) ---
+class DeviceSimulator:
+    """One sensor: ±0.5 °C random walk, 10% excursions, recovery above 12 °C, GPS drift."""
+
+    def __init__(self, device_id, seed):
+        self.device_id = device_id
+        self.rng = random.Random(seed)
+        self.temp = 8.0
+        self.lat = 27.7172 + self.rng.uniform(-0.5, 0.5)  # Spread the fleet around Kathmandu
+        self.lng = 85.3240 + self.rng.uniform(-0.5, 0.5)
+        self.history_seq = None  # Dashboard cursors (X-History-Last-Seq / X-Alerts-Last-Seq)
+        self.alerts_seq = None
+
+    def next_reading(self):
+        rng = self.rng
+        self.temp += rng.uniform(-0.5, 0.5)
+        if rng.random() < 0.1: self.temp += rng.uniform(2, 5)  # Cold chain breach
+        if self.temp > 12.0 and rng.random() < 0.05: self.temp -= rng.uniform(2, 4)  # Recovery
+        self.temp = max(5.0, min(18.0, self.temp))
+        self.lat += rng.uniform(-0.001, 0.001)
+        self.lng += rng.uniform(-0.001, 0.001)
+        return {'device_id': self.device_id, 'temp': round(self.temp, 1), 'hum': round(rng.uniform(50.0, 85.0), 1),
+                'lat': round(self.lat, 4), 'lng': round(self.lng, 4)}
+
+
+# --- Load generation ---
+class Recorder:
+    """Latencies (seconds) and error counts per endpoint."""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+
+    def record(self, endpoint, scheduled, status):
+        self.latencies[endpoint].append(time.perf_counter() - scheduled)
+        self.statuses[endpoint][str(status)] = self.statuses[endpoint].get(str(status), 0) + 1
+        if not (isinstance(status, int) and (200 <= status < 300 or status == 304)): self.errors[endpoint] += 1
+
+
+async def _request(client, recorder, endpoint, scheduled, method, url, **kwargs):
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = response.status_code
+        return response if status < 400 else None
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+        return None
+    finally:
+        recorder.record(endpoint, scheduled, status)
+
+
+async def _paced(interval, offset, deadline, make_request):
+    """Schedules `make_request(scheduled)` every `interval` s until `deadline`, without waiting for replies."""
+    tasks = []
+    scheduled = time.perf_counter() + offset
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0: await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(make_request(scheduled)))
+        scheduled += interval
+    await asyncio.gather(*tasks)
+
+
+async def _device_writer(client, recorder, device, interval, offset, deadline):
+    async def send(scheduled):
+        await _request(client, recorder, '/api/data', scheduled, 'POST', '/api/data', json=device.next_reading())
+    await _paced(interval, offset, deadline, send)
+
+
+async def _dashboard_reader(client, recorder, fleet, interval, offset, deadline, seed):
+    """Polls status/history/alerts in turn for random devices, carrying delta cursors like script.js."""
+    rng = random.Random(seed)
+    turn = [0]
+
+    async def poll(scheduled):
+        device = rng.choice(fleet)
+        endpoint = ENDPOINTS[1 + turn[0] % 3]
+        turn[0] += 1
+        params = {'device': device.device_id}
+        if endpoint == '/api/history' and device.history_seq is not None: params['since'] = device.history_seq
+        if endpoint == '/api/alerts' and device.alerts_seq is not None: params['since'] = device.alerts_seq
+        response = await _request(client, recorder, endpoint, scheduled, 'GET', endpoint, params=params)
+        if response is None: return
+        if 'X-History-Last-Seq' in response.headers: device.history_seq = int(response.headers['X-History-Last-Seq'])
+        if 'X-Alerts-Last-Seq' in response.headers: device.alerts_seq = int(response.headers['X-Alerts-Last-Seq'])
+
+    await _paced(interval, offset, deadline, poll)
+
+
+async def run_load(url, devices, rate, read_rate, readers, duration, connections, timeout, seed=0):
+    """Runs the load for `duration` seconds; returns (Recorder, elapsed seconds)."""
+    if httpx is None: sys.exit("❌ load_test.py needs httpx: pip install httpx")
+    recorder = Recorder()
+    fleet = [DeviceSimulator(f"load-{i:04d}", seed + i) for i in range(devices)]
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        # Register every device once so readers never hit a 404 for an unseen device
+        await asyncio.gather(*(client.post('/api/data', json=d.next_reading()) for d in fleet))
+        start = time.perf_counter()
+        deadline = start + duration
+        jobs = []
+        if rate > 0:
+            interval = devices / rate  # Each device posts every `interval` s; offsets spread them evenly
+            jobs += [_device_writer(client, recorder, d, interval, interval * i / devices, deadline)
+                     for i, d in enumerate(fleet)]
+        if read_rate > 0 and readers > 0:
+            interval = readers / read_rate
+            jobs += [_dashboard_reader(client, recorder, fleet, interval, interval * k / readers, deadline, seed + k)
+                     for k in range(readers)]
+        await asyncio.gather(*jobs)
+        return recorder, time.perf_counter() - start
+
+
+# --- Results ---
+def summarize(recorder, elapsed, config):
+    """Machine-readable results: per-endpoint counts, error rate and latency percentiles (ms)."""
+    endpoints = {}
+    for name in ENDPOINTS:
+        latencies = np.asarray(recorder.latencies[name]) * 1000
+        if len(latencies) == 0: continue
+        stats = {'requests': len(latencies), 'errors': recorder.errors[name],
+                 'error_rate': round(recorder.errors[name] / len(latencies), 5),
+                 'throughput_rps': round(len(latencies) / elapsed, 2), 'statuses': recorder.statuses[name]}
+        for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)): stats[f'p{p}_ms'] = round(float(value), 3)
+        stats['max_ms'] = round(float(latencies.max()), 3)
+        endpoints[name] = stats
+    return {'timestamp': datetime.now(timezone.utc).isoformat(), 'elapsed_s': round(elapsed, 3),
+            'host': platform.node(), 'python': platform.python_version(), 'config': config, 'endpoints': endpoints}
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """Regressions vs a baseline: p95/p99 above baseline*(1+tolerance)+slack, or a higher error rate.
+
+    A percentile is only gated once both runs have enough samples past it
+    (>= 20 requests in its tail), otherwise it is noise.
+    """
+    regressions = []
+    for name, base in baseline.get('endpoints', {}).items():
+        current = results['endpoints'].get(name)
+        if current is None:
+            regressions.append(f"{name}: no requests in this run")
+            continue
+        for p in (95, 99):
+            key = f'p{p}_ms'
+            if min(base['requests'], current['requests']) * (100 - p) / 100 < 20: continue
+            limit = base[key] * (1 + tolerance) + slack_ms
+            if current[key] > limit:
+                regressions.append(f"{name} {key}: {current[key]:.1f} ms > {limit:.1f} ms (baseline {base[key]:.1f})")
+        if current['error_rate'] > base['error_rate'] + 0.01:
+            regressions.append(f"{name} error rate: {current['error_rate']:.2%} (baseline {base['error_rate']:.2%})")
+    return regressions
+
+
+def print_report(results, baseline=None):
+    print(f"\n{'Endpoint':<14}{'requests':>10}{'rps':>9}{'errors':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, s in results['endpoints'].items():
+        print(f"{name:<14}{s['requests']:>10,}{s['throughput_rps']:>9.1f}{s['error_rate']:>9.2%}"
+              f"{s['p50_ms']:>8.1f}ms{s['p95_ms']:>8.1f}ms{s['p99_ms']:>8.1f}ms{s['max_ms']:>8.1f}ms")
+        base = (baseline or {}).get('endpoints', {}).get(name)
+        if base: print(f"{'  baseline':<14}{base['requests']:>10,}{base['throughput_rps']:>9.1f}{base['error_rate']:>9.2%}"
+                       f"{base['p50_ms']:>8.1f}ms{base['p95_ms']:>8.1f}ms{base['p99_ms']:>8.1f}ms{base['max_ms']:>8.1f}ms")
+
+
+# --- Local server for self-contained runs ---
+def spawn_server(port):
+    """Starts app.py on `port` (threaded, keep-alive, in-memory store) and waits until it answers."""
+    env = dict(os.environ, COLDCHAIN_DB_PATH=os.environ.get('COLDCHAIN_DB_PATH', ''))
+    code = ("import werkzeug.serving as s; s.WSGIRequestHandler.protocol_version = 'HTTP/1.1'\n"
+            f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)")
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/devices", timeout=0.5)
+            return server
+        except httpx.HTTPError: time.sleep(0.1)
+    server.kill()
+    sys.exit("❌ Spawned server did not come up")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fleet load test for the cold chain backend")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Backend base URL")
+    parser.add_argument('--spawn', action='store_true', help="Start app.py locally for the run (ignores --url)")
+    parser.add_argument('--port', type=int, default=5055, help="Port for --spawn")
+    parser.add_argument('--devices', type=int, default=50, help="Simulated devices")
+    parser.add_argument('--rate', type=float, default=100.0, help="Aggregate POST /api/data rate (readings/s)")
+    parser.add_argument('--read-rate', type=float, default=30.0, help="Aggregate dashboard GET rate (requests/s)")
+    parser.add_argument('--readers', type=int, default=10, help="Concurrent dashboard readers")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load")
+    parser.add_argument('--connections', type=int, default=64, help="Keep-alive connection pool size")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Per-request timeout (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="Write the results JSON here")
+    parser.add_argument('--baseline', help="Compare against this results JSON; exit 1 on regression")
+    parser.add_argument('--save-baseline', help="Also write the results as a new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95/p99 growth (fraction)")
+    parser.add_argument('--slack-ms', type=float, default=2.0, help="Absolute latency slack on top of --tolerance")
+    args = parser.parse_args(argv)
+    if httpx is None: sys.exit("❌ load_test.py needs httpx: pip install httpx")
+
+    server = spawn_server(args.port) if args.spawn else None
+    url = f"http://127.0.0.1:{args.port}" if server else args.url
+    config = {k: getattr(args, k) for k in ('devices', 'rate', 'read_rate', 'readers', 'duration', 'connections', 'seed')}
+    print(f"🚚 {args.devices} devices @ {args.rate:g} readings/s + {args.readers} readers @ {args.read_rate:g} req/s "
+          f"for {args.duration:g}s against {url}")
+    try:
+        recorder, elapsed = asyncio.run(run_load(url, args.devices, args.rate, args.read_rate, args.readers,
+                                                 args.duration, args.connections, args.timeout, args.seed))
+    finally:
+        if server: server.terminate(); server.wait()
+
+    results = summarize(recorder, elapsed, config)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+    print_report(results, baseline)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w') as f: json.dump(results, f, indent=2)
+            print(f"💾 Results written to {path}")
+    if baseline is not None:
+        if baseline.get('config') != config: print("⚠️ Baseline was recorded with a different load configuration.")
+        regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print("\n❌ Regressions vs baseline:")
+            for line in regressions: print(f"   {line}")
+            return 1
+        print("\n✅ No regressions vs baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# ==============================================================================
+# metrics.py - Low-overhead instrumentation in Prometheus text format
+# ==============================================================================
+# Counters, gauges and fixed-bucket latency histograms kept in plain Python
+# structures (one short lock per update, no allocation on the hot path) and
+# rendered in the Prometheus text exposition format on scrape. Gauges are
+# callbacks evaluated at scrape time, so they cost nothing between scrapes.
+# SamplingProfiler is an opt-in wall-clock sampler over all threads that
+# produces folded stacks (flamegraph.pl / speedscope input).
+from bisect import bisect_left
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Seconds
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'): return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """The metrics of one process. `enabled = False` turns every update into a no-op."""
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        metric.registry = self
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback, labels=()):
+        return self.register(Gauge(name, help, callback, labels))
+
+    def render(self):
+        """All metrics in Prometheus text format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.registry = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled: return
+        lock = self._lock
+        lock.acquire()  # Cheaper than `with` on this path
+        try: self._values[labels] = self._values.get(labels, 0) + amount
+        finally: lock.release()
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock: values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {_number(v)}" for key, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram; an observation is a bisect plus three increments."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.registry = None
+        self._series = {}  # labels -> [bucket counts (last = +Inf), sum, count]
+        self._children = {}  # leading labels -> {last label: the same series}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not self.registry.enabled: return
+        lock = self._lock
+        lock.acquire()
+        try: self._add(labels, value)
+        finally: lock.release()
+
+    def observe_laps(self, prefix, laps):
+        """Records `(last label, value)` pairs under one lock acquisition (see Stopwatch)."""
+        if not self.registry.enabled: return
+        lock, buckets = self._lock, self.buckets
+        lock.acquire()
+        try:
+            children = self._children.get(prefix)  # last label -> series, so no label tuples are built per lap
+            if children is None: children = self._children[prefix] = {}
+            for label, value in laps:  # _add, inlined: this loop runs for every ingest stage
+                series = children.get(label)
+                if series is None:
+                    series = children[label] = self._series.setdefault(prefix + (label,), [[0] * (len(buckets) + 1), 0.0, 0])
+                series[0][bisect_left(buckets, value)] += 1
+                series[1] += value
+                series[2] += 1
+        finally: lock.release()
+
+    def _add(self, labels, value):  # Caller holds the lock
+        series = self._series.get(labels)
+        if series is None: series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock: series = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        lines = []
+        for key, (counts, total, n) in series:
+            running = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                running += c
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, [('le', _number(bound))])} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {n}")
+        return lines
+
+
+class Gauge:
+    """Value computed at scrape time: `callback()` returns a number, or {label values: number}."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, callback, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.callback = callback
+        self.registry = None
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict): value = {(): value}
+        return [f"{self.name}{_labels(self.labels, key)} {_number(v)}" for key, v in sorted(value.items())]
+
+
+class Stopwatch:
+    """Per-stage timer for a pipeline: each `lap(stage)` times the stage since the previous lap.
+
+    Laps are buffered and handed to the histogram in one go by `stop()`, so a
+    lap costs a clock read and an append. `labels` are the histogram's
+    leading label values; the stage is its last label.
+    """
+    __slots__ = ('histogram', 'labels', 'last', 'laps')
+
+    def __init__(self, histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.laps = []
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.laps.append((stage, now - self.last))
+        self.last = now
+
+    def stop(self):
+        """Records the buffered laps (idempotent)."""
+        if self.laps: self.histogram.observe_laps(self.labels, self.laps)
+        self.laps = []
+
+
+class RequestTimer:
+    """WSGI middleware: latency of every request by route pattern, method and status.
+
+    The matched route is read from the werkzeug request in the environ when
+    the app calls start_response (Flask clears it afterwards), so the label
+    is `/api/devices/<device_id>/status` rather than the raw path; unmatched
+    paths share one label. Streaming responses are timed until the app
+    returns, not until the stream ends.
+    """
+
+    def __init__(self, wsgi_app, histogram):
+        self.wsgi_app = wsgi_app
+        self.histogram = histogram
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        labels = ['unmatched', '500']
+
+        def record_status(code, headers, exc_info=None):
+            rule = getattr(environ.get('werkzeug.request'), 'url_rule', None)
+            if rule is not None: labels[0] = rule.rule
+            labels[1] = code[:3]
+            return start_response(code, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, record_status)
+        finally:
+            self.histogram.observe(time.perf_counter() - start, labels[0], environ.get('REQUEST_METHOD', ''), labels[1])
+
+
+def resident_memory_bytes():
+    """Current RSS (Linux /proc), else the peak RSS from getrusage."""
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+class SamplingProfiler:
+    """Samples every thread's stack every `interval` seconds on a background thread.
+
+    Costs nothing until started; while running, the overhead is one
+    `sys._current_frames()` walk per sample. `folded()` returns the samples
+    as `frame;frame;frame count` lines, root first.
+    """
+
+    def __init__(self):
+        self.interval = 0.005
+        self.samples = 0
+        self.started_at = None
+        self._stacks = _Tally()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=0.005):
+        with self._lock:
+            if self._thread is not None: return False
+            self.interval = max(0.001, float(interval))
+            self.samples = 0
+            self.started_at = time.time()
+            self._stacks = _Tally()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None: return False
+        self._stop.set()
+        thread.join()
+        return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
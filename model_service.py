@@ -0,0 +1,139 @@
+# ==============================================================================
+# model_service.py - Lazy loading and micro-batched inference for the RSL model
+# ==============================================================================
+# The joblib model is only needed when the Q10 path fails, so it is loaded on
+# first use (optionally memory-mapped, and warmed with one dummy prediction)
+# instead of at import. Predictions go through a micro-batching queue: requests
+# arriving within a couple of milliseconds of each other - from any device -
+# share a single `model.predict` call on one stacked feature matrix.
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+import numpy as np
+
+FEATURE_ORDER = ['temperature', 'humidity', 'avg_temp_last_6h', 'max_temp_last_6h',
+                 'min_temp_last_6h', 'time_above_critical', 'journey_time_hours']
+
+
+def rolling_features(history, kpi_engine, window):
+    """The model's rolling/history features for the newest reading, without rescanning history.
+
+    The 6h window is read from the ring buffer's tail (O(window)) and
+    `time_above_critical` comes from the streaming KPI counters (O(1)).
+    """
+    recent = history.column('temperature')[-window:]
+    return float(recent.mean()), float(recent.max()), float(recent.min()), kpi_engine.time_above_critical()
+
+
+def feature_frame(model, rows):
+    """Feature matrix in the form `model` was fitted on (named columns if it was fitted on a frame)."""
+    if not hasattr(model, 'feature_names_in_'): return rows
+    import pandas as pd
+    return pd.DataFrame(rows, columns=FEATURE_ORDER)
+
+
+class LazyModel:
+    """joblib model loaded on first `get()` (thread-safe), optionally mmap'd and warmed up."""
+
+    def __init__(self, path, mmap_mode=None, warm_up=True):
+        self.path = path
+        self.mmap_mode = mmap_mode  # e.g. 'r': tree arrays stay in the page cache, shared across workers
+        self.warm_up = warm_up
+        self.error = None
+        self.load_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        """The model, loading it if needed; None if the file is missing or fails to load."""
+        if self._model is not None or self.error is not None: return self._model
+        with self._lock:
+            if self._model is None and self.error is None: self._load()
+        return self._model
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            self.error = f"Model file not found: {self.path}"
+            print(f"⚠️ Error: {self.error}")
+            return
+        start = time.perf_counter()
+        try:
+            import joblib  # Only paid for by processes that actually need the model
+            model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+            if self.warm_up: model.predict(feature_frame(model, np.zeros((1, len(FEATURE_ORDER)))))  # First call builds lazy state
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ Error loading model: {e}"); traceback.print_exc()
+            return
+        self._model = model
+        self.load_seconds = time.perf_counter() - start
+        print(f"✅ ML Model loaded in {self.load_seconds * 1000:.0f} ms (mmap_mode={self.mmap_mode}).")
+
+    def preload(self):
+        """Loads (and warms) the model on a background thread."""
+        threading.Thread(target=self.get, name='model-preload', daemon=True).start()
+
+
+class MicroBatcher:
+    """Coalesces concurrent `predict()` calls into one `model.predict` per batch.
+
+    The first request of a batch waits at most `max_wait` seconds for others
+    to join (up to `max_batch` rows); one worker thread runs the model and
+    hands every caller its own prediction.
+    """
+
+    def __init__(self, model, max_batch=64, max_wait=0.002):
+        self.model = model  # LazyModel
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch_seen': 0}
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='model-batcher', daemon=True)
+                    self._worker.start()
+
+    def predict(self, features, timeout=5.0):
+        """Prediction for one feature row (ordered as FEATURE_ORDER). Blocks until its batch ran."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((np.asarray(features, dtype=np.float64), future))
+        return future.result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0: break
+                try: batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty: break
+            self._predict(batch)
+
+    def _predict(self, batch):
+        futures = [f for _, f in batch]
+        try:
+            model = self.model.get()
+            if model is None: raise RuntimeError(self.model.error or "model unavailable")
+            predictions = model.predict(feature_frame(model, np.vstack([row for row, _ in batch])))
+        except Exception as e:
+            for future in futures: future.set_exception(e)
+            return
+        self.stats['requests'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(batch))
+        for future, value in zip(futures, np.asarray(predictions).tolist()): future.set_result(value)
@@ -0,0 +1,190 @@
+# ==============================================================================
+# persistence.py - Durable append-only storage for readings and alert events
+# ==============================================================================
+# SQLite in WAL mode, written by one background thread with group commit:
+# ingest only enqueues rows (no I/O, no fsync on the request path) and the
+# writer commits everything queued every `flush_interval` seconds. Per-device
+# snapshots are written every `snapshot_every` readings so a restart restores
+# the latest snapshot and replays only the log tail behind it.
+import copy
+import json
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from alert_log import AlertLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    device_id TEXT NOT NULL, seq INTEGER NOT NULL, ts_us INTEGER NOT NULL,
+    temperature REAL NOT NULL, humidity REAL NOT NULL, lat REAL, lng REAL,
+    PRIMARY KEY (device_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alert_events (
+    device_id TEXT NOT NULL, alert_id INTEGER NOT NULL, seq INTEGER NOT NULL, alert TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alert_events_device ON alert_events (device_id, alert_id);
+CREATE TABLE IF NOT EXISTS snapshots (
+    device_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, state BLOB NOT NULL
+);
+"""
+
+
+# --- Device state snapshots ---
+def snapshot_state(state):
+    """Copies everything needed to rebuild a DeviceState (caller holds state.lock)."""
+    return {
+        'seq': state.history.last_seq,
+        'history': state.history.snapshot(),
+        'kpi_engine': copy.deepcopy(state.kpi_engine),
+        'rollups': copy.deepcopy(state.rollups),
+        'summary': state.summary.export(),  # Its buckets in the fleet rollup tables
+        # One deepcopy so current_alert_info stays the same object as its log entry
+        'alerts': copy.deepcopy((state.alert_log, state.current_alert_info)),
+        'alerts_created': state.alerts_created,
+        'latest_data': dict(state.latest_data),
+        'track': copy.deepcopy(state.track),
+        'geofences': copy.deepcopy((state.geofences_inside, state.geofence_log, state.geofence_events_created)),
+    }
+
+
+def restore_state(state, snap):
+    """Loads a `snapshot_state()` dict into a fresh DeviceState."""
+    state.history.restore(snap['history'])
+    state.kpi_engine = snap['kpi_engine']
+    state.rollups = snap['rollups']
+    if 'summary' in snap: state.summary.restore(snap['summary'])  # Older snapshots: only the log tail is rolled up
+    state.alert_log, state.current_alert_info = snap['alerts']
+    if isinstance(state.alert_log, list): state.alert_log = AlertLog(state.alert_log)  # Snapshots from before the indexed log
+    state.alerts_created = snap['alerts_created']
+    state.latest_data = snap['latest_data']
+    state.snapshot_seq = snap['seq']
+    if 'track' in snap:  # Snapshots written before GPS tracks existed start with an empty track
+        state.track = snap['track']
+        state.geofences_inside, log, state.geofence_events_created = snap['geofences']
+        state.geofence_log = deque(log, maxlen=state.geofence_log.maxlen)  # The configured bound, also for older list snapshots
+
+
+# --- Reading log rows ---
+def reading_rows(device_id, first_seq, stamps_us, temps, hums, lats, lngs):
+    """`readings` table rows for consecutive seqs from `first_seq`."""
+    # REAL columns keep floats exactly, except that SQLite folds -0.0 into 0.0
+    return zip([device_id] * len(temps), range(first_seq, first_seq + len(temps)), np.asarray(stamps_us).tolist(),
+               np.asarray(temps).tolist(), np.asarray(hums).tolist(), lats, lngs)
+
+
+def read_tail(conn, device_id, after_seq):
+    """`(seqs, stamps_us, temps, hums, lats, lngs)` of the device's readings after `after_seq`, in seq order."""
+    rows = conn.execute("SELECT seq, ts_us, temperature, humidity, lat, lng FROM readings "
+                        "WHERE device_id = ? AND seq > ? ORDER BY seq", (device_id, after_seq)).fetchall()
+    if not rows: return (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),) * 2 + ([], [])
+    seqs, stamps, temps, hums, lats, lngs = zip(*rows)
+    return (np.asarray(seqs, dtype=np.int64), np.asarray(stamps, dtype=np.int64),
+            np.asarray(temps), np.asarray(hums), list(lats), list(lngs))
+
+
+class DurableStore:
+    """Append-only reading/alert log plus snapshots in one SQLite (WAL) file."""
+
+    def __init__(self, path, flush_interval=0.05, snapshot_every=10_000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self._queue = queue.SimpleQueue()
+        self.stats = {'commits': 0, 'readings': 0, 'alert_events': 0, 'snapshots': 0}
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._writer = threading.Thread(target=self._run, name='durable-store-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL: fsync at checkpoints, not on every commit
+        return conn
+
+    # --- Enqueue (called on the ingest path: never blocks on I/O) ---
+    def append_readings(self, device_id, first_seq, stamps_us, temps, hums, lats, lngs):
+        self._queue.put(('readings', device_id, first_seq, stamps_us, temps, hums, lats, lngs))
+
+    def append_alert_events(self, device_id, alerts):
+        if not alerts: return
+        self._queue.put(('alerts', device_id, [(a['id'], a['seq'], dict(a)) for a in alerts]))
+
+    def save_snapshot(self, device_id, snap):
+        self._queue.put(('snapshot', device_id, snap))
+
+    # --- Writer thread (group commit) ---
+    def _write(self, conn, item):
+        kind, device_id = item[0], item[1]
+        if kind == 'readings':
+            _, _, first_seq, stamps_us, temps, hums, lats, lngs = item
+            conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             reading_rows(device_id, first_seq, stamps_us, temps, hums, lats, lngs))
+            self.stats['readings'] += len(temps)
+        elif kind == 'alerts':
+            conn.executemany("INSERT INTO alert_events VALUES (?, ?, ?, ?)",
+                             [(device_id, alert_id, seq, json.dumps(a)) for alert_id, seq, a in item[2]])
+            self.stats['alert_events'] += len(item[2])
+        elif kind == 'snapshot':
+            snap = item[2]
+            # Never replaces a newer snapshot (worker processes sharing the file snapshot independently)
+            conn.execute("INSERT INTO snapshots VALUES (?, ?, ?) ON CONFLICT (device_id) DO UPDATE "
+                         "SET seq = excluded.seq, state = excluded.state WHERE excluded.seq > snapshots.seq",
+                         (device_id, snap['seq'], pickle.dumps(snap, protocol=pickle.HIGHEST_PROTOCOL)))
+            self.stats['snapshots'] += 1
+
+    def _run(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None: break
+            time.sleep(self.flush_interval)  # Let concurrent requests join this commit
+            waiters = []
+            with conn:  # One transaction for everything queued
+                while item is not None:
+                    if item[0] == 'flush': waiters.append(item[1])
+                    else: self._write(conn, item)
+                    try: item = self._queue.get_nowait()
+                    except queue.Empty: break
+                else:
+                    stop = True  # Shutdown marker: commit what we have, then exit
+            self.stats['commits'] += 1
+            for done in waiters: done.set()
+        conn.close()
+
+    def flush(self, timeout=30.0):
+        """Blocks until everything enqueued so far is committed."""
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join(10)
+
+    # --- Recovery ---
+    def load(self):
+        """Yields `(device_id, snapshot or None, tail)` for every stored device.
+
+        `tail` is `(seqs, stamps_us, temps, hums, lats, lngs)` NumPy arrays of
+        the readings logged after the snapshot, in sequence order.
+        """
+        conn = self._connect()
+        try:
+            devices = [r[0] for r in conn.execute("SELECT DISTINCT device_id FROM readings")]
+            for device_id in devices:
+                row = conn.execute("SELECT state FROM snapshots WHERE device_id = ?", (device_id,)).fetchone()
+                snap = pickle.loads(row[0]) if row else None
+                tail = read_tail(conn, device_id, snap['seq'] if snap else 0)
+                yield device_id, snap, tail
+        finally:
+            conn.close()
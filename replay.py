@@ -0,0 +1,312 @@
+# ==============================================================================
+# replay.py - Offline journey replay and what-if RSL engine
+# ==============================================================================
+# Replays a whole recorded journey (CSV or Parquet) in vectorised NumPy: RSL
+# trajectory, alert intervals and KPIs in one pass instead of one live reading
+# at a time. RSL integrates the Q10 degradation of every reading over the time
+# it was held, rather than the live model's average-temperature shortcut.
+#
+# `sweep()` evaluates many product profiles (Q10, optimal temp, thresholds) over
+# many journeys: each journey is scored against all profiles at once with
+# broadcasting, and journeys are spread over a process pool.
+#
+# Usage:
+#   python replay.py run journey.csv [--q10 2.5 --alert-high 12 ...] [--model] [--out trajectory.csv]
+#   python replay.py sweep journeys/ --profiles profiles.csv [--processes 4] [--out results.csv]
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from batch_ingest import (parse_device_timestamp, classify_status, apply_alert_runs, q10_rsl,
+                          STATUS_NORMAL, BASE_SHELF_LIFE_DAYS)
+from history_store import from_epoch_us
+
+# Mirrors the live configuration in app.py
+DEFAULT_PROFILE = {
+    'optimal_temp': 8.0, 'q10': 2.0, 'base_shelf_life_days': BASE_SHELF_LIFE_DAYS,
+    'alert_high': 15.0, 'alert_low': 3.0, 'critical_temp': 12.0,
+}
+PROFILE_KEYS = tuple(DEFAULT_PROFILE)
+DEFAULT_TIMEZONE = 'Asia/Kathmandu'
+WINDOW_SIZE_READINGS = 6  # Rolling window of the joblib model's *_last_6h features
+RSL_FLOOR, RSL_CEILING = 0.1, 30.0
+COLUMN_ALIASES = {'ts': 'timestamp', 'temp': 'temperature', 'hum': 'humidity', 'device_id': 'journey_id'}
+
+
+# --- Loading ---
+def _stamps_us(values, tz):
+    """Timestamp column (epoch seconds or ISO 8601; naive = `tz`) -> int64 epoch µs."""
+    if pd.api.types.is_numeric_dtype(values):
+        return np.round(values.to_numpy(dtype=np.float64) * 1_000_000).astype(np.int64)
+    try:
+        parsed = pd.to_datetime(values, format='ISO8601')
+        parsed = parsed.dt.tz_localize(tz) if parsed.dt.tz is None else parsed
+        return (parsed.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy('datetime64[us]')
+                .astype(np.int64))
+    except (ValueError, TypeError, AttributeError):  # Mixed UTC offsets: parse one by one
+        return np.array([parse_device_timestamp(v, tz) for v in values], dtype=np.int64)
+
+
+def load_journeys(path, tz=DEFAULT_TIMEZONE):
+    """Reads a CSV/Parquet journey file into {journey_id: frame}.
+
+    Needs `timestamp` (or `ts`) and `temperature` (or `temp`) columns;
+    `humidity`/`hum` is optional. A `journey_id` (or `device_id`) column
+    splits one file into several journeys, otherwise the file name is the id.
+    Each frame has `ts_us`, `temperature`, `humidity`, sorted by time.
+    """
+    frame = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    return journeys_from_frame(frame, tz, os.path.splitext(os.path.basename(path))[0])
+
+
+def journeys_from_frame(frame, tz=DEFAULT_TIMEZONE, default_id='journey'):
+    """Splits a raw readings frame (columns as for `load_journeys`) into {journey_id: frame}."""
+    tz = pytz.timezone(tz) if isinstance(tz, str) else tz
+    frame = frame.rename(columns={k: v for k, v in COLUMN_ALIASES.items() if k in frame and v not in frame})
+    missing = {'timestamp', 'temperature'} - set(frame.columns)
+    if missing: raise ValueError(f"Missing column(s) {', '.join(sorted(missing))}")
+    frame['ts_us'] = _stamps_us(frame['timestamp'], tz)
+    if 'humidity' not in frame: frame['humidity'] = np.nan
+    frame[['temperature', 'humidity']] = frame[['temperature', 'humidity']].astype(np.float64)  # ValueError if not numeric
+    if 'journey_id' not in frame: frame['journey_id'] = default_id
+    frame = frame.sort_values(['journey_id', 'ts_us'], kind='stable')
+    return {str(jid): group[['ts_us', 'temperature', 'humidity']].reset_index(drop=True)
+            for jid, group in frame.groupby('journey_id', sort=False)}
+
+
+def load_profiles(path):
+    """Profile table (CSV) -> list of profile dicts; missing columns take DEFAULT_PROFILE values."""
+    table = pd.read_csv(path)
+    unknown = set(table.columns) - set(PROFILE_KEYS) - {'profile_id'}
+    if unknown: raise ValueError(f"{path}: unknown profile column(s) {', '.join(sorted(unknown))}")
+    if 'profile_id' not in table: table['profile_id'] = [f"p{i}" for i in range(len(table))]
+    return [{**DEFAULT_PROFILE, **{k: v for k, v in row.items() if k in PROFILE_KEYS}, 'profile_id': str(row['profile_id'])}
+            for row in table.to_dict('records')]
+
+
+# --- Single journey ---
+class _IsoStamps:
+    """Formats `ts_us[i]` on demand: the alert log only needs run boundaries, not every reading."""
+
+    def __init__(self, ts_us, tz):
+        self.ts_us, self.tz = ts_us, tz
+
+    def __getitem__(self, i):
+        return from_epoch_us(self.ts_us[i], self.tz).isoformat()
+
+
+def held_hours(ts_us):
+    """Hours each reading's temperature was held (until the next reading; 0 for the last)."""
+    ts_us = np.asarray(ts_us, dtype=np.int64)
+    return np.r_[np.diff(ts_us), 0] / 3.6e9 if len(ts_us) else np.empty(0)
+
+
+def cumulative_rsl(temps, dt_hours, profile):
+    """RSL (days) before each reading: base shelf life minus the Q10-weighted time held so far.
+
+    consumed[i] = sum over j < i of held_hours[j] / 24 * q10 ** ((temp[j] - optimal) / 10)
+    """
+    rate = profile['q10'] ** ((np.asarray(temps, dtype=np.float64) - profile['optimal_temp']) / 10.0)
+    consumed = np.r_[0.0, np.cumsum(np.asarray(dt_hours)[:-1] / 24.0 * rate[:-1])] if len(rate) else rate
+    return np.clip(profile['base_shelf_life_days'] - consumed, RSL_FLOOR, RSL_CEILING)
+
+
+def model_features(temps, hums, interval_hours=1.0, critical_temp=DEFAULT_PROFILE['critical_temp']):
+    """The joblib model's feature frame for every reading at once (as built live in receive_data)."""
+    temps = pd.Series(np.asarray(temps, dtype=np.float64))
+    rolling = temps.rolling(WINDOW_SIZE_READINGS, min_periods=1)
+    return pd.DataFrame({
+        'temperature': temps, 'humidity': np.asarray(hums, dtype=np.float64),
+        'avg_temp_last_6h': rolling.mean(), 'max_temp_last_6h': rolling.max(), 'min_temp_last_6h': rolling.min(),
+        'time_above_critical': np.cumsum(temps.to_numpy() > critical_temp) * float(interval_hours),
+        'journey_time_hours': np.arange(len(temps)) * float(interval_hours),
+    })
+
+
+def replay_journey(journey, profile=None, tz=DEFAULT_TIMEZONE, model=None):
+    """Replays one journey frame (from `load_journeys`) under `profile`.
+
+    Returns `{'trajectory': DataFrame, 'alerts': [...], 'kpis': {...}}`. The
+    trajectory has the cumulative `rsl`, the live model's `rsl_live`
+    (running-average shortcut) for comparison, `status`, and `rsl_model` when
+    a fitted model is given. Durations come from the reading timestamps.
+    """
+    profile = {**DEFAULT_PROFILE, **(profile or {})}
+    tz = pytz.timezone(tz) if isinstance(tz, str) else tz
+    ts_us = journey['ts_us'].to_numpy(dtype=np.int64)
+    temps = journey['temperature'].to_numpy(dtype=np.float64)
+    hums = journey['humidity'].to_numpy(dtype=np.float64)
+    n = len(temps)
+    dt = held_hours(ts_us)
+    elapsed = (ts_us - ts_us[0]) / 3.6e9 if n else np.empty(0)
+
+    codes = classify_status(temps, profile['alert_high'], profile['alert_low'])
+    alerts, _, _ = apply_alert_runs(codes, temps, _IsoStamps(ts_us, tz), np.arange(1, n + 1), None)
+    for alert in alerts: alert.pop('seq')
+
+    trajectory = pd.DataFrame({
+        'timestamp': pd.to_datetime(ts_us, unit='us', utc=True).tz_convert(tz), 'temperature': temps, 'humidity': hums, 'hours': elapsed,
+        'rsl': np.round(cumulative_rsl(temps, dt, profile), 2),
+        'rsl_live': np.round(q10_rsl(temps, np.cumsum(temps) / np.arange(1, n + 1), elapsed,
+                                     profile['optimal_temp'], profile['q10'], profile['base_shelf_life_days']), 2),
+        'status': np.where(codes == STATUS_NORMAL, 'NORMAL', 'ALERT'),
+    })
+    if model is not None:
+        interval = float(np.median(dt[:-1])) if n > 1 else 1.0
+        predicted = model.predict(model_features(temps, hums, interval, profile['critical_temp']))
+        trajectory['rsl_model'] = np.round(np.maximum(RSL_FLOOR, predicted), 2)
+
+    in_range = codes == STATUS_NORMAL
+    kpis = {
+        'readings': n, 'journey_time_hours': float(elapsed[-1]) if n else 0.0,
+        'avg_temp': round(float(temps.mean()), 1) if n else None,
+        'min_temp': round(float(temps.min()), 1) if n else None,
+        'max_temp': round(float(temps.max()), 1) if n else None,
+        'time_in_range_hrs': round(float(dt[in_range].sum()), 1),
+        'time_out_range_hrs': round(float(dt[~in_range].sum()), 1),
+        'time_above_critical': round(float(dt[temps > profile['critical_temp']].sum()), 1),
+        'final_rsl_days': float(trajectory['rsl'].iloc[-1]) if n else None,
+        'alerts': len(alerts),
+    }
+    return {'trajectory': trajectory, 'alerts': alerts, 'kpis': kpis}
+
+
+# --- Sweeps ---
+def score_profiles(ts_us, temps, profiles):
+    """Scores one journey against every profile at once; returns {metric: array per profile}.
+
+    Profiles are stacked into column vectors and broadcast against the
+    journey's *distinct* temperatures (readings are rounded, so a journey of
+    thousands of readings has a few hundred), each weighted by how long it was
+    held. Alert starts are counted over distinct consecutive temperature
+    pairs. Only profiles whose RSL actually hits the floor need the full
+    per-reading running integral, to find when it did.
+    """
+    temps = np.asarray(temps, dtype=np.float64)
+    dt = held_hours(ts_us)
+    p = {k: np.array([prof[k] for prof in profiles], dtype=np.float64)[:, None] for k in PROFILE_KEYS}
+    values, inv = np.unique(temps, return_inverse=True)
+    held = np.bincount(inv, weights=dt, minlength=len(values))  # Hours spent at each distinct temperature
+
+    rate = p['q10'] ** ((values - p['optimal_temp']) / 10.0)  # (profiles x distinct temps)
+    consumed = rate @ held / 24.0
+    final_rsl = np.clip(p['base_shelf_life_days'][:, 0] - consumed, RSL_FLOOR, RSL_CEILING)
+    expires_at = np.full(len(profiles), np.nan)  # Hours until RSL hits the floor (NaN = never)
+    hit = np.flatnonzero(consumed >= p['base_shelf_life_days'][:, 0] - RSL_FLOOR)
+    if hit.size:
+        running = np.cumsum(rate[hit][:, inv[:-1]] * (dt[:-1] / 24.0), axis=1)
+        expired = running >= p['base_shelf_life_days'][hit] - RSL_FLOOR
+        elapsed = np.cumsum(dt)[:-1]  # running[:, j] is reached once reading j has been held
+        expires_at[hit] = elapsed[np.argmax(expired, axis=1)]
+
+    codes = (values > p['alert_high']).astype(np.int8) + 2 * (values < p['alert_low'])
+    codes[codes == 3] = 2  # Only if alert_low > alert_high: low wins, as in classify_status
+    pairs, counts = np.unique(inv[:-1] * len(values) + inv[1:], return_counts=True)
+    prev, cur = np.divmod(pairs, len(values))
+    starts = ((codes[:, cur] != 0) & (codes[:, cur] != codes[:, prev])) @ counts
+    return {
+        'final_rsl_days': np.round(final_rsl, 2),
+        'expires_at_hours': expires_at,
+        'alerts': starts + (codes[:, inv[0]] != 0) if len(temps) else starts,
+        'time_out_range_hrs': (codes != 0) @ held,
+        'time_above_critical': (values > p['critical_temp']) @ held,
+    }
+
+
+_worker_profiles = None
+
+
+def _init_worker(profiles):
+    global _worker_profiles
+    _worker_profiles = profiles
+
+
+def _score_task(task):
+    journey_id, ts_us, temps = task
+    return journey_id, score_profiles(ts_us, temps, _worker_profiles)
+
+
+def sweep(journeys, profiles, processes=None, chunksize=8):
+    """Scores every journey against every profile; returns a long DataFrame.
+
+    `journeys` is {journey_id: frame} (see `load_journeys`), `profiles` a list
+    of profile dicts. `processes=1` runs inline (no pool).
+    """
+    profiles = [{**DEFAULT_PROFILE, **prof} for prof in profiles]
+    tasks = [(jid, j['ts_us'].to_numpy(dtype=np.int64), j['temperature'].to_numpy(dtype=np.float64))
+             for jid, j in journeys.items()]
+    if processes == 1:
+        _init_worker(profiles)
+        results = map(_score_task, tasks)
+        return _sweep_frame(results, profiles)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(profiles,)) as pool:
+        return _sweep_frame(pool.map(_score_task, tasks, chunksize=chunksize), profiles)
+
+
+def _sweep_frame(results, profiles):
+    ids = [prof.get('profile_id', f"p{i}") for i, prof in enumerate(profiles)]
+    frames = [pd.DataFrame({'journey_id': jid, 'profile_id': ids, **metrics}) for jid, metrics in results]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# --- CLI ---
+def _journey_paths(target):
+    if os.path.isdir(target):
+        return sorted(glob.glob(os.path.join(target, '*.csv')) + glob.glob(os.path.join(target, '*.parquet')))
+    return sorted(glob.glob(target)) or [target]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline journey replay / what-if RSL engine")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="Replay one journey file")
+    run.add_argument('journey')
+    for key in PROFILE_KEYS:
+        run.add_argument('--' + key.replace('_', '-'), type=float, dest=key, default=DEFAULT_PROFILE[key])
+    run.add_argument('--model', nargs='?', const=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'rsl_predictor_model.joblib'),
+                     help="Also run the joblib RSL model over every reading")
+    run.add_argument('--out', help="Write the trajectory to this CSV")
+    run.add_argument('--tz', default=DEFAULT_TIMEZONE)
+    sw = sub.add_parser('sweep', help="Score many journeys against many product profiles")
+    sw.add_argument('journeys', help="Directory, glob or file of journeys")
+    sw.add_argument('--profiles', required=True, help="CSV with columns from: " + ', '.join(PROFILE_KEYS))
+    sw.add_argument('--processes', type=int, default=None)
+    sw.add_argument('--out', help="Write results to this CSV")
+    sw.add_argument('--tz', default=DEFAULT_TIMEZONE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        model = None
+        if args.model:
+            import joblib
+            model = joblib.load(args.model)
+        profile = {k: getattr(args, k) for k in PROFILE_KEYS}
+        for i, (journey_id, journey) in enumerate(load_journeys(args.journey, args.tz).items()):
+            result = replay_journey(journey, profile, args.tz, model)
+            print(f"🚚 {journey_id}: " + ', '.join(f"{k}={v}" for k, v in result['kpis'].items()))
+            for alert in result['alerts']:
+                print(f"   ⚠️ {alert['type']} {alert['start_time']} -> {alert['end_time']} (peak {alert['peak_value']})")
+            if args.out:  # One CSV for all journeys in the file
+                result['trajectory'].assign(journey_id=journey_id).to_csv(
+                    args.out, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        return 0
+
+    journeys = {}
+    for path in _journey_paths(args.journeys): journeys.update(load_journeys(path, args.tz))
+    profiles = load_profiles(args.profiles)
+    results = sweep(journeys, profiles, args.processes)
+    print(f"✅ Scored {len(journeys)} journeys x {len(profiles)} profiles")
+    if args.out: results.to_csv(args.out, index=False); print(f"💾 Results written to {args.out}")
+    else: print(results.to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# ==============================================================================
+# rollups.py - Multi-resolution rollups of a device's readings
+# ==============================================================================
+# Readings are folded, as they arrive, into fixed time buckets at several
+# resolutions (1 min / 10 min / 1 h). A zoomed-out chart of a million-reading
+# journey then reads a few hundred precomputed buckets instead of the raw
+# history. Each bucket keeps count, sum, min and max, so merging buckets
+# (or shipping them to a chart) never hides a temperature excursion.
+import numpy as np
+
+from history_store import format_timestamps, _json_number
+
+ROLLUP_LEVELS = (('1m', 60), ('10m', 600), ('1h', 3600))  # (name, bucket width in seconds)
+
+
+class RollupLevel:
+    """Time-bucketed aggregates at one resolution, ordered by bucket start.
+
+    Columns live in growable NumPy arrays between `_start` and `_end`, so
+    appending a bucket and dropping the oldest ones are amortised O(1).
+    """
+
+    COLUMNS = {'bucket_us': np.int64, 'count': np.int64, 'temp_sum': np.float64, 'temp_min': np.float64,
+               'temp_max': np.float64, 'hum_sum': np.float64, 'rsl_last': np.float64}
+
+    def __init__(self, name, width_s, initial=64):
+        self.name = name
+        self.width_us = int(width_s) * 1_000_000
+        self._cols = {k: np.empty(initial, dtype=t) for k, t in self.COLUMNS.items()}
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def column(self, name):
+        return self._cols[name][self._start:self._end]
+
+    def _reserve(self, extra):
+        size = len(self._cols['bucket_us'])
+        n = len(self)
+        if self._end + extra <= size: return
+        if n + extra > size // 2: size = max(2 * size, n + extra)  # Grow, else just compact
+        for name, col in self._cols.items():
+            new = np.empty(size, dtype=col.dtype)
+            new[:n] = col[self._start:self._end]
+            self._cols[name] = new
+        self._start, self._end = 0, n
+
+    def add(self, ts_us, temp, hum, rsl):
+        """Folds one reading in (scalar fast path for per-reading ingest)."""
+        bucket = ts_us - ts_us % self.width_us
+        cols = self._cols
+        if self._end > self._start and cols['bucket_us'][self._end - 1] == bucket:
+            i = self._end - 1
+            cols['count'][i] += 1
+            cols['temp_sum'][i] += temp
+            if temp < cols['temp_min'][i]: cols['temp_min'][i] = temp
+            if temp > cols['temp_max'][i]: cols['temp_max'][i] = temp
+            cols['hum_sum'][i] += hum
+            cols['rsl_last'][i] = rsl
+            return
+        self.add_many(np.array([ts_us], dtype=np.int64), np.array([temp]), np.array([hum]), np.array([rsl]))
+
+    def add_many(self, ts_us, temps, hums, rsls):
+        """Folds a batch in. Out-of-order timestamps update (or insert) older buckets."""
+        ts_us = np.asarray(ts_us, dtype=np.int64)
+        if len(ts_us) == 0: return
+        buckets = ts_us - ts_us % self.width_us
+        order = np.argsort(buckets, kind='stable')  # Stable: the last reading of a bucket stays last
+        buckets, temps, hums, rsls = (np.asarray(a)[order] for a in (buckets, temps, hums, rsls))
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        new = {
+            'bucket_us': buckets[starts],
+            'count': np.diff(np.r_[starts, len(buckets)]),
+            'temp_sum': np.add.reduceat(temps, starts),
+            'temp_min': np.minimum.reduceat(temps, starts),
+            'temp_max': np.maximum.reduceat(temps, starts),
+            'hum_sum': np.add.reduceat(hums, starts),
+            'rsl_last': rsls[np.r_[starts[1:], len(buckets)] - 1],
+        }
+
+        existing = self.column('bucket_us')
+        pos = np.searchsorted(existing, new['bucket_us'])
+        hit = pos < len(existing)
+        hit[hit] = existing[pos[hit]] == new['bucket_us'][hit]
+        if hit.any():  # Merge into buckets we already have
+            i = self._start + pos[hit]
+            cols = self._cols
+            for name in ('count', 'temp_sum', 'hum_sum'): cols[name][i] += new[name][hit]
+            cols['temp_min'][i] = np.minimum(cols['temp_min'][i], new['temp_min'][hit])
+            cols['temp_max'][i] = np.maximum(cols['temp_max'][i], new['temp_max'][hit])
+            cols['rsl_last'][i] = new['rsl_last'][hit]
+        fresh = ~hit
+        if not fresh.any(): return
+        k = int(fresh.sum())
+        if len(existing) == 0 or new['bucket_us'][fresh][0] > existing[-1]:  # Common case: append
+            self._reserve(k)
+            for name, values in new.items():
+                self._cols[name][self._end:self._end + k] = values[fresh]
+            self._end += k
+        else:  # Late readings for a bucket we never had: insert in order (rare)
+            at = pos[fresh]
+            merged = {name: np.insert(self.column(name), at, values[fresh]) for name, values in new.items()}
+            self._cols = {name: values.copy() for name, values in merged.items()}
+            self._start, self._end = 0, len(merged['bucket_us'])
+
+    def trim_before(self, ts_us):
+        """Drops buckets that end at or before `ts_us` (readings evicted from history)."""
+        cut = int(np.searchsorted(self.column('bucket_us'), ts_us - self.width_us, side='right'))
+        self._start += cut
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def range(self, from_us, to_us):
+        """(lo, hi) positions of the buckets overlapping [from_us, to_us]."""
+        buckets = self.column('bucket_us')
+        lo = int(np.searchsorted(buckets, from_us - self.width_us, side='right'))
+        hi = int(np.searchsorted(buckets, to_us, side='right'))
+        return lo, max(lo, hi)
+
+    def merged(self, lo, hi, n_out):
+        """Buckets [lo, hi) combined into at most `n_out` wider buckets.
+
+        Returns columns: bucket_us, count, temp_mean, temp_min, temp_max, hum_mean, rsl_last.
+        """
+        m = hi - lo
+        if m == 0: return {name: np.empty(0) for name in
+                           ('bucket_us', 'count', 'temp_mean', 'temp_min', 'temp_max', 'hum_mean', 'rsl_last')}
+        group = max(1, -(-m // max(1, n_out)))  # ceil(m / n_out) buckets per output point
+        starts = np.arange(0, m, group)
+        ends = np.r_[starts[1:], m]
+        col = lambda name: self.column(name)[lo:hi]
+        count = np.add.reduceat(col('count'), starts)
+        return {
+            'bucket_us': col('bucket_us')[starts],
+            'count': count,
+            'temp_mean': np.add.reduceat(col('temp_sum'), starts) / count,
+            'temp_min': np.minimum.reduceat(col('temp_min'), starts),
+            'temp_max': np.maximum.reduceat(col('temp_max'), starts),
+            'hum_mean': np.add.reduceat(col('hum_sum'), starts) / count,
+            'rsl_last': col('rsl_last')[ends - 1],
+        }
+
+
+class RollupPyramid:
+    """The 1 min / 10 min / 1 h rollups of one device, finest level first."""
+
+    def __init__(self, levels=ROLLUP_LEVELS):
+        self.levels = [RollupLevel(name, width) for name, width in levels]
+
+    def add(self, ts_us, temp, hum, rsl=None):
+        rsl = np.nan if rsl is None else rsl
+        for level in self.levels: level.add(int(ts_us), float(temp), float(hum), float(rsl))
+
+    def add_many(self, ts_us, temps, hums, rsls):
+        ts_us = np.asarray(ts_us, dtype=np.int64)
+        temps = np.asarray(temps, dtype=np.float64)
+        hums = np.asarray(hums, dtype=np.float64)
+        rsls = np.asarray(rsls, dtype=np.float64)
+        for level in self.levels: level.add_many(ts_us, temps, hums, rsls)
+
+    def trim_before(self, ts_us):
+        for level in self.levels: level.trim_before(ts_us)
+
+    def clear(self):
+        for level in self.levels: level.clear()
+
+    def level(self, name):
+        return next(level for level in self.levels if level.name == name)
+
+
+def to_json(merged, tz):
+    """JSON array for `RollupLevel.merged()` output, one object per bucket.
+
+    Same keys as a history reading where they apply (temperature/humidity are
+    the bucket means), plus the bucket's `temp_min`, `temp_max` and `count`.
+    """
+    stamps = format_timestamps(merged['bucket_us'], tz)
+    rows = [
+        f'{{"count":{c},"humidity":{_json_number(hu)},"rsl":{_json_number(r)},"temp_max":{_json_number(hi)},'
+        f'"temp_min":{_json_number(lo)},"temperature":{_json_number(t)},"timestamp":"{ts}"}}'
+        for ts, c, t, lo, hi, hu, r in zip(stamps, merged['count'].tolist(), merged['temp_mean'].tolist(),
+                                           merged['temp_min'].tolist(), merged['temp_max'].tolist(),
+                                           merged['hum_mean'].tolist(), merged['rsl_last'].tolist())
+    ]
+    return '[' + ','.join(rows) + ']'
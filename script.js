@@ -7,6 +7,7 @@
 class ColdChainApp {
     constructor() {
         this.API_BASE = 'https://my-coldchain-backend.onrender.com/api';
+        this.DEVICE_ID = 'default'; // Backend partition shown by this dashboard
         this.currentPage = 'dashboard';
         this.data = {
             latest: {},
@@ -14,7 +15,12 @@ class ColdChainApp {
             alerts: []
         };
         this.charts = {};
+        this.cursors = { history: 0, alerts: 0 }; // Last seen reading/alert seq for delta polling
+        this.etags = {}; // Last ETag per endpoint for conditional GETs
+        this.bootId = null; // Backend instance the cursors belong to
         this.pollingInterval = null;
+        this.eventSource = null; // Live SSE push; polling is only the fallback
+        this.historyWindow = null; // Readings the backend retains (from X-History-* headers)
         this.connectionStatus = 'disconnected';
         this.updateQueue = [];
         this.isUpdating = false;
@@ -240,27 +246,29 @@ class ColdChainApp {
     }
     
     // Update chart based on time range
-    updateChartTimeRange(range) {
-        let dataPoints = 20; // default
-        switch(range) {
-            case '1h':
-                dataPoints = 12; // 5-minute intervals
-                break;
-            case '6h':
-                dataPoints = 36;
-                break;
-            case '24h':
-                dataPoints = 48;
-                break;
-        }
-        
-        if (this.charts.realtime && this.data.history.length > 0) {
-            const recentData = this.data.history.slice(-dataPoints);
-            this.charts.realtime.data.labels = recentData.map(item => 
+    async updateChartTimeRange(range) {
+        const rangeHours = { '1h': 1, '6h': 6, '24h': 24 }[range] || 1;
+        if (!this.charts.realtime || this.data.history.length === 0) return;
+
+        // Ask the server for a downsampled series of the window (min/max buckets keep excursions)
+        const lastTimestamp = new Date(this.data.history[this.data.history.length - 1].timestamp);
+        const from = lastTimestamp.getTime() / 1000 - rangeHours * 3600;
+        const points = Math.min(1000, Math.max(50, this.charts.realtime.width || 300));
+        try {
+            const response = await fetch(`${this.API_BASE}/history?points=${points}&from=${from}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            // Rollup buckets carry their envelope: plot min and max so excursions stay visible
+            const series = (await response.json()).flatMap(item => item.temp_max === undefined ? [item] : [
+                { timestamp: item.timestamp, temperature: item.temp_min },
+                { timestamp: item.timestamp, temperature: item.temp_max }
+            ]);
+            this.charts.realtime.data.labels = series.map(item =>
                 new Date(item.timestamp).toLocaleTimeString()
             );
-            this.charts.realtime.data.datasets[0].data = recentData.map(item => item.temperature);
+            this.charts.realtime.data.datasets[0].data = series.map(item => item.temperature);
             this.charts.realtime.update('none'); // Update without animation for better performance
+        } catch (error) {
+            console.error('Error fetching chart series:', error);
         }
     }
     
@@ -330,10 +338,31 @@ class ColdChainApp {
         }
     }
 
+    // Conditional GET: sends the last ETag for this endpoint, returns null on 304 (unchanged)
+    async conditionalFetch(key, url) {
+        const headers = this.etags[key] ? { 'If-None-Match': this.etags[key] } : {};
+        const response = await fetch(url, { headers });
+        if (response.status === 304 || !response.ok) return null;
+        const bootId = response.headers.get('X-Boot-Id');
+        if (bootId && this.bootId && bootId !== this.bootId) {
+            // Backend restarted: its sequence numbers started over, so drop cursors and merged data
+            this.bootId = bootId;
+            this.cursors = { history: 0, alerts: 0 };
+            this.etags = {};
+            this.data.history = [];
+            this.data.alerts = [];
+            return this.conditionalFetch(key, url.replace(/since=\d+/, 'since=0'));
+        }
+        this.bootId = bootId;
+        const etag = response.headers.get('ETag');
+        if (etag) this.etags[key] = etag;
+        return response;
+    }
+
     async fetchStatus() {
         try {
-            const response = await fetch(`${this.API_BASE}/status`);
-            if (response.ok) {
+            const response = await this.conditionalFetch('status', `${this.API_BASE}/status`);
+            if (response) {
                 this.data.latest = await response.json();
                 this.updateDashboard();
             }
@@ -344,9 +373,18 @@ class ColdChainApp {
 
     async fetchHistory() {
         try {
-            const response = await fetch(`${this.API_BASE}/history`);
-            if (response.ok) {
-                this.data.history = await response.json();
+            const response = await this.conditionalFetch('history', `${this.API_BASE}/history?since=${this.cursors.history}`);
+            if (!response) return;
+            // Only readings newer than our cursor (re-filtered: a stream event may have advanced it meanwhile)
+            const rows = (await response.json()).filter(reading => reading.seq > this.cursors.history);
+            const merged = this.data.history.concat(rows);
+            // Drop readings the server has already evicted from its window
+            const firstSeq = parseInt(response.headers.get('X-History-First-Seq'), 10);
+            const lastSeq = parseInt(response.headers.get('X-History-Last-Seq'), 10);
+            this.data.history = Number.isNaN(firstSeq) ? merged : merged.filter(reading => reading.seq >= firstSeq);
+            if (!Number.isNaN(firstSeq) && !Number.isNaN(lastSeq)) this.historyWindow = lastSeq - firstSeq + 1;
+            if (rows.length > 0) {
+                this.cursors.history = rows[rows.length - 1].seq;
                 this.updateCharts();
             }
         } catch (error) {
@@ -356,24 +394,105 @@ class ColdChainApp {
 
     async fetchAlerts() {
         try {
-            const response = await fetch(`${this.API_BASE}/alerts`);
-            if (response.ok) {
-                this.data.alerts = await response.json();
-                this.updateAlertsDisplay();
-            }
+            const response = await this.conditionalFetch('alerts', `${this.API_BASE}/alerts?since=${this.cursors.alerts}`);
+            if (!response) return;
+            const changed = await response.json();
+            const lastSeq = parseInt(response.headers.get('X-Alerts-Last-Seq'), 10);
+            this.mergeAlerts(changed);
+            if (!Number.isNaN(lastSeq)) this.cursors.alerts = Math.max(this.cursors.alerts, lastSeq);
         } catch (error) {
             console.error('Error fetching alerts:', error);
         }
     }
 
-    // Start data polling
+    // Merge new or updated (peak/end time) alerts by id, newest first
+    mergeAlerts(changed) {
+        const byId = new Map(this.data.alerts.map(alert => [alert.id, alert]));
+        changed.forEach(alert => byId.set(alert.id, alert));
+        this.data.alerts = Array.from(byId.values()).sort((a, b) => b.start_time.localeCompare(a.start_time));
+        this.updateAlertsDisplay();
+    }
+
+    // Start live updates: SSE push stream, with interval polling only as a fallback
     startDataPolling() {
-        this.fetchAllData();
+        this.fetchAllData(); // Initial snapshot, and catch-up after the tab was hidden
+        if (window.EventSource) {
+            this.openEventStream();
+        } else {
+            this.startPollingFallback();
+        }
+    }
+
+    startPollingFallback() {
+        if (this.pollingInterval) return;
         this.pollingInterval = setInterval(() => {
             this.fetchAllData();
         }, 5000); // Poll every 5 seconds
     }
 
+    stopPollingFallback() {
+        if (this.pollingInterval) {
+            clearInterval(this.pollingInterval);
+            this.pollingInterval = null;
+        }
+    }
+
+    openEventStream() {
+        if (this.eventSource) return;
+        const source = new EventSource(`${this.API_BASE}/stream?device=${encodeURIComponent(this.DEVICE_ID)}`);
+        source.onopen = () => {
+            this.stopPollingFallback();
+            this.updateConnectionStatus('connected');
+        };
+        // EventSource keeps reconnecting on its own; poll meanwhile, onopen stops it again
+        source.onerror = () => {
+            this.updateConnectionStatus('disconnected');
+            this.startPollingFallback();
+        };
+        source.addEventListener('reading', (e) => this.handleReadingEvent(JSON.parse(e.data)));
+        source.addEventListener('batch', (e) => {
+            this.data.latest = JSON.parse(e.data).latest;
+            this.updateDashboard();
+            this.fetchHistory(); // Many readings at once: pull the delta over REST
+        });
+        source.addEventListener('alert', (e) => {
+            const alert = JSON.parse(e.data).alert;
+            this.mergeAlerts([alert]);
+            this.cursors.alerts = Math.max(this.cursors.alerts, alert.seq);
+        });
+        source.addEventListener('resync', () => this.fetchAllData()); // We fell behind the server's event buffer
+        this.eventSource = source;
+    }
+
+    closeEventStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+
+    stopLiveUpdates() {
+        this.closeEventStream();
+        this.stopPollingFallback();
+    }
+
+    handleReadingEvent(message) {
+        const startTime = performance.now();
+        this.data.latest = message.latest;
+        this.updateDashboard();
+        if (message.reading.seq !== this.cursors.history + 1) {
+            this.fetchHistory(); // Missed readings (or a restart): let the cursor logic catch up
+            return;
+        }
+        this.data.history.push(message.reading);
+        if (this.historyWindow && this.data.history.length > this.historyWindow) {
+            this.data.history.splice(0, this.data.history.length - this.historyWindow);
+        }
+        this.cursors.history = message.reading.seq;
+        this.updateCharts();
+        this.updatePerformanceMetrics(performance.now() - startTime);
+    }
+
     // Update connection status
     updateConnectionStatus(status) {
         this.connectionStatus = status;
@@ -634,6 +753,21 @@ class ColdChainApp {
         this.updateElement('currentPosition', 'Kathmandu, Nepal');
     }
 
+    // Draw the route as a polyline (server-simplified, so multi-day journeys stay light)
+    async loadTrack() {
+        if (!this.map) return;
+        try {
+            const response = await this.conditionalFetch('track',
+                `${this.API_BASE}/track?device=${encodeURIComponent(this.DEVICE_ID)}&tolerance=10`);
+            if (!response) return; // Unchanged
+            const latLngs = (await response.json()).points.map(point => [point.lat, point.lng]);
+            if (this.routeLine) this.routeLine.setLatLngs(latLngs);
+            else this.routeLine = L.polyline(latLngs, { color: '#2563eb', weight: 3 }).addTo(this.map);
+        } catch (error) {
+            console.error('Error fetching GPS track:', error);
+        }
+    }
+
     // Update alerts display
     updateAlertsDisplay() {
         // Update alert counts
@@ -1177,6 +1311,7 @@ class ColdChainApp {
         if (this.map && this.marker) {
             this.marker.setLatLng([data.lat, data.lng]);
             this.map.setView([data.lat, data.lng], 13);
+            this.debounce(this.loadTrack, 2000, 'track')();
         }
         
         // Update location details
@@ -1367,9 +1502,7 @@ class ColdChainApp {
 
     // Cleanup
     destroy() {
-        if (this.pollingInterval) {
-            clearInterval(this.pollingInterval);
-        }
+        this.stopLiveUpdates();
         
         Object.values(this.charts).forEach(chart => {
             if (chart) chart.destroy();
@@ -1389,13 +1522,11 @@ window.addEventListener('beforeunload', () => {
     }
 });
 
-// Handle visibility change (pause polling when tab not visible)
+// Handle visibility change (pause live updates when tab not visible)
 document.addEventListener('visibilitychange', () => {
     if (window.coldChainApp) {
         if (document.hidden) {
-            if (window.coldChainApp.pollingInterval) {
-                clearInterval(window.coldChainApp.pollingInterval);
-            }
+            window.coldChainApp.stopLiveUpdates();
         } else {
             window.coldChainApp.startDataPolling();
         }
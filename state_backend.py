@@ -0,0 +1,141 @@
+# ==============================================================================
+# state_backend.py - Device state shared between worker processes
+# ==============================================================================
+# Under `gunicorn -w N` every worker has its own DeviceRegistry, so readings
+# (and the alerts they raise) used to be split across workers. A shared
+# backend holds the one ordered reading log per device that all workers
+# agree on: a worker claims the next seqs for its readings in one atomic
+# step - receiving any readings other workers appended first - and replays
+# what it has not seen before answering reads. Ingest is deterministic in
+# reading order (alert transitions included), so every worker ends up with
+# the same history, alert log and latest_data.
+#
+# LocalBackend keeps the single-process behaviour: nothing to coordinate.
+# SQLiteBackend shares a SQLite WAL file; put it on /dev/shm for a
+# shared-memory log (the durable store then lives there too).
+import sqlite3
+import threading
+import uuid
+
+from persistence import SCHEMA, read_tail, reading_rows
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_heads (
+    device_id TEXT PRIMARY KEY, seq INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL
+);
+"""
+
+
+class LocalBackend:
+    """Single process (the default): this process's registry is the only copy of the state."""
+
+    shared = False
+    id = None
+
+    def append(self, device_id, after_seq, build):
+        """Logs readings for a device whose newest known reading is `after_seq`.
+
+        `build(tail)` gets the readings other workers appended after
+        `after_seq` (None here) and returns the columns to log:
+        `(stamps_us, temps, hums, lats, lngs)`. Returns `(tail, columns)`.
+        """
+        return None, build(None)
+
+    def tail(self, device_id, after_seq):
+        """Readings appended after `after_seq` (None if there are none)."""
+        return None
+
+    def heads(self):
+        """device_id -> newest logged seq, for every device in the log."""
+        return {}
+
+    def put_setting(self, name, value):
+        pass
+
+    def setting(self, name):
+        """(version, value) of a shared setting; (0, None) if never set."""
+        return 0, None
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(LocalBackend):
+    """Reading log in a SQLite WAL file shared by every worker process on the host.
+
+    Appends take SQLite's write lock (BEGIN IMMEDIATE) just long enough to
+    read the device's head seq, fetch any readings this worker has not seen
+    and insert the new rows - the ingest work itself runs outside it, in
+    parallel across workers. Reads only ever see committed appends.
+    """
+
+    shared = True
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()  # One connection per thread
+        conn = self._conn()
+        conn.executescript(SCHEMA + SHARED_SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:  # Devices logged before the file was shared (single-process durable store)
+            conn.execute("INSERT INTO device_heads SELECT device_id, MAX(seq) FROM readings WHERE true GROUP BY device_id "
+                         "ON CONFLICT (device_id) DO UPDATE SET seq = MAX(seq, excluded.seq)")
+            conn.execute("INSERT OR IGNORE INTO settings VALUES ('store_id', 1, ?)", (uuid.uuid4().hex[:8],))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.id = self.setting('store_id')[1]  # Shared ETag prefix: identical state -> identical tags on every worker
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, device_id, after_seq, build):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT seq FROM device_heads WHERE device_id = ?", (device_id,)).fetchone()
+            head = row[0] if row else 0
+            if head < after_seq: raise RuntimeError(f"{device_id}: local seq {after_seq} is ahead of the shared log ({head})")
+            tail = read_tail(conn, device_id, after_seq) if head > after_seq else None
+            columns = build(tail)
+            stamps_us, temps, hums, lats, lngs = columns
+            conn.executemany("INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             reading_rows(device_id, head + 1, stamps_us, temps, hums, lats, lngs))
+            conn.execute("INSERT INTO device_heads VALUES (?, ?) ON CONFLICT (device_id) DO UPDATE SET seq = excluded.seq",
+                         (device_id, head + len(temps)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return tail, columns
+
+    def tail(self, device_id, after_seq):
+        tail = read_tail(self._conn(), device_id, after_seq)
+        return tail if len(tail[0]) else None
+
+    def heads(self):
+        return dict(self._conn().execute("SELECT device_id, seq FROM device_heads").fetchall())
+
+    def put_setting(self, name, value):
+        self._conn().execute("INSERT INTO settings VALUES (?, 1, ?) ON CONFLICT (name) DO UPDATE "
+                             "SET version = version + 1, value = excluded.value", (name, value))
+
+    def setting(self, name):
+        row = self._conn().execute("SELECT version, value FROM settings WHERE name = ?", (name,)).fetchone()
+        return tuple(row) if row else (0, None)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None: conn.close()
+        self._local.conn = None
@@ -0,0 +1,124 @@
+# ==============================================================================
+# wire_format.py - Compact sensor payloads and compressed responses
+# ==============================================================================
+# Constrained sensors can post readings as a packed binary frame instead of
+# JSON text (Content-Type: application/vnd.coldchain.frame):
+#
+#   header  b'CC' | version u8 (=1) | id_len u8 | device id (id_len ASCII bytes, 0 = default device)
+#   record  ts u32 | temp i16 | hum u16 | lat i32 | lng i32          (16 bytes, little-endian)
+#
+# ts is epoch seconds (0 = stamp on arrival); temp/hum are hundredths of
+# °C / %RH and lat/lng are 1e-7 degrees (INT32_MIN = not sent, carried
+# forward). Fixed-point keeps a record at 16 bytes and decodes to exactly the
+# doubles the same values would parse to from JSON (1.1 °C arrives as 110 and
+# becomes 110 / 100 == 1.1), which packed float32s would not. A frame with N
+# records decodes with one np.frombuffer - no per-reading objects.
+#
+# MessagePack bodies (application/msgpack, optional `msgpack` package) carry
+# the same objects as the JSON API. Responses can be gzip- or (with the
+# optional `brotli` package) brotli-compressed per Accept-Encoding.
+import gzip
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for application/msgpack bodies
+    msgpack = None
+try:
+    import brotli
+except ImportError:  # Optional: gzip is always available
+    brotli = None
+
+FRAME_CONTENT_TYPE = 'application/vnd.coldchain.frame'
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+FRAME_MAGIC = b'CC'
+FRAME_VERSION = 1
+RECORD_DTYPE = np.dtype([('ts', '<u4'), ('temp', '<i2'), ('hum', '<u2'), ('lat', '<i4'), ('lng', '<i4')])
+COORD_MISSING = np.iinfo(np.int32).min
+COORD_SCALE = 10_000_000
+_HEADER = struct.Struct('<2sBB')
+MIN_COMPRESS_BYTES = 1024  # Smaller bodies aren't worth the CPU
+
+
+class FrameError(ValueError):
+    """Malformed binary frame."""
+
+
+def decode_frame(body):
+    """Binary frame -> (device_id or None, record array). Raises FrameError."""
+    if len(body) < _HEADER.size: raise FrameError("Frame too short")
+    magic, version, id_len = _HEADER.unpack_from(body)
+    if magic != FRAME_MAGIC: raise FrameError("Not a coldchain frame")
+    if version != FRAME_VERSION: raise FrameError(f"Unsupported frame version {version}")
+    start = _HEADER.size + id_len
+    if len(body) < start or (len(body) - start) % RECORD_DTYPE.itemsize:
+        raise FrameError(f"Frame body is not a whole number of {RECORD_DTYPE.itemsize}-byte records")
+    try: device_id = body[_HEADER.size:start].decode('ascii') if id_len else None
+    except UnicodeDecodeError: raise FrameError("Device id must be ASCII") from None
+    return device_id, np.frombuffer(body, dtype=RECORD_DTYPE, offset=start)
+
+
+def frame_columns(records, arrival_us):
+    """Record array -> (temps, hums, stamps_us, lats, lngs) float64/int64 columns; NaN lat/lng = not sent."""
+    temps = records['temp'] / 100.0
+    hums = records['hum'] / 100.0
+    ts = records['ts'].astype(np.int64)
+    stamps_us = np.where(ts == 0, arrival_us, ts * 1_000_000)
+    lats, lngs = (np.where(records[k] == COORD_MISSING, np.nan, records[k] / COORD_SCALE) for k in ('lat', 'lng'))
+    return temps, hums, stamps_us, lats, lngs
+
+
+def frame_reading(records, index=0):
+    """One record as the JSON API's reading object (keys absent where the frame left them out)."""
+    r = records[index]
+    reading = {'temp': int(r['temp']) / 100.0, 'hum': int(r['hum']) / 100.0}
+    if r['ts']: reading['ts'] = int(r['ts'])
+    for key in ('lat', 'lng'):
+        if r[key] != COORD_MISSING: reading[key] = int(r[key]) / COORD_SCALE
+    return reading
+
+
+def encode_frame(device_id, temps, hums, ts=None, lats=None, lngs=None):
+    """Packs readings into a binary frame (what a sensor or gateway sends). NaN/None lat/lng = not sent."""
+    n = len(temps)
+    records = np.zeros(n, dtype=RECORD_DTYPE)
+    records['temp'] = np.round(np.asarray(temps, dtype=np.float64) * 100)
+    records['hum'] = np.round(np.asarray(hums, dtype=np.float64) * 100)
+    if ts is not None: records['ts'] = np.asarray(ts)
+    for key, values in (('lat', lats), ('lng', lngs)):
+        values = np.full(n, np.nan) if values is None else np.asarray(values, dtype=np.float64)
+        records[key] = np.where(np.isnan(values), COORD_MISSING, np.round(np.nan_to_num(values) * COORD_SCALE))
+    device = (device_id or '').encode('ascii')
+    return _HEADER.pack(FRAME_MAGIC, FRAME_VERSION, len(device)) + device + records.tobytes()
+
+
+def decode_msgpack(body):
+    """MessagePack body -> Python object; raises ValueError if malformed, RuntimeError if msgpack is missing."""
+    if msgpack is None: raise RuntimeError("msgpack is not installed")
+    try: return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    except Exception as e: raise ValueError(f"Invalid MessagePack: {e}") from None
+
+
+# --- Response compression ---
+def negotiate_encoding(accept_encoding):
+    """Best content coding we can produce for an Accept-Encoding header: 'br', 'gzip' or None."""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try: q = float(params.strip()[2:])
+            except ValueError: q = 0.0
+        if name: offered[name.strip().lower()] = q
+    if brotli is not None and offered.get('br', 0) > 0: return 'br'
+    if offered.get('gzip', 0) > 0: return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    """`body` (bytes) in the given content coding. Fast settings: these are per-request, not archival."""
+    if encoding == 'br': return brotli.compress(body, quality=4)
+    if encoding == 'gzip': return gzip.compress(body, compresslevel=5)
+    return body